@@ -0,0 +1,217 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .data import CarryData
+from .rolling import rolling_median
+
+PORTFOLIOS = ["p_hml", "p_high", "p_low"]
+
+
+def shift(x, periods: int, out=None) -> np.ndarray:
+    """`pd.DataFrame(x).shift(periods)` of a 2D array."""
+    if out is None:
+        out = np.empty_like(x)
+
+    n = len(x)
+    out.fill(np.nan)
+    if periods >= 0:
+        out[periods:] = x[:n - periods]
+    else:
+        out[:n + periods] = x[-periods:]
+
+    return out
+
+
+def rolling_sum(x, window: int) -> np.ndarray:
+    """`pd.DataFrame(x).rolling(window).sum()` of a 2D array: nan unless
+    all `window` values are there."""
+    if window == 1:
+        return x.copy()
+
+    res = np.full_like(x, np.nan)
+    if len(x) >= window:
+        res[window - 1:] = sliding_window_view(x, window, axis=0)\
+            .sum(axis=-1)
+
+    return res
+
+
+def rank_sort(signal, legsize: int) -> (np.ndarray, np.ndarray):
+    """Assign assets to the low and high portfolios by their signal.
+
+    In each row, the `legsize` assets with the lowest signal make up the
+    low portfolio, those with the highest the high one; ties are broken
+    by the order of columns. Rows with fewer than `2 * legsize` signals
+    have no positions.
+
+    Parameters
+    ----------
+    signal : numpy.ndarray
+        (time, asset)
+    legsize : int
+
+    Returns
+    -------
+    tuple
+        (time, asset) arrays of 0.0 and 1.0: the low and the high
+        portfolio
+    """
+    valid = ~np.isnan(signal)
+    n_valid = valid.sum(axis=1, keepdims=True)
+
+    order = np.argsort(np.where(valid, signal, np.inf), axis=1,
+                       kind="stable")
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order,
+                      np.arange(signal.shape[1])[None, :], axis=1)
+
+    enough = valid & (n_valid >= 2 * legsize)
+    p_low = (enough & (rank < legsize)).astype(float)
+    p_high = (enough & (rank >= n_valid - legsize)).astype(float)
+
+    return p_low, p_high
+
+
+class CarryBacktest:
+    """Carry strategy of the walkthrough on arrays.
+
+    Assets are sorted into portfolios on the rolling median of their carry
+    (the negative of the relative funding rate), lagged by one period;
+    the high portfolio is long, the low one short perpetual contracts,
+    and returns are those of the coin-margined positions with their
+    funding, as in section 'return calculation' of the walkthrough.
+
+    Buffers are allocated once; signals are cached by lookback, so that
+    repeated runs on the same data only redo the sorting and the returns.
+
+    Parameters
+    ----------
+    data : CarryData
+    """
+    def __init__(self, data: CarryData):
+        self.data = data
+        n, k = data.shape
+
+        self._signals = dict()
+
+        # own-row positions of each input
+        self._rows = {k_: np.flatnonzero(r_) for k_, r_ in data.rows.items()}
+
+        # inputs on their own rows
+        rows_s = self._rows["spot"]
+        self._spot = data.spot[rows_s]
+        self._inv_perp = 1 / data.perp[rows_s]
+        self._f_abs = data.f_abs[self._rows["funding_abs"]]
+
+        # preallocated buffers
+        self._buf_s = np.empty_like(self._spot)
+        self._spot_fwd = np.empty((n, k))
+        self._spot_ret = np.empty((n, k))
+        self._dp = np.empty((n, k))
+        self._fund = np.empty((n, k))
+        self._r = np.empty((n, k))
+        self._w = np.empty((n, k))
+        self._res = np.empty((n, 3))
+
+    def signal(self, lookback: int) -> np.ndarray:
+        """Rolling median carry over `lookback` periods, lagged by one.
+
+        Computed over the rows of the relative funding rate and put on
+        the grid; cached.
+        """
+        if lookback not in self._signals:
+            rows = self._rows["funding_rel"]
+            carry = -self.data.f_rel[rows]
+
+            sig = shift(rolling_median(carry, lookback, lookback // 2), 1)
+
+            res = np.full(self.data.shape, np.nan)
+            res[rows] = sig
+            self._signals[lookback] = res
+
+        return self._signals[lookback]
+
+    def run(self, legsize: int = 2, signal_lookback: int = 42,
+            t_hold: int = 1, n_long: int = 1, n_short: int = 3) \
+            -> (np.ndarray, np.ndarray):
+        """Run the backtest.
+
+        Parameters
+        ----------
+        legsize : int
+            number of assets in each of the long and short legs
+        signal_lookback : int
+            number of periods of the rolling median carry
+        t_hold : int
+            holding period, in periods
+        n_long, n_short : int
+            number of long and short contracts per unit of collateral
+
+        Returns
+        -------
+        tuple
+            (m, 3) returns of the 'p_hml', 'p_high' and 'p_low'
+            portfolios, and the positions on the grid of the m periods with
+            returns on both legs
+        """
+        data = self.data
+        rows_s = self._rows["spot"]
+        rows_f = self._rows["funding_abs"]
+
+        # spot and perp: forward values and returns, on spot rows
+        spot_fwd_s = shift(self._spot, -t_hold, out=self._buf_s)
+        self._spot_fwd.fill(np.nan)
+        self._spot_fwd[rows_s] = spot_fwd_s
+
+        self._spot_ret.fill(np.nan)
+        self._spot_ret[rows_s] = spot_fwd_s / self._spot
+
+        inv_perp_fwd_s = shift(self._inv_perp, -t_hold)
+        self._dp.fill(np.nan)
+        self._dp[rows_s] = self._inv_perp - inv_perp_fwd_s
+
+        # funding over the holding period, on funding rows
+        fund = shift(rolling_sum(shift(self._f_abs, 1) * 4, t_hold),
+                     -t_hold + 1)
+        self._fund.fill(np.nan)
+        self._fund[rows_f] = fund
+
+        weights = rank_sort(self.signal(signal_lookback), legsize)
+        rows_c = data.rows["funding_rel"]
+        cols_c = data.cols["funding_rel"]
+
+        for n_, (sign_, w_, n_contracts) in enumerate(
+                [(1, weights[1], n_long), (-1, weights[0], n_short)]):
+            # r = n * S' * +-(1/F - 1/F' - f) + S'/S - 1
+            r = self._r
+            np.subtract(self._dp, self._fund, out=r)
+            if sign_ < 0:
+                np.negative(r, out=r)
+            np.multiply(n_contracts * self._spot_fwd, r, out=r)
+            r += self._spot_ret
+            r -= 1
+
+            # weights of 1/legsize, missing off carry rows and columns
+            w = self._w
+            w.fill(np.nan)
+            w[np.ix_(rows_c, cols_c)] = \
+                w_[np.ix_(rows_c, cols_c)] / legsize
+            np.multiply(r, w, out=r)
+
+            valid = ~np.isnan(r)
+            self._res[:, n_ + 1] = np.where(valid, r, 0.0).sum(axis=1)
+            self._res[~valid.any(axis=1), n_ + 1] = np.nan
+
+        self._res[:, 0] = self._res[:, 1] + self._res[:, 2]
+
+        keep = np.flatnonzero(~np.isnan(self._res[:, 0]))
+
+        return self._res[keep], keep
+
+    def run_frame(self, **kwargs) -> pd.DataFrame:
+        """Same as `run`, as a DataFrame indexed by time."""
+        res, keep = self.run(**kwargs)
+
+        return pd.DataFrame(res, index=self.data.index[keep],
+                            columns=pd.Index(PORTFOLIOS, name="portfolio"))
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+
+class CarryData:
+    """Spot, perpetual and funding data on one time grid, as arrays.
+
+    The grid is the union of the timestamps of the inputs, the columns the
+    union of their assets. Each input keeps a mask of the grid rows it has
+    and of the columns it has, so that shifts and rolling windows can be
+    taken over its own rows, as pandas would do before aligning frames.
+
+    Parameters
+    ----------
+    spot : pandas.DataFrame
+        spot prices, time x asset
+    perp : pandas.DataFrame
+        perpetual prices, time x asset; reindexed like `spot`
+    funding : pandas.DataFrame
+        long format, as from `kraken.downstream.get_funding_rates`
+
+    Attributes
+    ----------
+    index : pandas.DatetimeIndex
+    assets : pandas.Index
+    spot, perp, f_abs, f_rel : numpy.ndarray
+        (time, asset), nan where missing
+    rows : dict
+        'spot', 'funding_abs', 'funding_rel' -> boolean mask of grid rows
+    cols : dict
+        the same -> boolean mask of columns
+    """
+    def __init__(self, spot, perp, funding):
+        perp = perp.reindex_like(spot)
+
+        funding = {
+            w_: funding.loc[funding["which"] == w_]
+            .drop("which", axis=1)
+            .pivot(index="timestamp", columns="asset", values="rate")
+            for w_ in ["absolute", "relative"]
+        }
+
+        frames = {"spot": spot, "funding_abs": funding["absolute"],
+                  "funding_rel": funding["relative"]}
+
+        index = spot.index
+        assets = spot.columns
+        for df_ in frames.values():
+            index = index.union(df_.index)
+            assets = assets.union(df_.columns)
+
+        self.index = index
+        self.assets = assets
+
+        self.rows = {k_: index.isin(df_.index) for k_, df_ in frames.items()}
+        self.cols = {k_: assets.isin(df_.columns)
+                     for k_, df_ in frames.items()}
+
+        def to_grid(df_) -> np.ndarray:
+            return np.ascontiguousarray(
+                df_.reindex(index=index, columns=assets).values,
+                dtype=np.float64
+            )
+
+        self.spot = to_grid(spot)
+        self.perp = to_grid(perp)
+        self.f_abs = to_grid(funding["absolute"])
+        self.f_rel = to_grid(funding["relative"])
+
+    @property
+    def shape(self) -> tuple:
+        return self.spot.shape
+
+    @classmethod
+    def from_arrays(cls, index, assets, spot, perp, f_abs, f_rel, rows,
+                    cols) -> "CarryData":
+        """Wrap arrays already on a grid, e.g. views of shared memory."""
+        res = cls.__new__(cls)
+        res.index, res.assets = index, assets
+        res.spot, res.perp, res.f_abs, res.f_rel = spot, perp, f_abs, f_rel
+        res.rows, res.cols = rows, cols
+
+        return res
+
+
+def load_carry_data(start: str = "2018-08", freq: str = "4H") -> CarryData:
+    """Load Kraken data the way the walkthrough does.
+
+    Spot and perpetual mid prices are sampled at the end of each `freq`
+    period, from `start` on.
+    """
+    from ..datafeed_.kraken.downstream import (get_spot, get_perpetual,
+                                               get_funding_rates)
+
+    spot = get_spot()\
+        .resample(freq, closed="right", label="right").last()\
+        .loc[start:]
+    perp = get_perpetual(mid=True)\
+        .resample(freq, closed="right", label="right").last()\
+        .reindex_like(spot)
+
+    return CarryData(spot, perp, get_funding_rates())
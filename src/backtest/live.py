@@ -0,0 +1,203 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .carry import rank_sort
+from .rolling import RollingQuantile
+from ..datafeed_.utilities import pivot
+
+
+class LiveCarry:
+    """Carry strategy of `CarryBacktest`, run on data as it comes.
+
+    Funding prints are fed to a `RollingQuantile` of the carry as they
+    are appended, spot bars only to keep the latest prices; neither the
+    history nor the signal over it is recomputed. The signal of a funding
+    print is the median carry over the `signal_lookback` prints before
+    it, as in the backtest, so that the target portfolio after a print
+    is the one the backtest holds from that print on.
+
+    With `path`, the state is saved after each update and loaded on
+    creation, to carry on from where the last run stopped.
+
+    Parameters
+    ----------
+    legsize, signal_lookback, n_long, n_short
+        see `CarryBacktest.run`
+    path : str
+        directory to keep the state in; None to keep nothing
+    freq : str
+        of the spot bars
+
+    Attributes
+    ----------
+    as_of : pandas.Timestamp
+        time of the last funding print
+    bar : pandas.Series
+        last spot bar, named by its time
+    """
+    def __init__(self, legsize: int = 2, signal_lookback: int = 42,
+                 n_long: int = 1, n_short: int = 3, path=None,
+                 freq: str = "4H"):
+        self.legsize = legsize
+        self.signal_lookback = signal_lookback
+        self.n_long = n_long
+        self.n_short = n_short
+        self.path = path
+        self.freq = freq
+
+        self.carry = RollingQuantile(signal_lookback, signal_lookback // 2)
+        self.signal = pd.Series(dtype=float)
+        self._median = pd.Series(dtype=float)
+        self.as_of = None
+        self.bar = None
+
+        if (path is not None) and \
+                os.path.exists(os.path.join(path, "live.json")):
+            self._load()
+
+    def update(self, funding=None, spot=None) -> pd.DataFrame:
+        """Ingest new funding prints and spot bars, get the target
+        portfolio.
+
+        Parameters
+        ----------
+        funding : pandas.DataFrame
+            long format, as from `kraken.downstream.get_funding_rates`;
+            prints up to `as_of` are skipped. By default read from
+            downstream, after `as_of`
+        spot : pandas.DataFrame
+            prices, time x asset. By default read from downstream, after
+            the last bar
+
+        Returns
+        -------
+        pandas.DataFrame
+            see `target`
+        """
+        if (funding is None) or (spot is None):
+            from ..datafeed_.kraken import downstream
+
+        if funding is None:
+            funding = downstream.get_funding_rates(
+                start=_after(self.as_of), which=["relative"]
+            )
+        if spot is None:
+            start = None if self.bar is None else self.bar.name
+            spot = downstream.get_spot(start=start)
+
+        self._ingest_funding(funding)
+        self._ingest_spot(spot)
+
+        if self.path is not None:
+            self._dump()
+
+        return self.target()
+
+    def target(self) -> pd.DataFrame:
+        """The target portfolio as of the last funding print.
+
+        Returns
+        -------
+        pandas.DataFrame
+            indexed by asset, with columns 'signal', 'leg' ('high', 'low'
+            or none), 'position' (perpetual contracts per unit of
+            collateral, long positive) and 'spot' (price at the last bar)
+        """
+        # ties broken by asset, as in the backtest
+        signal = self.signal.sort_index()
+        p_low, p_high = rank_sort(signal.values[None, :], self.legsize)
+
+        position = (p_high[0] * self.n_long - p_low[0] * self.n_short) / \
+            self.legsize
+        leg = np.where(p_high[0] > 0, "high",
+                       np.where(p_low[0] > 0, "low", None))
+
+        res = pd.DataFrame({"signal": signal.values, "leg": leg,
+                            "position": position},
+                           index=signal.index.rename("asset"))
+        res["spot"] = np.nan if self.bar is None \
+            else self.bar.reindex(res.index)
+
+        return res
+
+    def _ingest_funding(self, funding) -> None:
+        funding = funding.loc[funding["which"] == "relative"]
+        if self.as_of is not None:
+            funding = funding.loc[funding["timestamp"] > self.as_of]
+        if funding.empty:
+            return
+
+        carry = -pivot(funding, index="timestamp", columns="asset",
+                       values="rate")
+
+        # the signal of a print is the median before it
+        for t_, row_ in carry.iterrows():
+            self.signal = self._median
+            self._median = self.carry.update(row_)
+
+        self.signal = self.signal.reindex(self.carry.columns)
+        self.as_of = t_
+
+    def _ingest_spot(self, spot) -> None:
+        if spot.empty:
+            return
+
+        bars = spot\
+            .resample(self.freq, closed="right", label="right").last()
+        # complete bars only
+        bars = bars.loc[:spot.index[-1]]
+        if self.bar is not None:
+            bars = bars.loc[bars.index > self.bar.name]
+        if not bars.empty:
+            self.bar = bars.iloc[-1]
+
+    def _dump(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        self.carry.save(os.path.join(self.path, "signal.npz"))
+
+        state = {
+            "params": self._params(),
+            "as_of": None if self.as_of is None else self.as_of.isoformat(),
+            "signal": self.signal.to_dict(),
+            "median": self._median.to_dict(),
+            "bar": None if self.bar is None else
+            {"time": self.bar.name.isoformat(), "spot": self.bar.to_dict()},
+        }
+
+        path = os.path.join(self.path, "live.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _load(self) -> None:
+        with open(os.path.join(self.path, "live.json")) as f:
+            state = json.load(f)
+
+        if state["params"] != self._params():
+            raise ValueError(f"state in {self.path} is of other parameters: "
+                             f"{state['params']}")
+
+        self.carry = RollingQuantile.load(
+            os.path.join(self.path, "signal.npz")
+        )
+        self.as_of = None if state["as_of"] is None \
+            else pd.Timestamp(state["as_of"])
+        self.signal = pd.Series(state["signal"], dtype=float)
+        self._median = pd.Series(state["median"], dtype=float)
+        if state["bar"] is not None:
+            self.bar = pd.Series(state["bar"]["spot"], dtype=float,
+                                 name=pd.Timestamp(state["bar"]["time"]))
+
+    def _params(self) -> dict:
+        return {"legsize": self.legsize,
+                "signal_lookback": self.signal_lookback,
+                "n_long": self.n_long, "n_short": self.n_short,
+                "freq": self.freq}
+
+
+def _after(t):
+    """Start of a read of what comes after `t`, whole history if None."""
+    return None if t is None else t + pd.Timedelta(1, "ns")
@@ -0,0 +1,323 @@
+import json
+import math
+import os
+import random
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def rolling_median(x, window: int, min_periods: int) -> np.ndarray:
+    """`pd.DataFrame(x).rolling(window, min_periods).median()` of a 2D
+    array, skipping nans.
+
+    The same as `RollingQuantile(window, min_periods).extend(x)`, all rows
+    at once: for backtests over a whole history, where feeding rows one by
+    one would cost a Python loop per row.
+    """
+    n, k = x.shape
+    padded = np.concatenate((np.full((window - 1, k), np.nan), x), axis=0)
+
+    # sorted windows, nans last
+    windows = np.sort(sliding_window_view(padded, window, axis=0), axis=-1)
+    count = (~np.isnan(windows)).sum(axis=-1)
+
+    lo = np.take_along_axis(
+        windows, np.maximum(count - 1, 0)[..., None] // 2, axis=-1
+    )[..., 0]
+    hi = np.take_along_axis(
+        windows, (count // 2)[..., None].clip(max=window - 1), axis=-1
+    )[..., 0]
+
+    res = np.where(count % 2 == 1, lo, (lo + hi) / 2)
+    res[(count < min_periods) | (count == 0)] = np.nan
+
+    return res
+
+
+class _Node:
+    __slots__ = ("value", "next", "width")
+
+    def __init__(self, value, next_, width):
+        self.value = value
+        self.next = next_
+        self.width = width
+
+
+_NIL = _Node(math.inf, [], [])
+
+
+class IndexableSkiplist:
+    """Sorted collection with O(log n) insertion, removal and access by
+    rank, the structure pandas uses for rolling medians.
+
+    Parameters
+    ----------
+    expected_size : int
+        sets the number of levels
+    """
+    def __init__(self, expected_size: int = 100):
+        self.size = 0
+        self.maxlevels = int(1 + math.log2(max(expected_size, 2)))
+        self.head = _Node(None, [_NIL] * self.maxlevels,
+                          [1] * self.maxlevels)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i: int) -> float:
+        if not 0 <= i < self.size:
+            raise IndexError(i)
+
+        node = self.head
+        i += 1
+        for level in reversed(range(self.maxlevels)):
+            while node.width[level] <= i:
+                i -= node.width[level]
+                node = node.next[level]
+
+        return node.value
+
+    def insert(self, value: float) -> None:
+        chain = [None] * self.maxlevels
+        steps_at_level = [0] * self.maxlevels
+        node = self.head
+        for level in reversed(range(self.maxlevels)):
+            while (node.next[level] is not _NIL) and \
+                    (node.next[level].value <= value):
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        d = min(self.maxlevels, 1 - int(math.log2(1 - random.random())))
+        new = _Node(value, [None] * d, [None] * d)
+        steps = 0
+        for level in range(d):
+            prev = chain[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(d, self.maxlevels):
+            chain[level].width[level] += 1
+
+        self.size += 1
+
+    def remove(self, value: float) -> None:
+        chain = [None] * self.maxlevels
+        node = self.head
+        for level in reversed(range(self.maxlevels)):
+            while (node.next[level] is not _NIL) and \
+                    (node.next[level].value < value):
+                node = node.next[level]
+            chain[level] = node
+
+        found = chain[0].next[0]
+        if (found is _NIL) or (found.value != value):
+            raise KeyError(value)
+
+        for level in range(len(found.next)):
+            prev = chain[level]
+            prev.width[level] += prev.next[level].width[level] - 1
+            prev.next[level] = prev.next[level].next[level]
+        for level in range(len(found.next), self.maxlevels):
+            chain[level].width[level] -= 1
+
+        self.size -= 1
+
+
+class RollingQuantile:
+    """Rolling median or quantile of columns, updated one row at a time.
+
+    Gives the same as `data.rolling(window, min_periods).median()` (or
+    `.quantile(quantile)`, with linear interpolation) of the rows fed so
+    far, nans skipped: each column keeps the values of its window in an
+    `IndexableSkiplist`, so a new row costs O(log window) per column.
+    Columns not seen before are added as having been nan until then, as
+    they would be in a pivoted panel.
+
+    The state is the last `window` rows, from which the skiplists are
+    rebuilt; it is pickled with the object, and can be saved to and
+    loaded from an .npz file to carry on after a restart.
+
+    Parameters
+    ----------
+    window : int
+        number of rows
+    min_periods : int
+        minimum number of non-nan values; `window` by default, as in pandas
+    quantile : float
+        None for the median
+    """
+    def __init__(self, window: int, min_periods: int = None,
+                 quantile: float = None):
+        self.window = window
+        self.min_periods = window if min_periods is None else min_periods
+        self.quantile = quantile
+
+        self.columns = list()
+        self.last = None
+        self._buffer = np.empty((window, 0))
+        self._pos = 0
+        self._lists = list()
+
+    def update(self, row) -> pd.Series:
+        """Feed one row.
+
+        Parameters
+        ----------
+        row : pandas.Series
+            indexed by column, named by time (or None); missing columns
+            are nan
+
+        Returns
+        -------
+        pandas.Series
+            the rolling quantile as of this row
+        """
+        name = row.name
+        if (name is not None) and (self.last is not None) and \
+                not name > self.last:
+            raise ValueError(f"{name} does not come after {self.last}")
+
+        self._add_columns(row.index)
+        values = row.reindex(self.columns).values.astype(float)
+
+        res = np.empty(len(self.columns))
+        old = self._buffer[self._pos]
+        for j_, (sl_, x_, y_) in enumerate(zip(self._lists, values, old)):
+            if not math.isnan(y_):
+                sl_.remove(y_)
+            if not math.isnan(x_):
+                sl_.insert(x_)
+            res[j_] = self._get(sl_)
+
+        self._buffer[self._pos] = values
+        self._pos = (self._pos + 1) % self.window
+        if name is not None:
+            self.last = name
+
+        return pd.Series(res, index=pd.Index(self.columns), name=name)
+
+    def extend(self, data) -> pd.DataFrame:
+        """Feed the rows of `data` one after another.
+
+        To start from a long history without needing its outputs, it is
+        enough to feed its last `window` rows.
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            indexed by time
+
+        Returns
+        -------
+        pandas.DataFrame
+            the rolling quantile as of each row
+        """
+        res = [self.update(r_) for _, r_ in data.iterrows()]
+        if not res:
+            return pd.DataFrame(index=data.index, columns=self.columns,
+                                dtype=float)
+
+        return pd.DataFrame(res).reindex(columns=self.columns)\
+            .rename_axis(index=data.index.name, columns=data.columns.name)
+
+    def save(self, path) -> None:
+        """Save the state to an .npz file."""
+        meta = json.dumps(self.__getstate__()["meta"])
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, buffer=self._ordered(), meta=meta)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path) -> "RollingQuantile":
+        """Load a state saved with `save`."""
+        with np.load(path) as f:
+            state = {"meta": json.loads(str(f["meta"])),
+                     "buffer": f["buffer"]}
+
+        res = cls.__new__(cls)
+        res.__setstate__(state)
+
+        return res
+
+    def __getstate__(self) -> dict:
+        meta = {"window": self.window, "min_periods": self.min_periods,
+                "quantile": self.quantile,
+                "columns": [_to_json(c_) for c_ in self.columns],
+                "last": _to_json(self.last)}
+
+        return {"meta": meta, "buffer": self._ordered()}
+
+    def __setstate__(self, state) -> None:
+        meta = state["meta"]
+        last = meta["last"]
+        if isinstance(last, dict):
+            last = pd.Timestamp(last["timestamp"])
+
+        self.__init__(meta["window"], meta["min_periods"], meta["quantile"])
+        self.last = last
+        self._add_columns(meta["columns"])
+        self._buffer[...] = state["buffer"]
+        for sl_, col_ in zip(self._lists, self._buffer.T):
+            for x_ in col_[~np.isnan(col_)]:
+                sl_.insert(x_)
+
+    def _ordered(self) -> np.ndarray:
+        """The buffer, oldest row first."""
+        return np.roll(self._buffer, -self._pos, axis=0)
+
+    def _add_columns(self, columns) -> None:
+        known = set(self.columns)
+        new = [c_ for c_ in columns if c_ not in known]
+        if not new:
+            return
+
+        self.columns.extend(new)
+        self._buffer = np.concatenate(
+            (self._buffer, np.full((self.window, len(new)), np.nan)), axis=1
+        )
+        self._lists.extend(IndexableSkiplist(self.window) for _ in new)
+
+    def _get(self, sl) -> float:
+        """The quantile of the values in `sl`, as pandas computes it."""
+        nobs = len(sl)
+        if (nobs == 0) or (nobs < self.min_periods):
+            return np.nan
+
+        if self.quantile is None:
+            mid = nobs // 2
+            if nobs % 2:
+                return sl[mid]
+            return (sl[mid] + sl[mid - 1]) / 2
+
+        if nobs == 1:
+            return sl[0]
+
+        idx_with_fraction = self.quantile * (nobs - 1)
+        idx = int(idx_with_fraction)
+        vlow = sl[idx]
+        if idx_with_fraction == idx:
+            return vlow
+
+        vhigh = sl[idx + 1]
+
+        return vlow + (vhigh - vlow) * (idx_with_fraction - idx)
+
+
+def _to_json(label):
+    """A row or column label as JSON can take it: numpy scalars as Python
+    ones, timestamps as {'timestamp': isoformat}."""
+    if isinstance(label, np.datetime64):
+        label = pd.Timestamp(label)
+    if isinstance(label, pd.Timestamp):
+        return {"timestamp": label.isoformat()}
+    if isinstance(label, np.generic):
+        return label.item()
+
+    return label
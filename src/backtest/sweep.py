@@ -0,0 +1,228 @@
+import csv
+import itertools
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from .carry import CarryBacktest, PORTFOLIOS
+from .data import CarryData
+from ..datafeed_.utilities import imap_ordered
+
+PARAMS = ["t_hold", "legsize", "signal_lookback", "n_long", "n_short"]
+STATS = ["mean", "tstat", "sharpe", "count"]
+
+_ARRAYS = ["spot", "perp", "f_abs", "f_rel"]
+
+# per-worker state, set by `_attach`
+_worker = dict()
+
+
+def expand_grid(grid: dict) -> list:
+    """All combinations of the parameter values of `grid`.
+
+    Parameters
+    ----------
+    grid : dict
+        parameter -> list of values, parameters as in `CarryBacktest.run`;
+        the number of long and short contracts may be given together as
+        'leverage', a list of (n_long, n_short) pairs
+
+    Returns
+    -------
+    list
+        of dicts of keyword arguments to `CarryBacktest.run`, sorted by
+        signal lookback, so that a worker reuses its cached signals
+    """
+    grid = dict(grid)
+    if "leverage" in grid:
+        grid["n_long, n_short"] = grid.pop("leverage")
+
+    res = list()
+    for values in itertools.product(*grid.values()):
+        kwargs = dict()
+        for k_, v_ in zip(grid.keys(), values):
+            if k_ == "n_long, n_short":
+                kwargs["n_long"], kwargs["n_short"] = v_
+            else:
+                kwargs[k_] = v_
+        res.append(kwargs)
+
+    return sorted(res, key=lambda x: x.get("signal_lookback", 42))
+
+
+def describe(returns, ann: float, cov_lags: int = 1) -> np.ndarray:
+    """Mean, t-statistic, Sharpe ratio and count of columns of returns.
+
+    The mean is annualized and in percent, the Sharpe ratio annualized;
+    the t-statistic uses the Newey-West standard error with `cov_lags`
+    lags (0 for the plain one).
+
+    Parameters
+    ----------
+    returns : numpy.ndarray
+        (time, portfolio), without nans
+    ann : float
+        number of periods in a year
+    cov_lags : int
+
+    Returns
+    -------
+    numpy.ndarray
+        (portfolio, 4)
+    """
+    n = len(returns)
+    if n < 2:
+        res = np.full((returns.shape[1], 4), np.nan)
+        res[:, 3] = n
+        return res
+
+    mu = returns.mean(axis=0)
+    std = returns.std(axis=0, ddof=1)
+
+    e = returns - mu
+    lrv = (e * e).sum(axis=0) / n
+    for lag_ in range(1, min(cov_lags, n - 1) + 1):
+        w = 1 - lag_ / (cov_lags + 1)
+        lrv += 2 * w * (e[lag_:] * e[:-lag_]).sum(axis=0) / n
+    sterr = np.sqrt(lrv / n)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        res = np.stack([mu * ann * 100, mu / sterr,
+                        mu / std * np.sqrt(ann), np.full_like(mu, n)],
+                       axis=1)
+
+    return res
+
+
+def sweep(data: CarryData, grid: dict, n_jobs: int = -1,
+          ann: float = 365 * 6, cov_lags: int = 1, path=None,
+          chunksize: int = 8) -> pd.DataFrame:
+    """Run the carry backtest for each combination of parameters in `grid`.
+
+    The arrays of `data` are copied once into shared memory, which the
+    workers attach to, rather than being pickled to each of them; only
+    the parameters and the statistics travel between processes. Results
+    are collected as they arrive and, if `path` is given, appended to a
+    .csv file as they do, so that a long sweep can be watched.
+
+    Parameters
+    ----------
+    data : CarryData
+    grid : dict
+        see `expand_grid`
+    n_jobs : int
+        number of worker processes; -1 for all cpus, 1 to run here
+    ann : float
+        number of periods in a year; divided by the holding period
+    cov_lags : int
+        lags of the Newey-West standard error of the t-statistic
+    path : str
+        .csv file to stream the results to
+    chunksize : int
+        number of configurations per task
+
+    Returns
+    -------
+    pandas.DataFrame
+        one row per configuration and portfolio, with the columns of
+        `PARAMS`, 'portfolio' and those of `STATS`
+    """
+    configs = expand_grid(grid)
+    chunks = [configs[i_:i_ + chunksize]
+              for i_ in range(0, len(configs), chunksize)]
+
+    shm, layout = _share(data)
+    try:
+        rows = list()
+        f = None if path is None else open(path, "w", newline="")
+        try:
+            writer = None if f is None else csv.writer(f)
+            if writer is not None:
+                writer.writerow(PARAMS + ["portfolio"] + STATS)
+
+            for res_ in imap_ordered(_run_chunk,
+                                     [(c_, ann, cov_lags) for c_ in chunks],
+                                     n_jobs=n_jobs,
+                                     initializer=_attach,
+                                     initargs=(shm.name, layout)):
+                rows.extend(res_)
+                if writer is not None:
+                    writer.writerows(res_)
+                    f.flush()
+        finally:
+            if f is not None:
+                f.close()
+    finally:
+        # views first, then the blocks they are views of
+        _worker.pop("backtest", None)
+        if "shm" in _worker:
+            _worker.pop("shm").close()
+        shm.close()
+        shm.unlink()
+
+    return pd.DataFrame(rows, columns=PARAMS + ["portfolio"] + STATS)
+
+
+def _share(data) -> (shared_memory.SharedMemory, dict):
+    """Copy the arrays of `data` to one block of shared memory.
+
+    Returns the block and what it takes to rebuild `data` from it: the
+    offset, dtype and shape of each array, the index and the assets.
+    """
+    arrays = {k_: getattr(data, k_) for k_ in _ARRAYS}
+    for k_ in data.rows:
+        arrays[f"rows/{k_}"] = np.asarray(data.rows[k_])
+        arrays[f"cols/{k_}"] = np.asarray(data.cols[k_])
+
+    layout = {"index": data.index, "assets": data.assets, "arrays": dict()}
+    size = 0
+    for k_, a_ in arrays.items():
+        layout["arrays"][k_] = (size, a_.dtype.str, a_.shape)
+        size += -(-a_.nbytes // 8) * 8
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for k_, a_ in arrays.items():
+        offset, dtype, shape = layout["arrays"][k_]
+        np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)[...] = a_
+
+    return shm, layout
+
+
+def _attach(name, layout) -> None:
+    """Worker initializer: build a backtest on the shared arrays."""
+    shm = shared_memory.SharedMemory(name=name)
+
+    arrays = {
+        k_: np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)
+        for k_, (offset, dtype, shape) in layout["arrays"].items()
+    }
+    rows = {k_.split("/")[1]: v_ for k_, v_ in arrays.items()
+            if k_.startswith("rows/")}
+    cols = {k_.split("/")[1]: v_ for k_, v_ in arrays.items()
+            if k_.startswith("cols/")}
+
+    data = CarryData.from_arrays(layout["index"], layout["assets"],
+                                 *[arrays[k_] for k_ in _ARRAYS],
+                                 rows=rows, cols=cols)
+
+    # the block must stay open as long as the views are in use
+    _worker["shm"] = shm
+    _worker["backtest"] = CarryBacktest(data)
+
+
+def _run_chunk(args) -> list:
+    configs, ann, cov_lags = args
+    bt = _worker["backtest"]
+
+    res = list()
+    for kwargs in configs:
+        kwargs = {**dict(t_hold=1, legsize=2, signal_lookback=42, n_long=1,
+                         n_short=3), **kwargs}
+        returns, _ = bt.run(**kwargs)
+        stats = describe(returns, ann / kwargs["t_hold"], cov_lags)
+
+        for p_, s_ in zip(PORTFOLIOS, stats):
+            res.append([kwargs[k_] for k_ in PARAMS] + [p_] + s_.tolist())
+
+    return res
@@ -0,0 +1,60 @@
+"""Run the benchmarks: `python -m src.benchmarks --help`."""
+import argparse
+import sys
+import tempfile
+
+import pandas as pd
+
+from .suite import (BENCHMARKS, Context, compare, load_report, report, run,
+                    save_report)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.benchmarks",
+        description="Benchmark the data pipeline and the backtest on "
+                    "synthetic Kraken data."
+    )
+    parser.add_argument("names", nargs="*",
+                        help="benchmarks to run, of: " +
+                             ", ".join(BENCHMARKS) + "; all by default")
+    parser.add_argument("--rows", type=int, default=200000,
+                        help="trades per month and spot bars per asset")
+    parser.add_argument("--months", type=int, default=3)
+    parser.add_argument("--assets", type=int, default=5,
+                        help="assets traded in perpetuals")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="output/benchmarks/latest.json",
+                        help="where to save the report")
+    parser.add_argument("--baseline",
+                        help="report to compare with; exits with 1 if "
+                             "anything regressed")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    unknown = set(args.names).difference(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as root, \
+            Context(root, months=args.months, n_rows=args.rows,
+                    n_assets=args.assets) as context:
+        results = run(context, names=args.names or None, repeat=args.repeat)
+        report_ = report(results, context)
+
+    save_report(report_, args.output)
+
+    with pd.option_context("display.width", 120, "display.precision", 3):
+        if args.baseline is None:
+            print(pd.DataFrame(results).T)
+            return 0
+
+        comparison = compare(results, load_report(args.baseline),
+                             args.tolerance)
+        print(comparison)
+
+    return int(comparison["regression"].any())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
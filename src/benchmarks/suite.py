@@ -0,0 +1,443 @@
+"""Benchmarks of the data pipeline and the backtest on synthetic data.
+
+Each benchmark is a function taking a `Context` and returning the
+callable to time together with the number of rows it processes; whatever
+the function does before returning is setup, and is not timed. The
+callable is timed `repeat` times, of which the best is kept, then run
+once more under `tracemalloc` for the peak of memory allocated through
+python (numpy and pandas included, arrow buffers not).
+"""
+import gc
+import json
+import os
+import platform
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import pandas as pd
+
+from . import synthetic
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name: str):
+    """Register a benchmark under `name`."""
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return decorator
+
+
+class Context:
+    """Synthetic project the benchmarks run in.
+
+    PROJECT_ROOT is pointed at `root`, under which data are read and
+    written, until the context is exited.
+
+    Parameters
+    ----------
+    root : str
+        project root, to hold the synthetic raw and prepared data
+    months : int
+        number of months of data
+    n_rows : int
+        number of trades per month and of spot bars per asset
+    n_assets : int
+        number of assets traded in perpetuals; spot and funding are of the
+        five assets `kraken.upstream` knows of
+    """
+    def __init__(self, root, months: int = 3, n_rows: int = 200000,
+                 n_assets: int = 5):
+        self.root = root
+        self.months = synthetic.months_from("2020-01", months)
+        self.n_rows = n_rows
+
+        self.assets = synthetic.ASSETS + \
+            [f"x{n_:02d}" for n_ in range(max(n_assets - 5, 0))]
+        self.assets = self.assets[:max(n_assets, 5)]
+
+        # as `make data_dir_layout`
+        for d_ in ["spot", "perpetual", "funding"]:
+            os.makedirs(os.path.join(root, "data/prepared", d_, "kraken"),
+                        exist_ok=True)
+
+        self._project_root = os.environ.get("PROJECT_ROOT")
+        os.environ["PROJECT_ROOT"] = root
+        self.raw = synthetic.make_raw_data(root, self.months, n_rows,
+                                           self.assets)
+        self._prepared = False
+        self.servers = list()
+
+    def close(self) -> None:
+        """Stop the servers benchmarks have started, and point
+        `kraken.upstream` back at the urls and rate limits of `setup`."""
+        if not self.servers:
+            return
+
+        from ..datafeed_.kraken import setup, upstream
+
+        for s_ in self.servers:
+            s_.stop()
+        self.servers.clear()
+
+        upstream.configure(setup.ROOT_URL, setup.ROOT_URL_SPOT,
+                           setup.ROOT_URL_PERP, setup.RATE_LIMIT_SPOT,
+                           setup.RATE_LIMIT_PERP)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        if self._project_root is None:
+            os.environ.pop("PROJECT_ROOT", None)
+        else:
+            os.environ["PROJECT_ROOT"] = self._project_root
+
+    def prepare(self) -> None:
+        """Write the prepared data, once."""
+        if self._prepared:
+            return
+
+        from ..datafeed_.kraken import upstream
+
+        upstream.save_spot_from_ohlcv(n_jobs=1)
+        with self.funding_api():
+            upstream.save_funding_rates()
+        upstream.save_perpetual_from_csv(streaming=True)
+        self._prepared = True
+
+    def funding_api(self):
+        """Context in which `kraken.upstream` gets funding rates from the
+        synthetic payloads instead of the API."""
+        return _funding_api(self.raw["funding"])
+
+
+def run(context, names=None, repeat: int = 3) -> dict:
+    """Run benchmarks.
+
+    Parameters
+    ----------
+    context : Context
+    names : list
+        of benchmarks to run; all by default
+    repeat : int
+        number of timed runs of each
+
+    Returns
+    -------
+    dict
+        name -> {'seconds', 'rows', 'rows_per_second', 'peak_mb'}
+    """
+    names = list(BENCHMARKS) if names is None else names
+
+    try:
+        return _run(context, names, repeat)
+    finally:
+        context.close()
+
+
+def _run(context, names, repeat) -> dict:
+
+    res = OrderedDict()
+    for name_ in names:
+        func, n_rows = BENCHMARKS[name_](context)
+
+        seconds = list()
+        for _ in range(repeat):
+            gc.collect()
+            t0 = time.perf_counter()
+            func()
+            seconds.append(time.perf_counter() - t0)
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        n_rows = int(n_rows)
+        res[name_] = {"seconds": min(seconds), "rows": n_rows,
+                      "rows_per_second": n_rows / min(seconds),
+                      "peak_mb": peak / 2 ** 20}
+
+    return res
+
+
+def report(results, context) -> dict:
+    """Results with what they were obtained on."""
+    import numpy as np
+    import pyarrow as pa
+
+    return {
+        "benchmarks": results,
+        "scale": {"months": len(context.months), "rows": context.n_rows,
+                  "assets": len(context.assets)},
+        "machine": {"python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "cpus": os.cpu_count(), "pandas": pd.__version__,
+                    "numpy": np.__version__, "pyarrow": pa.__version__},
+        "time": pd.Timestamp.now(tz="UTC").isoformat(),
+    }
+
+
+def compare(results, baseline, tolerance: float = 0.2) -> pd.DataFrame:
+    """Compare results with those of a baseline report.
+
+    A benchmark regresses if its throughput is lower, or its peak memory
+    higher, than the baseline's by more than `tolerance`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        indexed by benchmark, with the throughput and peak memory, their
+        ratios to the baseline and a 'regression' flag
+    """
+    res = pd.DataFrame(results).T[["rows_per_second", "peak_mb"]]
+    base = pd.DataFrame(baseline["benchmarks"]).T\
+        .reindex(res.index)[["rows_per_second", "peak_mb"]]
+
+    res["speed_ratio"] = res["rows_per_second"] / base["rows_per_second"]
+    res["memory_ratio"] = res["peak_mb"] / base["peak_mb"]
+    res["regression"] = (res["speed_ratio"] < 1 / (1 + tolerance)) | \
+        (res["memory_ratio"] > 1 + tolerance)
+
+    return res
+
+
+def load_report(path) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_report(report_, path) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report_, f, indent=2)
+
+
+@benchmark("aggregate_data")
+def _aggregate_data(context):
+    from ..datafeed_.utilities import aggregate_data
+    from ..datafeed_.kraken.upstream import _prepare_trades
+
+    trades = synthetic.make_matches_history(context.months[0],
+                                            context.n_rows, context.assets)
+    trades = _prepare_trades(
+        trades.loc[trades["tradeable"].str.startswith("PI_")]
+        .drop(columns="uid")
+    )
+
+    def func():
+        aggregate_data(trades, agg_freq="10T", offset_freq="5T",
+                       datetime_col="timestamp", objective_col="price",
+                       weight_col="size",
+                       other_cols=["tradeable", "aggressor"])
+
+    return func, len(trades)
+
+
+@benchmark("save_perpetual_from_csv")
+def _save_perpetual_from_csv(context):
+    from ..datafeed_.kraken import upstream
+
+    def func():
+        # parsed files are cached with joblib otherwise
+        upstream.memory.clear(warn=False)
+        upstream.save_perpetual_from_csv()
+
+    return func, context.n_rows * len(context.months)
+
+
+@benchmark("save_perpetual_from_csv_streaming")
+def _save_perpetual_streaming(context):
+    from ..datafeed_.kraken import upstream
+
+    def func():
+        upstream.save_perpetual_from_csv(streaming=True)
+
+    return func, context.n_rows * len(context.months)
+
+
+@benchmark("get_spot_from_ohlcv")
+def _get_spot_from_ohlcv(context):
+    from ..datafeed_.kraken import upstream
+
+    def func():
+        upstream._get_spot_from_ohlcv("xbt")
+
+    return func, context.n_rows
+
+
+@benchmark("save_funding_rates")
+def _save_funding_rates(context):
+    from ..datafeed_.kraken import upstream
+
+    def func():
+        with context.funding_api():
+            upstream.save_funding_rates()
+
+    n_rows = sum(len(p_["rates"]) for a_, p_ in context.raw["funding"].items()
+                 if a_ in synthetic.ASSETS)
+
+    return func, n_rows
+
+
+def _loader(func_name, **kwargs):
+    def bench(context):
+        context.prepare()
+        from ..datafeed_.kraken import downstream
+        loader = getattr(downstream, func_name)
+
+        res = loader(**kwargs)
+        n_rows = len(res) if "timestamp" in res.columns else res.size
+
+        return (lambda: loader(**kwargs)), n_rows
+
+    return bench
+
+
+benchmark("get_perpetual")(_loader("get_perpetual", cache=False))
+benchmark("get_perpetual_mid")(_loader("get_perpetual", mid=True,
+                                       cache=False))
+benchmark("get_perpetual_cached")(_loader("get_perpetual", cache=True))
+benchmark("get_spot")(_loader("get_spot", cache=False))
+benchmark("get_funding_rates")(_loader("get_funding_rates"))
+
+
+@benchmark("backtest")
+def _backtest(context):
+    context.prepare()
+    from ..backtest.carry import CarryBacktest
+    from ..backtest.data import load_carry_data
+
+    bt = CarryBacktest(load_carry_data(start=context.months[0]))
+    bt.run()
+
+    return bt.run, bt.data.shape[0]
+
+
+@benchmark("build_panel")
+def _build_panel(context):
+    context.prepare()
+    from ..datafeed_.venues import build_panel
+
+    labels = [("kraken", a_, i_, f_) for a_ in context.assets
+              for i_, f_ in [("spot", "close"), ("perpetual", "mid"),
+                             ("perpetual", "bid"), ("perpetual", "ask")]]
+
+    def func():
+        return build_panel(labels, freq="10T", max_staleness="1H")
+
+    return func, func().values.size
+
+
+def _api(which):
+    """Pulls from the API through a local `ReplayServer` without rate
+    limits, checkpoints cleared before each."""
+    def bench(context):
+        import shutil
+        from ..datafeed_.kraken import upstream
+        from ..datafeed_.kraken.replay import ReplayServer
+
+        data = synthetic.make_api_data(context.months[0], context.n_rows,
+                                       ["xbt"])
+        server = ReplayServer(**data, rate_limits={"spot": None,
+                                                   "futures": None})
+        context.servers.append(server.start())
+
+        start = pd.Timestamp(context.months[0], tz="UTC")
+        if which == "spot":
+            end = pd.Timestamp(data["spot"]["xbtusd"]["time"].iloc[-1],
+                               unit="s", tz="UTC")
+            get = upstream._get_spot_from_api
+        else:
+            end = pd.Timestamp(
+                data["futures"]["pi_xbtusd"]["timestamp"].iloc[-1],
+                unit="ms", tz="UTC"
+            )
+            get = upstream._get_perpetual_from_api
+
+        def func():
+            shutil.rmtree(os.path.join(upstream.data_dir(), "checkpoints"),
+                          ignore_errors=True)
+            upstream.configure(**server.urls(),
+                               rate_limit_spot=(1e6, 1000),
+                               rate_limit_perp=(1e6, 1000))
+            get("xbt", start, end)
+
+        return func, context.n_rows
+
+    return bench
+
+
+benchmark("fetch_spot_api")(_api("spot"))
+benchmark("fetch_perpetual_api")(_api("perpetual"))
+
+
+def _cli(*argv):
+    """Cold start of the command line: `python -m src.datafeed_ <argv>` in
+    a fresh interpreter. Rows are runs, and the peak memory is that of
+    this process, i.e. none."""
+    def bench(context):
+        import subprocess
+        import sys
+
+        if argv[0] == "load":
+            context.prepare()
+
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        env = dict(os.environ, PROJECT_ROOT=context.root)
+
+        def func():
+            subprocess.run([sys.executable, "-m", "src.datafeed_", *argv],
+                           cwd=root, env=env, check=True,
+                           stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+
+        return func, 1
+
+    return bench
+
+
+benchmark("cli_status")(_cli("status"))
+benchmark("cli_load_funding")(_cli("load", "funding", "--assets", "xbt"))
+
+
+class _Fetcher:
+    """Stands in for the fetcher of the futures API, answering funding
+    rate requests with synthetic payloads."""
+    def __init__(self, payloads):
+        self.payloads = payloads
+        self.n_requests = 0
+
+    def get_json(self, url, params=None):
+        self.n_requests += 1
+        symbol = url.split("symbol=")[1]
+
+        return self.payloads[symbol[3:6].lower()]
+
+    def close(self) -> None:
+        pass
+
+
+@contextmanager
+def _funding_api(payloads):
+    from ..datafeed_.kraken import upstream
+
+    old = upstream._fetchers.get("perp")
+    upstream._fetchers["perp"] = _Fetcher(payloads)
+    try:
+        yield
+    finally:
+        if old is None:
+            upstream._fetchers.pop("perp", None)
+        else:
+            upstream._fetchers["perp"] = old
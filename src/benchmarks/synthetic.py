@@ -0,0 +1,304 @@
+"""Synthetic Kraken data in the formats of the raw downloads and the API.
+
+    - 'matches_history_YYYY-MM.csv.zip': perpetual and fixed-maturity
+      futures trades of one month, as in the 'matches_history' Dropbox
+      folder;
+    - '<XXX>_OHLCVT.zip': 1-minute OHLCVT bars of one asset, as in the
+      'Separate ZIP files' of spot prices;
+    - funding rates: the JSON body of 'historicalfundingrates';
+    - spot trades and perpetual executions, as served by the 'Trades' and
+      'executions' endpoints.
+
+Prices follow random walks, so that aggregated data look like the real
+thing; everything is drawn from a seeded generator.
+"""
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+ASSETS = ["xbt", "bch", "xrp", "ltc", "eth"]
+
+
+def months_from(start: str, n_months: int) -> list:
+    """'YYYY-MM' of `n_months` months from `start` on."""
+    return [str(p_) for p_ in pd.period_range(start, periods=n_months,
+                                              freq="M")]
+
+
+def make_matches_history(month: str, n_rows: int, assets=None,
+                         share_perpetual: float = 0.8, seed: int = 0) \
+        -> pd.DataFrame:
+    """Trades of one month of the 'matches_history' files.
+
+    Parameters
+    ----------
+    month : str
+        'YYYY-MM'
+    n_rows : int
+        number of trades
+    assets : list
+        lowercase 3-letter codes; `ASSETS` by default
+    share_perpetual : float
+        share of trades in perpetual ('PI_') contracts, the rest being
+        fixed maturity ('FI_') ones
+    seed : int
+
+    Returns
+    -------
+    pandas.DataFrame
+        with columns 'uid', 'timestamp' (str), 'tradeable', 'price',
+        'size', 'aggressor', sorted by time
+    """
+    assets = ASSETS if assets is None else assets
+    rng = np.random.default_rng([seed, int(month.replace("-", ""))])
+
+    start = pd.Period(month).start_time
+    end = pd.Period(month).end_time
+    t = np.sort(rng.integers(start.value, end.value, n_rows))
+
+    asset = rng.integers(0, len(assets), n_rows)
+    perpetual = rng.random(n_rows) < share_perpetual
+    expiry = (start + pd.offsets.QuarterEnd(0)).strftime("%y%m%d")
+    names = np.array([f"PI_{a_.upper()}USD" for a_ in assets] +
+                     [f"FI_{a_.upper()}USD_{expiry}" for a_ in assets])
+    tradeable = names[asset + len(assets) * ~perpetual]
+
+    price = _random_walk(rng, t, len(assets))[np.arange(n_rows), asset]
+
+    res = pd.DataFrame({
+        "uid": np.arange(n_rows),
+        "timestamp": pd.to_datetime(t).strftime("%Y-%m-%d %H:%M:%S.%f")
+        .str[:-3],
+        "tradeable": tradeable,
+        "price": price.round(2),
+        "size": rng.integers(1, 5000, n_rows),
+        "aggressor": np.where(rng.random(n_rows) < 0.5, "buyer", "seller"),
+    })
+
+    return res
+
+
+def make_ohlcvt(asset: str, start: str, n_rows: int, seed: int = 0) \
+        -> pd.DataFrame:
+    """1-minute OHLCVT bars of one asset, minutes without trades skipped.
+
+    Returns
+    -------
+    pandas.DataFrame
+        with columns 'timestamp' (epoch seconds), 'open', 'high', 'low',
+        'close', 'volume', 'trades'
+    """
+    rng = np.random.default_rng([seed, sum(map(ord, asset))])
+
+    # about one minute in ten without trades
+    t0 = pd.Timestamp(start).value // 10 ** 9
+    minutes = np.cumsum(1 + (rng.random(n_rows) < 0.1))
+    t = t0 + 60 * minutes
+
+    close = _random_walk(rng, t * 10 ** 9, 1)[:, 0]
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    spread = np.abs(rng.normal(0, 1e-3, n_rows)) * close
+
+    return pd.DataFrame({
+        "timestamp": t,
+        "open": open_.round(2),
+        "high": (np.maximum(open_, close) + spread).round(2),
+        "low": (np.minimum(open_, close) - spread).round(2),
+        "close": close.round(2),
+        "volume": rng.exponential(2.0, n_rows).round(8),
+        "trades": rng.integers(1, 50, n_rows),
+    })
+
+
+def make_funding_payload(asset: str, start: str, n_rows: int,
+                         seed: int = 0) -> dict:
+    """Body of a 'historicalfundingrates' response, hourly rates.
+
+    Returns
+    -------
+    dict
+        {'rates': [{'timestamp', 'fundingRate', 'relativeFundingRate'}],
+        'result': 'success', 'serverTime'}
+    """
+    rng = np.random.default_rng([seed, sum(map(ord, asset)), 1])
+
+    t = pd.date_range(start, periods=n_rows, freq="H", tz="UTC")
+    relative = rng.normal(1e-5, 2e-5, n_rows)
+    price = np.exp(_random_walk(rng, t.asi8, 1)[:, 0] / 100)
+    absolute = relative / price
+
+    rates = [
+        {"timestamp": t_.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+         "fundingRate": float(a_), "relativeFundingRate": float(r_)}
+        for t_, a_, r_ in zip(t, absolute, relative)
+    ]
+
+    return {"rates": rates, "result": "success",
+            "serverTime": t[-1].strftime("%Y-%m-%dT%H:%M:%S.000Z")}
+
+
+def make_spot_trades(asset: str, start: str, n_rows: int,
+                     seed: int = 0) -> pd.DataFrame:
+    """Spot trades as the 'Trades' endpoint returns them, about one every
+    10 seconds.
+
+    Returns
+    -------
+    pandas.DataFrame
+        with columns 'price', 'volume', 'time' (epoch seconds, to 4
+        decimals), 'side' ('b' or 's')
+    """
+    rng = np.random.default_rng([seed, sum(map(ord, asset)), 2])
+
+    t0 = pd.Timestamp(start).value / 1e9
+    t = (t0 + np.cumsum(rng.exponential(10.0, n_rows))).round(4)
+
+    return pd.DataFrame({
+        "price": _random_walk(rng, (t * 1e9).astype("int64"), 1)[:, 0]
+        .round(2),
+        "volume": rng.exponential(0.5, n_rows).round(8),
+        "time": t,
+        "side": np.where(rng.random(n_rows) < 0.5, "b", "s"),
+    })
+
+
+def make_executions(asset: str, start: str, n_rows: int,
+                    seed: int = 0) -> pd.DataFrame:
+    """Perpetual executions as the futures 'executions' endpoint returns
+    them, about one every 10 seconds, some in the same millisecond.
+
+    Returns
+    -------
+    pandas.DataFrame
+        with columns 'timestamp' (epoch ms), 'price', 'quantity',
+        'direction' ('Buy' or 'Sell')
+    """
+    rng = np.random.default_rng([seed, sum(map(ord, asset)), 3])
+
+    t0 = pd.Timestamp(start).value // 10 ** 6
+    t = t0 + np.cumsum(rng.exponential(10000.0, n_rows).astype("int64"))
+
+    return pd.DataFrame({
+        "timestamp": t,
+        "price": _random_walk(rng, t * 10 ** 6, 1)[:, 0].round(2),
+        "quantity": rng.integers(1, 5000, n_rows),
+        "direction": np.where(rng.random(n_rows) < 0.5, "Buy", "Sell"),
+    })
+
+
+def make_api_data(start: str, n_rows: int, assets=None,
+                  seed: int = 0) -> dict:
+    """Spot trades, executions and funding rates of `assets`, as keyword
+    arguments to `kraken.replay.ReplayServer`.
+
+    Parameters
+    ----------
+    start : str
+    n_rows : int
+        number of trades and of executions per asset; funding rates cover
+        the hours spanned by the executions
+    assets : list
+    seed : int
+    """
+    assets = ASSETS if assets is None else assets
+
+    res = {"spot": dict(), "futures": dict(), "funding": dict()}
+    for a_ in assets:
+        res["spot"][f"{a_}usd"] = make_spot_trades(a_, start, n_rows, seed)
+        executions = make_executions(a_, start, n_rows, seed)
+        res["futures"][f"pi_{a_}usd"] = executions
+
+        n_hours = int(np.ceil((executions["timestamp"].iloc[-1] -
+                               executions["timestamp"].iloc[0]) / 3.6e6))
+        res["funding"][f"PI_{a_.upper()}USD"] = \
+            make_funding_payload(a_, start, max(n_hours, 1), seed)
+
+    return res
+
+
+def write_matches_history(path, data, rti: bool = False) -> str:
+    """Write trades as 'matches_history_YYYY-MM.csv.zip' into `path`.
+
+    With `rti=True`, as 'matches_history_YYYY-MM_rti.csv.zip', without a
+    header row, the layout of the one file of October 2020.
+    """
+    month = data["timestamp"].iloc[0][:7]
+    name = f"matches_history_{month}{'_rti' if rti else ''}.csv"
+
+    return _write_zip(os.path.join(path, f"{name}.zip"),
+                      {name: data.to_csv(index=False, header=not rti)})
+
+
+def write_ohlcvt(path, asset: str, data) -> str:
+    """Write bars as '<XXX>_OHLCVT.zip' into `path`, with the 1-minute
+    file in it."""
+    base = asset.upper()
+
+    return _write_zip(os.path.join(path, f"{base}_OHLCVT.zip"),
+                      {f"{base}USD_1.csv": data.to_csv(index=False,
+                                                       header=False)})
+
+
+def make_raw_data(root, months: list, n_rows: int, assets=None,
+                  seed: int = 0) -> dict:
+    """Raw files under `root`/data/raw as the README lays them out.
+
+    Parameters
+    ----------
+    root : str
+        project root
+    months : list
+        of 'YYYY-MM', see `months_from`
+    n_rows : int
+        number of trades per month and of spot bars per asset
+    assets : list
+    seed : int
+
+    Returns
+    -------
+    dict
+        'perpetual' -> list of trade files, 'spot' -> list of bar files,
+        'funding' -> asset -> funding payload
+    """
+    assets = ASSETS if assets is None else assets
+
+    path_perp = os.path.join(root, "data/raw/perpetual/kraken")
+    path_spot = os.path.join(root, "data/raw/spot/kraken")
+    for p_ in (path_perp, path_spot):
+        os.makedirs(p_, exist_ok=True)
+
+    res = {"perpetual": list(), "spot": list(), "funding": dict()}
+
+    for m_ in months:
+        data = make_matches_history(m_, n_rows, assets, seed=seed)
+        res["perpetual"].append(write_matches_history(path_perp, data))
+
+    # hours in the months, for funding
+    n_hours = int((pd.Period(months[-1]).end_time -
+                   pd.Period(months[0]).start_time) / pd.Timedelta("1H"))
+    for a_ in assets:
+        bars = make_ohlcvt(a_, months[0], n_rows, seed=seed)
+        res["spot"].append(write_ohlcvt(path_spot, a_, bars))
+        res["funding"][a_] = make_funding_payload(a_, months[0], n_hours,
+                                                  seed=seed)
+
+    return res
+
+
+def _random_walk(rng, t, n_assets: int) -> np.ndarray:
+    """Prices around 100 at times `t` (ns), with 80% annual volatility."""
+    dt = np.diff(t, prepend=t[0]) / (365 * 24 * 3600 * 1e9)
+    shocks = rng.normal(0, 1, (len(t), n_assets)) * \
+        (0.8 * np.sqrt(dt))[:, None]
+
+    return 100 * np.exp(np.cumsum(shocks, axis=0))
+
+
+def _write_zip(path, members: dict) -> str:
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        for name_, content_ in members.items():
+            z.writestr(name_, content_)
+
+    return path
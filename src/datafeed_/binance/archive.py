@@ -0,0 +1,298 @@
+"""Monthly kline archives of data.binance.vision, kept locally.
+
+Archives are stored under 'data/raw/binance' in the layout of the archive
+itself, e.g. 'futures/cm/monthly/klines/BTCUSD_PERP/1h/
+BTCUSD_PERP-1h-2020-08.zip', each next to its '.CHECKSUM', so that the
+store can in turn serve as a mirror. Only months not stored yet are
+downloaded, several at a time, and each archive is checked against the
+sha256 published with it before it is moved into place:
+
+    >>> data = get_klines("BTCUSD_PERP", "1h", "2020-08", "2021-03",
+    ...                   market="cm")
+
+The source is `setup.ARCHIVE_URL`, or `root_url`: an http(s) url, a
+file:// url or a directory.
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+import zipfile
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+import requests
+
+from ..fetcher import Fetcher
+from ..instrument import stage, count
+from ..utilities import imap_ordered, data_dir
+from .setup import ARCHIVE_URL, RATE_LIMIT_ARCHIVE, N_THREADS_ARCHIVE
+
+logger = logging.getLogger(__name__)
+
+# market -> directory of the archive
+MARKETS = {"spot": "spot", "um": "futures/um", "cm": "futures/cm"}
+
+# columns of the kline files, named as in `upstream.save_spot`
+KLINE_COLUMNS = [
+    "timestamp_open", "open", "high", "low", "close", "volume",
+    "timestamp_close", "quote_volume", "trades", "taker_buy_base_volume",
+    "taker_buy_quote_volume", "ignore"
+]
+
+# http fetcher shared by all threads; created on first use
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def archive_path(symbol: str, interval: str, month,
+                 market: str = "spot") -> str:
+    """Path of a monthly kline archive, relative to the archive root."""
+    name = f"{symbol}-{interval}-{pd.Period(month, freq='M')}.zip"
+
+    return "/".join([MARKETS[market], "monthly", "klines", symbol, interval,
+                     name])
+
+
+@stage
+def download_klines(symbol: str, interval: str, start, end=None,
+                    market: str = "spot", root_url: str = None,
+                    store: str = None, n_jobs: int = N_THREADS_ARCHIVE,
+                    checksum: bool = True, verify: bool = False) -> list:
+    """Download the monthly kline archives missing from the local store.
+
+    Months the source does not have, e.g. the current one, are skipped
+    with a warning.
+
+    Parameters
+    ----------
+    symbol : str
+        e.g. 'BTCUSDT' or 'BTCUSD_PERP'
+    interval : str
+        e.g. '1m' or '1h'
+    start, end : str or pandas.Period
+        first and last months, e.g. '2020-08'; `end` defaults to the last
+        complete month
+    market : str
+        'spot', 'um' (usdt-margined futures) or 'cm' (coin-margined)
+    root_url : str
+        source of the archives; `setup.ARCHIVE_URL` by default
+    store : str
+        local directory to keep archives in; 'data/raw/binance' by default
+    n_jobs : int
+        number of archives to download at the same time
+    checksum : bool
+        False to skip checking the archives, e.g. if a mirror lacks the
+        .CHECKSUM files
+    verify : bool
+        True to check the stored archives again too, and download anew
+        those that fail
+
+    Returns
+    -------
+    list
+        paths of the stored archives of the months the source has, in order
+    """
+    root_url = ARCHIVE_URL if root_url is None else root_url
+    store = os.path.join(data_dir(), "raw", "binance") if store is None \
+        else store
+
+    if end is None:
+        end = pd.Timestamp.now(tz="UTC").to_period("M") - 1
+    months = pd.period_range(start, end, freq="M")
+    paths = {m_: archive_path(symbol, interval, m_, market) for m_ in months}
+
+    todo = [m_ for m_ in months
+            if not _is_stored(os.path.join(store, paths[m_]),
+                              checksum and verify)]
+    count(cache_hits=len(months) - len(todo), cache_misses=len(todo))
+    logger.info(f"{symbol} {interval}: {len(months) - len(todo)} of "
+                f"{len(months)} months stored, downloading the rest...")
+
+    def download(month):
+        return _download(root_url, paths[month], store, checksum)
+
+    found = dict(zip(todo, imap_ordered(download, todo, n_jobs=n_jobs,
+                                        executor="thread")))
+
+    res = list()
+    for m_ in months:
+        if found.get(m_, True):
+            res.append(os.path.join(store, paths[m_]))
+        else:
+            logger.warning(f"{paths[m_]} not found at {root_url}, skipped")
+
+    return res
+
+
+def read_klines(paths) -> pd.DataFrame:
+    """Read monthly kline archives into one frame.
+
+    Handles files with and without a header row, and open and close times
+    in ms (all until 2025) or us (spot since 2025).
+
+    Returns
+    -------
+    pandas.DataFrame
+        indexed by 'timestamp_open', with the columns of `KLINE_COLUMNS`
+        but 'ignore'
+    """
+    data = [_read_archive(p_) for p_ in paths]
+    if len(data) == 0:
+        data = [pd.DataFrame(columns=KLINE_COLUMNS)]
+
+    data = pd.concat(data, axis=0, ignore_index=True)
+    count(rows_in=len(data))
+
+    for c_ in ["timestamp_open", "timestamp_close"]:
+        data[c_] = _from_epoch(data[c_].values.astype(np.int64))
+    data = data.drop(columns="ignore").set_index("timestamp_open")
+
+    return data
+
+
+@stage
+def get_klines(symbol: str, interval: str, start, end=None,
+               market: str = "spot", **kwargs) -> pd.DataFrame:
+    """Download what is missing of the klines of `symbol` and read them.
+
+    Parameters
+    ----------
+    symbol, interval, start, end, market
+        see `download_klines`
+    kwargs
+        other arguments to `download_klines`
+
+    Returns
+    -------
+    pandas.DataFrame
+        see `read_klines`
+    """
+    paths = download_klines(symbol, interval, start, end, market=market,
+                            **kwargs)
+
+    return read_klines(paths)
+
+
+def _download(root_url, path, store, checksum) -> bool:
+    """Copy one archive from `root_url` into `store`; False if the source
+    does not have it."""
+    content = _get(root_url, path)
+    if content is None:
+        return False
+
+    expected = None
+    if checksum:
+        expected = _get(root_url, path + ".CHECKSUM")
+        if expected is None:
+            raise ValueError(f"{path}.CHECKSUM not found at {root_url}; "
+                             f"pass checksum=False to do without")
+        if _sha256(content) != _parse_checksum(expected):
+            logger.warning(f"{path}: checksum mismatch, downloading again")
+            content = _get(root_url, path)
+            if content is None:
+                # gone from the source in the meantime
+                return False
+            if _sha256(content) != _parse_checksum(expected):
+                raise ValueError(f"{path}: checksum mismatch")
+
+    dest = os.path.join(store, path)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    _write_atomic(content, dest)
+    if expected is not None:
+        _write_atomic(expected, dest + ".CHECKSUM")
+    count(bytes_written=len(content))
+
+    return True
+
+
+def _get(root_url, path):
+    """Contents of `path` under `root_url`, None if it is not there."""
+    url = urlparse(root_url)
+    if url.scheme in ("http", "https"):
+        try:
+            res = _get_fetcher().get_content(f"{root_url.rstrip('/')}/{path}")
+        except requests.HTTPError as e:
+            if (e.response is not None) and (e.response.status_code == 404):
+                return None
+            raise
+        return res
+
+    local = url.path if url.scheme == "file" else root_url
+    try:
+        with open(os.path.join(local, *path.split("/")), "rb") as f:
+            res = f.read()
+    except FileNotFoundError:
+        return None
+    count(bytes_read=len(res))
+
+    return res
+
+
+def _get_fetcher() -> Fetcher:
+    global _fetcher
+
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = Fetcher(*RATE_LIMIT_ARCHIVE,
+                               pool_size=N_THREADS_ARCHIVE)
+
+    return _fetcher
+
+
+def _is_stored(path, verify: bool) -> bool:
+    checksum = path + ".CHECKSUM"
+    if not os.path.exists(path):
+        return False
+    if not verify:
+        return True
+    if not os.path.exists(checksum):
+        return False
+
+    with open(path, "rb") as f:
+        content = f.read()
+    with open(checksum, "rb") as f:
+        expected = f.read()
+
+    if _sha256(content) != _parse_checksum(expected):
+        logger.warning(f"{path}: checksum mismatch, to be downloaded again")
+        return False
+
+    return True
+
+
+def _read_archive(path) -> pd.DataFrame:
+    with zipfile.ZipFile(path) as z:
+        content = z.read(z.namelist()[0])
+    count(bytes_read=len(content))
+
+    # files published since 2022 start with a header row
+    has_header = not content[:1].isdigit()
+
+    return pd.read_csv(io.BytesIO(content), header=0 if has_header else None,
+                       names=KLINE_COLUMNS)
+
+
+def _from_epoch(t) -> pd.DatetimeIndex:
+    """Timestamps from integer epochs, each in ms or us by its magnitude."""
+    ns = np.where(t >= 10 ** 15, t * 10 ** 3, t * 10 ** 6)
+
+    return pd.to_datetime(ns, unit="ns")
+
+
+def _sha256(content) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def _parse_checksum(content) -> str:
+    """The hash of a .CHECKSUM file, '<sha256>  <file name>'."""
+    return content.decode().split()[0].lower()
+
+
+def _write_atomic(content, path) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(content)
+    os.replace(tmp, path)
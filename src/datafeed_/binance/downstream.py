@@ -1,10 +1,7 @@
 import pandas as pd
 import os
-import datetime
-from joblib import Memory
 
-cachedir = os.path.join(os.environ.get("PROJECT_ROOT"), "data/")
-memory = Memory(cachedir, verbose=0)
+from .archive import get_klines
 
 
 def get_funding_rate() -> pd.Series:
@@ -40,29 +37,37 @@ def get_funding_rate() -> pd.Series:
     return data
 
 
-@memory.cache
-def get_perpetual() -> pd.DataFrame:
-    root_url = "https://data.binance.vision/data/futures/cm/monthly/klines/" \
-               "BTCUSD_PERP/1h/"
-    ms = pd.period_range("2020-08", "2021-03", freq="M")
+def get_perpetual(symbol: str = "BTCUSD_PERP", interval: str = "1h",
+                  start="2020-08", end="2021-03", **kwargs) -> pd.DataFrame:
+    """Hourly bars of coin-margined perpetual contracts.
 
-    data = list()
-    for m in ms:
-        chunk = pd.read_csv(
-            root_url + f"BTCUSD_PERP-1h-{m}.zip",
-            compression="zip", index_col=0, header=None, parse_dates=True,
-            date_parser=lambda x: datetime.datetime.fromtimestamp(int(x)/1000)
-        )
-        chunk.columns = [
-            "Open", "High", "Low", "Close", "Volume",
-            "Close time", "Quote asset volume", "Number of trades",
-            "Taker buy base asset volume",
-            "Taker buy quote asset volume",
-            "Ignore"
-        ]
-        data.append(chunk)
+    Monthly archives are downloaded once into 'data/raw/binance', see
+    `archive.download_klines`.
 
-    data = pd.concat(data, axis=0)
+    Parameters
+    ----------
+    symbol : str
+    interval : str
+    start, end : str
+        first and last months, e.g. '2020-08'
+    kwargs
+        other arguments to `archive.download_klines`, e.g. `root_url` of a
+        local mirror
 
-    return data
+    Returns
+    -------
+    pandas.DataFrame
+        indexed by the open time, in UTC
+    """
+    data = get_klines(symbol, interval, start, end, market="cm", **kwargs)
+
+    data.index.name = None
+    data = data.rename(columns={
+        "open": "Open", "high": "High", "low": "Low", "close": "Close",
+        "volume": "Volume", "timestamp_close": "Close time",
+        "quote_volume": "Quote asset volume", "trades": "Number of trades",
+        "taker_buy_base_volume": "Taker buy base asset volume",
+        "taker_buy_quote_volume": "Taker buy quote asset volume"
+    })
 
+    return data
@@ -0,0 +1,13 @@
+import os
+
+# root of the public data archive, https://data.binance.vision; can be
+# pointed at a local mirror of the same layout, a directory or a file:// url
+ARCHIVE_URL = os.environ.get(
+    "BINANCE_ARCHIVE_URL", "https://data.binance.vision/data"
+)
+
+# the archive is served from a cdn without a documented limit; stay polite
+RATE_LIMIT_ARCHIVE = (10.0, 10)
+
+# number of archives to download at the same time
+N_THREADS_ARCHIVE = 8
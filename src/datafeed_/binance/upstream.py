@@ -1,17 +1,35 @@
 import pandas as pd
 import numpy as np
 import datetime
-from joblib import Memory
 import os
+import logging
 
-data_dir = os.path.join(os.environ.get("PROJECT_ROOT"), "data/")
-memory = Memory(data_dir, verbose=0)
+from ..instrument import stage, count
+from ..storage import (write_partitions, read_last_partitions, read_dataset,
+                       make_filter, make_month_filter, partition_keys)
+from ..utilities import data_dir
+from .archive import KLINE_COLUMNS
 
+logger = logging.getLogger(__name__)
 
-@memory.cache(ignore=["save"])
+
+def klines_path(kline_size="1m") -> str:
+    """Dataset of the spot klines of `kline_size`, partitioned by symbol and
+    month."""
+    return os.path.join(data_dir(), "prepared", "spot", "binance",
+                        f"klines-{kline_size}")
+
+
+@stage
 def save_spot(symbol="BTCUSDT", kline_size="1m", save=True, **kwargs):
     """Query historical data from binance spot market.
 
+    Klines are kept in a parquet dataset partitioned by symbol and month,
+    see `klines_path`. Only klines from the last stored one on are queried;
+    that one, possibly incomplete when stored, is overwritten, and only the
+    partitions of the months queried are rewritten. On the first run, the
+    '{symbol}_{kline_size}.csv' of earlier versions, if any, is taken over.
+
     Parameters
     ----------
     symbol: str
@@ -28,23 +46,20 @@ def save_spot(symbol="BTCUSDT", kline_size="1m", save=True, **kwargs):
     Returns
     -------
     data: pd.DataFrame
-        with OHLC bars sampled at 'kline_size' frequency.
-        The data also includes volume, volume of market orders and number of
-        trades
+        the klines queried, with OHLC bars sampled at 'kline_size'
+        frequency. The data also includes volume, volume of market orders
+        and number of trades; `read_spot` reads all of them
 
     """
-    filename = "{}_{}.csv".format(symbol, kline_size)
-    # Try to reach the file in the data directory
-    try:
-        data = pd.read_csv(os.path.join(data_dir, filename),
-                           header=0, index_col=0,
-                           parse_dates=True)
-    except FileNotFoundError:
-        data = pd.DataFrame()
-
-    # If the data is not empty locate the last open timestamp, else query all
-    if len(data) > 0:
-        s_dt = data.index[-1]
+    path = klines_path(kline_size)
+
+    if save and (symbol not in partition_keys(path, "symbol")):
+        _take_over_csv(symbol, kline_size)
+
+    # Locate the last open timestamp, else query all
+    last = read_last_partitions(path, "symbol", keys=[symbol])
+    if len(last) > 0:
+        s_dt = last["timestamp"].max().tz_localize(None)
     else:
         s_dt = datetime.datetime.strptime("2017-01-01", "%Y-%m-%d")
 
@@ -62,37 +77,92 @@ def save_spot(symbol="BTCUSDT", kline_size="1m", save=True, **kwargs):
     klines = CLIENT.get_historical_klines(
         symbol=symbol, interval=kline_size, **kwargs
     )
+    count(rows_in=len(klines))
 
-    new_data = pd.DataFrame(
-        klines,
-        columns=["timestamp_open", "open", "high", "low", "close", "volume",
-                 "timestamp_close", "quote_volume", "trades",
-                 "taker_buy_base_volume", "taker_buy_quote_volume",
-                 "ignore"]
-        )
+    new_data = pd.DataFrame(klines, columns=KLINE_COLUMNS)
 
     for c in ["open", "high", "low", "close", "volume", "quote_volume",
               "taker_buy_base_volume", "taker_buy_quote_volume"]:
-        new_data.loc[:, c] = new_data.loc[:, c].astype(np.float32)
+        new_data[c] = new_data[c].astype(np.float32)
 
     for c in ["timestamp_open", "timestamp_close"]:
-        new_data.loc[:, c] = pd.to_datetime(new_data.loc[:, c], unit="ms")
+        new_data[c] = pd.to_datetime(new_data[c], unit="ms")
 
     new_data.set_index("timestamp_open", inplace=True)
 
-    if len(data) > 0:
-        # Drop duplicate index from the old data, the last candle there might
-        # be incomplete
-        common_idx = new_data.index.intersection(data.index)
-        data.drop(common_idx, axis=0, inplace=True)
+    if save and (len(new_data) > 0):
+        _write_klines(new_data, symbol, kline_size)
 
-        # Concatenate and dump and/or return
-        data = pd.concat([data, new_data], axis=0, verify_integrity=True)
-    else:
-        data = new_data
+    return new_data
+
+
+def read_spot(symbol="BTCUSDT", kline_size="1m", start=None, end=None,
+              columns: list = None) -> pd.DataFrame:
+    """Read klines stored by `save_spot`.
+
+    Only the month partitions of `symbol` between `start` and `end` are
+    opened.
+
+    Parameters
+    ----------
+    symbol : str
+    kline_size : str
+    start, end : str or pandas.Timestamp
+        inclusive bounds on the open time, as in `storage.make_filter`
+    columns : list
+        columns to read besides the open time, all by default
 
-    if save:
-        # TODO: bad practice, use os.path.join to avoid problems w/slashes
-        data.to_csv(os.path.join(data_dir, filename))
+    Returns
+    -------
+    pandas.DataFrame
+        indexed by 'timestamp_open', naive UTC, as returned by `save_spot`
+    """
+    filter_ = make_filter("timestamp", start, end, symbol=[symbol])
+    months = make_month_filter(start, end)
+    if months is not None:
+        filter_ = filter_ & months
+
+    if columns is not None:
+        columns = ["timestamp"] + list(columns)
+
+    data = read_dataset(klines_path(kline_size), columns=columns,
+                        filter=filter_, partition_col="symbol")
+    if "symbol" in data.columns:
+        data = data.drop(columns="symbol")
+
+    data["timestamp"] = data["timestamp"].dt.tz_localize(None)
+    data = data.rename(columns={"timestamp": "timestamp_open"})\
+        .set_index("timestamp_open")\
+        .sort_index()
 
     return data
+
+
+def _write_klines(data, symbol, kline_size) -> None:
+    """Merge klines into the dataset, new ones winning duplicates."""
+    data = data.drop(columns="ignore", errors="ignore")\
+        .rename_axis("timestamp")\
+        .reset_index()
+    data["timestamp"] = data["timestamp"].dt.tz_localize("UTC")
+    data.insert(0, "symbol", symbol)
+
+    written = write_partitions(data, klines_path(kline_size), "symbol",
+                               subset=["timestamp"], keep="last")
+    logger.info(f"{symbol} {kline_size}: wrote {len(data)} klines to "
+                f"{len(written)} month partitions")
+
+
+def _take_over_csv(symbol, kline_size) -> None:
+    """Move the klines of a .csv written by earlier versions to the
+    dataset."""
+    filename = os.path.join(data_dir(),
+                            "{}_{}.csv".format(symbol, kline_size))
+    if not os.path.exists(filename):
+        return
+
+    logger.info(f"taking over {filename}")
+    data = pd.read_csv(filename, header=0, index_col=0, parse_dates=True)
+    count(rows_in=len(data))
+    data["timestamp_close"] = pd.to_datetime(data["timestamp_close"])
+
+    _write_klines(data, symbol, kline_size)
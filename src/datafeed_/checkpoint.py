@@ -0,0 +1,262 @@
+import json
+import os
+import logging
+import re
+
+from .instrument import count
+
+logger = logging.getLogger(__name__)
+
+# cursors at the start of a line, as written by `PageLog.append`
+_HEADER = re.compile(rb'^\{"since": ([^,]+), "next": ([^,]+),')
+
+_STATE_SUFFIX = ".state.jsonl"
+
+
+class PageLog:
+    """Append-only log of API pages, one JSON line per page.
+
+    Each line is {"since": cursor, "next": cursor, "records": [...]}, with
+    the `next` cursor of a page being the `since` cursor of the one after
+    it. A line counts as committed once it is written in full and fsynced;
+    a line torn by a crash is dropped when the log is opened.
+
+    Pages are not held in memory: opening a log reads its last line only,
+    and `pages` streams them from the file.
+
+    Parameters
+    ----------
+    path : str
+        path to the .jsonl file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.first_cursor = None
+        self.last_cursor = None
+
+        if os.path.exists(path):
+            self._open()
+
+    def __len__(self) -> int:
+        """Number of pages, counting lines without parsing them."""
+        if not os.path.exists(self.path):
+            return 0
+
+        with open(self.path, "rb") as f:
+            return sum(chunk.count(b"\n")
+                       for chunk in iter(lambda: f.read(1 << 20), b""))
+
+    def _open(self) -> None:
+        size = os.path.getsize(self.path)
+        committed = size
+
+        with open(self.path, "rb") as f:
+            while committed > 0:
+                line, begin = _last_line(f, committed)
+                try:
+                    page = json.loads(line) if line.endswith(b"\n") \
+                        else None
+                except ValueError:
+                    page = None
+                if page is not None:
+                    break
+                committed = begin
+
+        # drop the torn tail, if any
+        if committed < size:
+            logger.warning(f"truncating uncommitted page in {self.path}")
+            with open(self.path, "r+b") as f:
+                f.truncate(committed)
+
+        if committed > 0:
+            self.last_cursor = page["next"]
+            with open(self.path, "rb") as f:
+                self.first_cursor = _cursors(f.readline())[0]
+
+    def pages(self, start=None):
+        """Yield the pages ending after cursor `start`, all by default.
+
+        Only the cursors of the pages before `start` are parsed.
+        """
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "rb") as f:
+            for line in f:
+                if (start is not None) and (_cursors(line)[1] <= start):
+                    continue
+                yield json.loads(line)
+
+    def append(self, since, next_, records) -> None:
+        """Commit one page."""
+        line = json.dumps({"since": since, "next": next_,
+                           "records": records}) + "\n"
+        with open(self.path, "a") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+        if self.first_cursor is None:
+            self.first_cursor = since
+        self.last_cursor = next_
+
+
+class PageStore:
+    """Checkpointed pages of cursor-paginated API pulls.
+
+    Pages are kept in one `PageLog` per asset and starting cursor, in files
+    '<asset>-<since>.jsonl' under `path`. A pull starting within the range
+    covered by an existing log resumes from its last committed cursor, so
+    that an interrupted or extended backfill only fetches the new tail.
+
+    Next to each log, '<asset>-<since>.state.jsonl' can keep what has been
+    made of its pages so far, e.g. aggregated bars, one line per page, see
+    `state_log`: with it, an extended backfill only processes the new tail
+    as well.
+
+    Parameters
+    ----------
+    path : str
+        directory to keep the logs in; created if missing
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _logs(self, asset) -> list:
+        """Logs of `asset`, indexed by their first and last cursors."""
+        fs = [f_ for f_ in os.listdir(self.path)
+              if f_.startswith(f"{asset}-") and f_.endswith(".jsonl") and
+              not f_.endswith(_STATE_SUFFIX)]
+
+        return [PageLog(os.path.join(self.path, f_)) for f_ in sorted(fs)]
+
+    def _find_log(self, asset, start) -> PageLog:
+        """Find the log covering `start`, or create a new one."""
+        for log_ in self._logs(asset):
+            if (log_.first_cursor is not None) and \
+                    (log_.first_cursor <= start <= log_.last_cursor):
+                return log_
+
+        return PageLog(os.path.join(self.path, f"{asset}-{start}.jsonl"))
+
+    def state_log(self, asset, start) -> PageLog:
+        """Log of the state of the pages of the log `start` is in.
+
+        Each line of it is the state after one page, with the cursors of
+        that page, the way `pages` yields it: the `last_cursor` of the state
+        log is that of the last page accounted for, to pass on as `after`.
+        A state log lagging behind the pages, e.g. after a crash between
+        the two appends, is caught up by the pages after it; one ahead of
+        them, i.e. of pages since dropped, is removed.
+        """
+        log = self._find_log(asset, start)
+        res = PageLog(log.path[:-len(".jsonl")] + _STATE_SUFFIX)
+
+        if (res.last_cursor is not None) and \
+                ((log.last_cursor is None) or
+                 (res.last_cursor > log.last_cursor)):
+            logger.warning(f"removing {res.path}, ahead of its pages")
+            os.remove(res.path)
+            res = PageLog(res.path)
+
+        return res
+
+    def pages(self, asset, start, end, fetch_page, cursor_of=None,
+              after=None):
+        """Yield pages from `start` until one reaches past `end`.
+
+        Stored pages are replayed first, read from the log one at a time;
+        the rest are fetched with `fetch_page` and committed one by one.
+        Pages are yielded as they come, so that callers can process them
+        without holding the whole range in memory.
+
+        Parameters
+        ----------
+        asset : str
+        start : int or float
+            cursor to start from
+        end : int or float
+            cursor to stop at: pages are fetched while the cursor is below it
+        fetch_page : callable
+            cursor -> (list of records, next cursor)
+        cursor_of : callable, optional
+            record -> its cursor, to skip records of the first stored page
+            preceding `start`
+        after : int or float, optional
+            cursor of a stored page up to which pages have been processed
+            before, e.g. the `last_cursor` of `state_log`: only stored
+            pages ending after it are replayed
+
+        Yields
+        ------
+        dict
+            {'since': cursor, 'next': cursor, 'records': list}, in the
+            order of pages
+        """
+        log = self._find_log(asset, start)
+        t = start if after is None else max(start, after)
+
+        # replay committed pages
+        for page in log.pages(t):
+            if t >= end:
+                break
+            if (page["since"] < start) and (cursor_of is not None):
+                page["records"] = [r_ for r_ in page["records"]
+                                   if cursor_of(r_) >= start]
+            t = page["next"]
+            count(pages_replayed=1)
+            yield page
+
+        if t > start:
+            logger.info(f"{asset}: resuming from cursor {t}")
+
+        # fetch the rest
+        while t < end:
+            records, t_next = fetch_page(t)
+            log.append(t, t_next, records)
+            count(pages_fetched=1)
+            yield {"since": t, "next": t_next, "records": records}
+            if t_next <= t:
+                break
+            t = t_next
+
+    def paginate(self, asset, start, end, fetch_page, cursor_of=None):
+        """Yield the records of pages from `start` until one reaches past
+        `end`, see `pages`.
+
+        Yields
+        ------
+        list
+            records of a page, in the order of pages
+        """
+        for page in self.pages(asset, start, end, fetch_page, cursor_of):
+            yield page["records"]
+
+
+def _cursors(line) -> tuple:
+    """(since, next) of a line, parsing the records only if need be."""
+    m = _HEADER.match(line)
+    if m is not None:
+        return json.loads(m.group(1)), json.loads(m.group(2))
+
+    page = json.loads(line)
+
+    return page["since"], page["next"]
+
+
+def _last_line(f, end, block: int = 1 << 16) -> (bytes, int):
+    """The line ending at byte `end` of file `f`, and where it begins."""
+    begin = end
+    tail = b""
+    while begin > 0:
+        n = min(block, begin)
+        f.seek(begin - n)
+        tail = f.read(n) + tail
+        begin -= n
+        # a newline before the last byte ends the line before
+        i = tail.rfind(b"\n", 0, len(tail) - 1)
+        if i >= 0:
+            return tail[i + 1:], begin + i + 1
+
+    return tail, 0
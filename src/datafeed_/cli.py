@@ -0,0 +1,388 @@
+"""Command line of the data feeds, `python -m src.datafeed_ --help`.
+
+    status  what is prepared, checkpointed and cached
+    build   prepare Kraken data from the raw files, see `kraken.stages`
+    fetch   pull a full history from an API
+    update  append the latest Kraken data from the API
+    load    read prepared Kraken data
+
+Only the standard library is imported up front: subcommands import the
+modules they need when they run, after PROJECT_ROOT has been resolved
+(from --root, the environment or the .env file), and `status` does not
+import pandas at all. `build`, `fetch` and `update` hold a lock in
+data/checkpoints, so that scheduled runs do not overlap: a run finding it
+taken exits with `EXIT_BUSY`.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# exit statuses other than 0
+EXIT_FAILED = 1
+EXIT_BUSY = 75
+
+# (exchange, data) -> module of the exchange, function pulling the history
+FETCHERS = {
+    ("kraken", "spot"): ("kraken.upstream", "save_spot_from_api"),
+    ("kraken", "funding"): ("kraken.upstream", "save_funding_rates"),
+    ("binance", "spot"): ("binance.upstream", "save_spot"),
+    ("okex", "perpetual"): ("okex.upstream", "save_perpetual"),
+}
+
+STAGES = ["spot", "funding", "perpetual"]
+
+
+def main(argv=None) -> int:
+    parser = _make_parser()
+    args = parser.parse_args(argv)
+
+    unknown = set(getattr(args, "stages", list())).difference(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    level = logging.DEBUG if args.verbose else \
+        logging.WARNING if args.quiet else logging.INFO
+    logging.basicConfig(format="%(asctime)s: %(message)s",
+                        datefmt="%m/%d/%Y %I:%M:%S %p", level=level,
+                        handlers=[logging.StreamHandler()])
+
+    root = _project_root(args.root)
+    if root is None:
+        parser.error("PROJECT_ROOT is not set: pass --root, export it or "
+                     "put it into the .env file")
+    os.environ["PROJECT_ROOT"] = root
+
+    if args.command in ("build", "fetch", "update"):
+        with _lock(os.path.join(root, "data", "checkpoints")) as acquired:
+            if not acquired:
+                logger.warning("another run holds the lock, exiting")
+                return EXIT_BUSY
+            with _recorder(args, root):
+                return args.func(args)
+
+    return args.func(args)
+
+
+def _make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.datafeed_",
+        description="Fetch, prepare and load crypto price data."
+    )
+    parser.add_argument("--root", help="project root; PROJECT_ROOT by "
+                                       "default")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument("-q", "--quiet", action="store_true")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    status = commands.add_parser("status", help="what is prepared, "
+                                                "checkpointed and cached")
+    status.add_argument("--json", action="store_true",
+                        help="print JSON instead of a table")
+    status.set_defaults(func=_status)
+
+    build = commands.add_parser("build", help="prepare Kraken data from "
+                                              "the raw files")
+    build.add_argument("stages", nargs="*",
+                       help=f"of {', '.join(STAGES)}; all by default")
+    build.add_argument("--force", action="store_true",
+                       help="run the stages even if up to date")
+    build.add_argument("--dry-run", action="store_true",
+                       help="only print what would run and why")
+    build.add_argument("--streaming", action="store_true",
+                       help="process perpetual trades in one pass")
+    build.add_argument("--stage-jobs", type=int, default=1,
+                       help="number of processes to parse the raw files "
+                            "of a stage with")
+    build.set_defaults(func=_build)
+
+    fetch = commands.add_parser("fetch", help="pull a full history from "
+                                              "an API")
+    fetch.add_argument("data", choices=sorted({d_ for _, d_ in FETCHERS}))
+    fetch.add_argument("--exchange", default="kraken",
+                       choices=sorted({e_ for e_, _ in FETCHERS}))
+    fetch.add_argument("--symbol", nargs="+",
+                       help="symbols, e.g. BTCUSDT, for binance and okex")
+    fetch.set_defaults(func=_fetch)
+
+    update = commands.add_parser("update", help="append the latest Kraken "
+                                                "data from the API")
+    update.add_argument("stages", nargs="*",
+                        help=f"of {', '.join(STAGES)}; all by default")
+    update.set_defaults(func=_update)
+
+    for p_ in (build, fetch, update):
+        p_.add_argument("--storage", default="feather",
+                        choices=["feather", "partitioned"])
+        p_.add_argument("--jobs", type=int, default=-1,
+                        help="number of stages to run at the same time")
+        p_.add_argument("--report",
+                        help="where to write the timing and memory report, "
+                             "relative to the project root")
+        p_.add_argument("--profile", help="where to dump cProfile stats")
+
+    load = commands.add_parser("load", help="read prepared Kraken data")
+    load.add_argument("data", choices=STAGES)
+    load.add_argument("--assets", nargs="+")
+    load.add_argument("--start")
+    load.add_argument("--end")
+    load.add_argument("--mid", action="store_true",
+                      help="mid quotes of perpetuals")
+    load.add_argument("--no-cache", action="store_true",
+                      help="read from the prepared data, not the panels")
+    load.add_argument("--output",
+                      help=".csv, .parquet or .ftr file to write to; a "
+                           "summary is printed otherwise")
+    load.set_defaults(func=_load)
+
+    return parser
+
+
+def _status(args) -> int:
+    data_dir = os.path.join(os.environ["PROJECT_ROOT"], "data")
+
+    res = {"root": os.environ["PROJECT_ROOT"], "prepared": list(),
+           "checkpoints": list(), "caches": list(), "stages": dict()}
+
+    prepared = os.path.join(data_dir, "prepared")
+    for which_ in sorted(_listdir(prepared)):
+        for exchange_ in sorted(_listdir(os.path.join(prepared, which_))):
+            path_ = os.path.join(prepared, which_, exchange_)
+            for name_ in sorted(_listdir(path_)):
+                if name_.endswith(".tmp"):
+                    continue
+                res["prepared"].append(
+                    {"name": f"{which_}/{exchange_}/{name_}",
+                     **_disk_usage(os.path.join(path_, name_))}
+                )
+
+    checkpoints = os.path.join(data_dir, "checkpoints")
+    for d_, _, fs in sorted(os.walk(checkpoints)):
+        logs = [f_ for f_ in fs if f_.endswith(".jsonl")]
+        if not logs:
+            continue
+        res["checkpoints"].append({
+            "name": os.path.relpath(d_, checkpoints), "logs": len(logs),
+            "pages": sum(_count_lines(os.path.join(d_, f_)) for f_ in logs),
+            **_disk_usage(d_)
+        })
+
+    for name_ in ["joblib", "panels"]:
+        if os.path.exists(os.path.join(data_dir, name_)):
+            res["caches"].append(
+                {"name": name_, **_disk_usage(os.path.join(data_dir, name_))}
+            )
+
+    for f_ in sorted(_listdir(checkpoints)):
+        if f_.startswith("pipeline-") and f_.endswith(".json"):
+            with open(os.path.join(checkpoints, f_)) as f:
+                state = json.load(f)
+            res["stages"][f_[9:-5]] = {
+                "last_built": _isotime(os.path.getmtime(
+                    os.path.join(checkpoints, f_))),
+                "stages": sorted(state)
+            }
+
+    if args.json:
+        print(json.dumps(res, indent=2))
+        return 0
+
+    print(f"project root: {res['root']}")
+    for key_ in ["prepared", "checkpoints", "caches"]:
+        print(f"\n{key_}:")
+        if not res[key_]:
+            print("  none")
+        for r_ in res[key_]:
+            extra = f", {r_['pages']} pages in {r_['logs']} logs" \
+                if "pages" in r_ else ""
+            print(f"  {r_['name']:<48} {r_['mb']:>10.1f} MB  "
+                  f"{r_['modified'] or '':<20}{extra}")
+    for name_, s_ in res["stages"].items():
+        print(f"\n{name_} stages built: {', '.join(s_['stages'])} "
+              f"(last {s_['last_built']})")
+
+    return 0
+
+
+def _build(args) -> int:
+    from .kraken.stages import make_pipeline
+
+    pipeline = make_pipeline(storage=args.storage, streaming=args.streaming,
+                             n_jobs=args.jobs, stage_jobs=args.stage_jobs)
+
+    if args.dry_run:
+        for name_, reason_ in pipeline.plan(force=args.force).items():
+            if (not args.stages) or (name_ in args.stages):
+                print(f"{name_}: {reason_}")
+        return 0
+
+    return _report_status(pipeline.run(force=args.force,
+                                       only=args.stages or None))
+
+
+def _update(args) -> int:
+    from .kraken.stages import make_update_pipeline
+
+    pipeline = make_update_pipeline(storage=args.storage, n_jobs=args.jobs)
+
+    return _report_status(pipeline.run(only=args.stages or None))
+
+
+def _fetch(args) -> int:
+    import importlib
+
+    key = (args.exchange, args.data)
+    if key not in FETCHERS:
+        logger.error(f"cannot fetch {args.data} from {args.exchange}; "
+                     f"available: {sorted(FETCHERS)}")
+        return EXIT_FAILED
+
+    module, name = FETCHERS[key]
+    func = getattr(importlib.import_module(f".{module}", __package__), name)
+
+    if args.exchange == "kraken":
+        func(storage=args.storage)
+        return 0
+
+    if not args.symbol:
+        logger.error(f"pass the symbols to fetch from {args.exchange} with "
+                     f"--symbol")
+        return EXIT_FAILED
+
+    for s_ in args.symbol:
+        func(s_)
+
+    return 0
+
+
+def _load(args) -> int:
+    import pandas as pd
+    from .kraken import downstream
+
+    kwargs = {"assets": args.assets, "start": args.start, "end": args.end}
+
+    if args.data == "perpetual":
+        res = downstream.get_perpetual(mid=args.mid, cache=not args.no_cache,
+                                       **kwargs)
+    elif args.data == "spot":
+        res = downstream.get_spot(cache=not args.no_cache, **kwargs)
+    else:
+        res = downstream.get_funding_rates(**kwargs)
+
+    if args.output is None:
+        print(res)
+        return 0
+
+    ext = os.path.splitext(args.output)[1]
+    if not isinstance(res.index, pd.RangeIndex):
+        res = res.reset_index()
+    res.columns = ["_".join(map(str, c_)) if isinstance(c_, tuple) else c_
+                   for c_ in res.columns]
+    if ext == ".csv":
+        res.to_csv(args.output, index=False)
+    elif ext == ".parquet":
+        res.to_parquet(args.output, index=False)
+    elif ext == ".ftr":
+        res.to_feather(args.output)
+    else:
+        logger.error(f"unknown format '{ext}'")
+        return EXIT_FAILED
+
+    logger.info(f"{len(res)} rows written to {args.output}")
+
+    return 0
+
+
+def _report_status(status) -> int:
+    for name_, status_ in status.items():
+        logger.info(f"{name_}: {status_}")
+
+    if any(s_ in ("failed", "blocked") for s_ in status.values()):
+        return EXIT_FAILED
+
+    return 0
+
+
+def _project_root(root=None):
+    if root is not None:
+        return os.path.abspath(root)
+    if os.environ.get("PROJECT_ROOT"):
+        return os.environ["PROJECT_ROOT"]
+
+    try:
+        from dotenv import find_dotenv, load_dotenv
+    except ImportError:
+        return None
+    load_dotenv(find_dotenv(usecwd=True))
+
+    return os.environ.get("PROJECT_ROOT")
+
+
+@contextlib.contextmanager
+def _lock(path):
+    """Hold an exclusive lock on a file in `path`, if no one else does."""
+    import fcntl
+
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "datafeed.lock"), "w") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        f.write(str(os.getpid()))
+        f.flush()
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _recorder(args, root):
+    if (args.report is None) and (args.profile is None):
+        return contextlib.nullcontext()
+
+    from .instrument import Recorder
+
+    report = None if args.report is None \
+        else os.path.join(root, args.report)
+
+    return Recorder(report, profile=args.profile)
+
+
+def _listdir(path) -> list:
+    return os.listdir(path) if os.path.isdir(path) else list()
+
+
+def _disk_usage(path) -> dict:
+    """Size in MB, number of files and last modification of a path."""
+    if not os.path.isdir(path):
+        stat = os.stat(path)
+        return {"mb": stat.st_size / 2 ** 20, "files": 1,
+                "modified": _isotime(stat.st_mtime)}
+
+    size, n, mtime = 0, 0, None
+    for d_, _, fs in os.walk(path):
+        for f_ in fs:
+            stat = os.stat(os.path.join(d_, f_))
+            size += stat.st_size
+            n += 1
+            mtime = stat.st_mtime if mtime is None \
+                else max(mtime, stat.st_mtime)
+
+    return {"mb": size / 2 ** 20, "files": n,
+            "modified": None if mtime is None else _isotime(mtime)}
+
+
+def _count_lines(path) -> int:
+    with open(path, "rb") as f:
+        return sum(chunk.count(b"\n")
+                   for chunk in iter(lambda: f.read(1 << 20), b""))
+
+
+def _isotime(t) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t))
@@ -0,0 +1,206 @@
+import threading
+import time
+import logging
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .instrument import count
+
+logger = logging.getLogger(__name__)
+
+# statuses worth retrying: rate limited or temporarily unavailable
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter.
+
+    Tokens are replenished continuously at `rate` per second up to
+    `capacity`; a caller reserves its tokens under a lock and then sleeps
+    until they have accrued, so concurrent callers are served in order.
+
+    Parameters
+    ----------
+    rate : float
+        tokens per second
+    capacity : float
+        maximum number of tokens, i.e. the size of a burst
+    """
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._t = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Block until `tokens` are available; return the time waited."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity,
+                               self._tokens + (now - self._t) * self.rate)
+            self._t = now
+            self._tokens -= tokens
+            wait = max(-self._tokens / self.rate, 0.0)
+
+        if wait > 0:
+            time.sleep(wait)
+
+        return wait
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take `tokens` if available, without blocking."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity,
+                               self._tokens + (now - self._t) * self.rate)
+            self._t = now
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+
+        return True
+
+
+class Fetcher:
+    """Pooled, rate-limited fetcher of JSON with retries.
+
+    One keep-alive `requests.Session` is shared by all threads using the
+    fetcher; every attempt, retries included, takes a token from the bucket,
+    so the request rate never exceeds the allowance of the exchange.
+
+    Parameters
+    ----------
+    rate : float
+        requests per second
+    burst : int
+        maximum number of requests in a burst
+    max_retries : int
+        number of retries after a failed attempt
+    backoff : float
+        seconds to wait before the first retry, doubled with every next one
+        (unless the server sends 'Retry-After')
+    pool_size : int
+        number of connections kept alive per host
+    timeout : float
+        seconds to wait for the server
+    """
+    def __init__(self, rate: float, burst: int = 1, max_retries: int = 5,
+                 backoff: float = 1.0, pool_size: int = 10,
+                 timeout: float = 30.0):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.n_requests = 0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+
+    def get_json(self, url: str, params: dict = None):
+        """GET `url` and return the decoded JSON.
+
+        Kraken reports rate limiting in the body of a 200 response
+        ('EAPI:Rate limit exceeded', 'EGeneral:Too many requests' on spot,
+        'apiLimitExceeded' on futures), OKEx with code '50011'; those
+        responses are retried just like 429s.
+        """
+        def decode(resp):
+            res = resp.json()
+            if _is_rate_limited(res):
+                raise requests.HTTPError(
+                    f"rate limited: {res.get('error') or res.get('msg')}",
+                    response=resp
+                )
+            return res
+
+        return self._get(url, params, decode)
+
+    def get_content(self, url: str, params: dict = None) -> bytes:
+        """GET `url` and return the body as is, e.g. of a file."""
+        return self._get(url, params, lambda resp: resp.content)
+
+    def _get(self, url, params, decode):
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            with self._lock:
+                self.n_requests += 1
+            count(http_requests=1)
+
+            retry_after = None
+            try:
+                resp = self.session.get(url, params=params,
+                                        timeout=self.timeout)
+                if resp.status_code in RETRY_STATUSES:
+                    retry_after = resp.headers.get("Retry-After")
+                    raise requests.HTTPError(
+                        f"{resp.status_code} for {resp.url}", response=resp
+                    )
+                resp.raise_for_status()
+                count(bytes_read=len(resp.content))
+                return decode(resp)
+
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.HTTPError) as e:
+                is_final = (attempt == self.max_retries)
+                is_fatal = isinstance(e, requests.HTTPError) and \
+                    (e.response is not None) and \
+                    (e.response.status_code not in RETRY_STATUSES) and \
+                    (e.response.status_code != 200)
+                if is_final or is_fatal:
+                    raise
+
+                wait = _seconds_until(retry_after)
+                if wait is None:
+                    wait = self.backoff * 2 ** attempt
+                logger.warning(f"{e}; retrying in {wait:.1f} sec...")
+                time.sleep(wait)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def _seconds_until(retry_after):
+    """Seconds to wait by a Retry-After header, either seconds or an
+    HTTP date; None if missing or unreadable."""
+    if retry_after is None:
+        return None
+
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        t = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if t is None:
+        return None
+    if t.tzinfo is None:
+        # '-0000': UTC, by RFC 5322
+        t = t.replace(tzinfo=timezone.utc)
+
+    return max(t.timestamp() - time.time(), 0.0)
+
+
+def _is_rate_limited(res) -> bool:
+    """Check if a Kraken or OKEx response body reports rate limiting."""
+    if not isinstance(res, dict):
+        return False
+    if res.get("code") == "50011":
+        return True
+    errors = res.get("error") or []
+    if isinstance(errors, str):
+        errors = [errors]
+
+    return any(("Rate limit" in e_) or ("Too many requests" in e_) or
+               ("apiLimitExceeded" in e_) for e_ in errors)
@@ -0,0 +1,255 @@
+"""Timing, memory and I/O counts of the stages of the data pipeline.
+
+Functions decorated with `stage` are recorded while a `Recorder` is
+active, e.g.
+
+    >>> with Recorder("report.json", profile="run.prof"):
+    ...     save_spot_from_ohlcv()
+
+Each call becomes a record with its wall time, the peak RSS while it ran,
+the rows it returned and the counters that the code below it adds to with
+`count`: 'rows_in', 'rows_out', 'bytes_read', 'bytes_written',
+'cache_hits', 'cache_misses', 'http_requests', 'pages_fetched',
+'pages_replayed', 'rows_late'. Counters add up to all enclosing stages,
+including those of threads started through `utilities.imap_ordered`;
+stages run in worker processes are not recorded.
+
+Without an active recorder, `stage` and `count` do next to nothing.
+"""
+import cProfile
+import functools
+import inspect
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextvars import ContextVar
+
+import pandas as pd
+
+# names of arguments identifying the asset a stage is about
+ASSET_ARGS = ("currency", "asset", "symbol", "c")
+
+_recorder = None
+_current = ContextVar("stage", default=None)
+
+
+class _Stage:
+    def __init__(self, name, asset, parent):
+        self.name = name
+        self.asset = asset
+        self.parent = parent
+        self.counters = dict()
+        self.peak_rss = 0
+        self.lock = threading.Lock()
+
+    def add(self, counters) -> None:
+        stage = self
+        while stage is not None:
+            with stage.lock:
+                for k_, v_ in counters.items():
+                    stage.counters[k_] = stage.counters.get(k_, 0) + v_
+            stage = stage.parent
+
+
+class Recorder:
+    """Records the stages run while it is active.
+
+    Parameters
+    ----------
+    path : str
+        .json file to write the report to on exit; None to only keep it
+        in `report`
+    profile : str
+        file to dump cProfile stats of the calling thread to, readable
+        with `pstats`; None not to profile
+    interval : float
+        seconds between samples of the RSS
+
+    Attributes
+    ----------
+    records : list
+        of dicts, one per stage call, in the order they finished
+    """
+    def __init__(self, path=None, profile=None, interval: float = 0.02):
+        self.path = path
+        self.profile = profile
+        self.interval = interval
+        self.records = list()
+
+        self._open = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._profiler = None
+        self._t0 = None
+        self._started = None
+        self._peak_rss = 0
+
+    def __enter__(self):
+        global _recorder
+        if _recorder is not None:
+            raise RuntimeError("a recorder is active already")
+        _recorder = self
+
+        self._t0 = time.perf_counter()
+        self._started = pd.Timestamp.now(tz="UTC")
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+
+        if self.profile is not None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+        return self
+
+    def __exit__(self, *args):
+        global _recorder
+
+        if self._profiler is not None:
+            self._profiler.disable()
+            os.makedirs(os.path.dirname(os.path.abspath(self.profile)),
+                        exist_ok=True)
+            self._profiler.dump_stats(self.profile)
+
+        self._stop.set()
+        self._sampler.join()
+        _recorder = None
+
+        if self.path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)),
+                        exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump(self.report(), f, indent=2)
+
+    def report(self) -> dict:
+        """The run: its duration, peak RSS, stage records and their totals
+        by stage name."""
+        totals = dict()
+        for r_ in self.records:
+            t_ = totals.setdefault(r_["stage"], {"calls": 0, "wall_time": 0.0})
+            t_["calls"] += 1
+            t_["wall_time"] += r_["wall_time"]
+            for k_, v_ in r_["counters"].items():
+                t_[k_] = t_.get(k_, 0) + v_
+
+        return {
+            "started": self._started.isoformat(),
+            "wall_time": time.perf_counter() - self._t0,
+            "peak_rss_mb": max(self._peak_rss, _max_rss()) / 2 ** 20,
+            "argv": sys.argv,
+            "stages": self.records,
+            "totals": totals,
+        }
+
+    def _enter(self, stage) -> None:
+        stage.peak_rss = _rss()
+        with self._lock:
+            self._open.add(stage)
+
+    def _exit(self, stage, t0, result, error) -> None:
+        with self._lock:
+            self._open.discard(stage)
+        stage.peak_rss = max(stage.peak_rss, _rss())
+
+        record = {
+            "stage": stage.name,
+            "asset": stage.asset,
+            "parent": None if stage.parent is None else stage.parent.name,
+            "start": t0 - self._t0,
+            "wall_time": time.perf_counter() - t0,
+            "peak_rss_mb": stage.peak_rss / 2 ** 20,
+            "rows_returned": len(result)
+            if isinstance(result, (pd.DataFrame, pd.Series)) else None,
+            "counters": dict(stage.counters),
+            "error": None if error is None else repr(error),
+        }
+        with self._lock:
+            self.records.append(record)
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            rss = _rss()
+            with self._lock:
+                self._peak_rss = max(self._peak_rss, rss)
+                for s_ in self._open:
+                    s_.peak_rss = max(s_.peak_rss, rss)
+
+
+def stage(func):
+    """Record calls of `func` as stages of the active `Recorder`."""
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        recorder = _recorder
+        if recorder is None:
+            return func(*args, **kwargs)
+
+        asset = _asset_of(signature, args, kwargs)
+        s_ = _Stage(func.__qualname__, asset, _current.get())
+        token = _current.set(s_)
+        recorder._enter(s_)
+        t0 = time.perf_counter()
+
+        result, error = None, None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current.reset(token)
+            recorder._exit(s_, t0, result, error)
+
+    return wrapper
+
+
+def count(**counters) -> None:
+    """Add to the counters of the current stage and those enclosing it."""
+    s_ = _current.get()
+    if s_ is not None:
+        s_.add(counters)
+
+
+def file_size(path) -> int:
+    """Size of a file, or of all files under a directory."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+
+    return sum(os.path.getsize(os.path.join(d_, f_))
+               for d_, _, fs in os.walk(path) for f_ in fs)
+
+
+def _asset_of(signature, args, kwargs):
+    try:
+        bound = signature.bind_partial(*args, **kwargs).arguments
+    except TypeError:
+        return None
+
+    for a_ in ASSET_ARGS:
+        if isinstance(bound.get(a_), str):
+            return bound[a_]
+
+    return None
+
+
+def _rss() -> int:
+    """Resident set size of this process, in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return _max_rss()
+
+
+def _max_rss() -> int:
+    """Peak resident set size of this process so far, in bytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # kilobytes on linux, bytes on macos
+    return rss if sys.platform == "darwin" else rss * 1024
@@ -1,54 +1,115 @@
+import functools
 import pandas as pd
 import os
 
-data_dir = os.path.join(os.environ.get("PROJECT_ROOT"), "data/")
+from ..midquote import MidQuotes
+from ..panel import PanelCache
+from ..storage import read_dataset, make_filter, first_timestamp
+from ..utilities import pivot, data_dir
 
 
-def get_perpetual(mid=False) -> pd.DataFrame:
+def panels() -> PanelCache:
+    """Pivoted prices, kept in data/panels/kraken and in memory."""
+    return _panel_cache(os.path.join(data_dir(), "panels", "kraken"))
+
+
+def perp_mids() -> MidQuotes:
+    """Mid quotes of the cached perp panel, extended as new quotes come
+    in."""
+    return _mid_quotes(os.path.join(data_dir(), "panels", "kraken",
+                                    "mid-perp-bidask-kraken.npz"))
+
+
+# one of each per data folder, created on first use
+_panel_cache = functools.lru_cache(maxsize=None)(PanelCache)
+_mid_quotes = functools.lru_cache(maxsize=None)(MidQuotes)
+
+
+def get_perpetual(mid=False, assets=None, start=None, end=None,
+                  sides=None, cache=True) -> pd.DataFrame:
     """Get prices of perpetual contracts, in USD.
 
     Kraken perps are coin-margined.
 
+    With `cache=True`, the pivoted prices are taken from `panels()`, which
+    rebuilds them only when the prepared data changes; otherwise, only the
+    rows matching `assets`, `start`, `end` and `sides` are read from disk
+    (see `_read_prepared`) and pivoted.
+
     Parameters
     ----------
     mid : bool
         True to retrieve mid quotes
+    assets : list
+        e.g. ['xbt', 'eth']; all by default
+    start : str or pandas.Timestamp
+        inclusive; naive timestamps are taken to be in UTC
+    end : str or pandas.Timestamp
+        inclusive; partial dates such as '2021-03' cover the whole period
+    sides : list
+        of 'bid' and 'ask'; both by default; ignored if `mid` is True
+    cache : bool
+        True to use the cached panel
 
     """
-    data_path = os.path.join(data_dir, "prepared/perpetual/kraken")
-    data = pd.read_feather(
-        os.path.join(data_path, "perp-bidask-kraken.ftr")
-    )
+    if cache:
+        res = panels().get(
+            _prepared_path("perpetual", "perp-bidask-kraken"),
+            index="timestamp", columns=["asset", "side"], values="price"
+        )
+        if mid:
+            res = _mid_from_bidask(res, perp_mids())
+            return _select(res, start, end, drop=False, asset=assets)
 
-    res = data \
-        .pivot(index="timestamp", columns=["asset", "side"], values="price")
+        return _select(res, start, end, asset=assets, side=sides)
 
     if mid:
-        ba = (res.xs("ask", 1, 1) - res.xs("bid", 1, 1))\
-            .rolling(6 * 24, min_periods=6).mean() / 2
-        res = res.xs("ask", 1, 1).sub(ba)\
-            .fillna(res.xs("bid", 1, 1).add(ba))
+        # the rolling half spread needs a lookback before `start` and the
+        # full set of timestamps to roll over: cut the result afterwards
+        data = _read_perpetual_with_lookback(start, end)
+        res = _mid_from_bidask(_pivot_perpetual(data))
 
-    return res
+        return _select(res, start, drop=False, asset=assets)
 
+    data = _read_prepared(
+        "perpetual", "perp-bidask-kraken",
+        make_filter(start=start, end=end, asset=assets, side=sides)
+    )
 
-def get_spot(which="close"):
-    """Get spot prices."""
-    data_path = os.path.join(data_dir, "prepared/spot/kraken")
+    return _pivot_perpetual(data)
 
-    if which == "close":
-        res = pd.read_feather(
-            os.path.join(data_path, "spot-close-kraken.ftr")
-        )
-    else:
+
+def get_spot(which="close", assets=None, start=None, end=None,
+             cache=True):
+    """Get spot prices.
+
+    Parameters
+    ----------
+    which : str
+        only 'close' for now
+    assets, start, end, cache
+        see `get_perpetual`
+    """
+    if which != "close":
         raise NotImplementedError
 
-    res = res.pivot(index="timestamp", columns="asset", values=which)
+    if cache:
+        res = panels().get(_prepared_path("spot", "spot-close-kraken"),
+                           index="timestamp", columns="asset", values=which)
+        return _select(res, start, end, asset=assets)
+
+    res = _read_prepared(
+        "spot", "spot-close-kraken",
+        make_filter(start=start, end=end, asset=assets)
+    )
+
+    res = pivot(res, index="timestamp", columns="asset", values=which)
 
     return res
 
 
-def get_funding_rates() -> pd.DataFrame:
+def get_funding_rates(assets=None, start=None, end=None,
+                      which=None) -> pd.DataFrame:
     """Get abs and rel funding rates.
 
     with time zone-aware index, containing absolute (in fractions of 1)
@@ -59,8 +120,133 @@ def get_funding_rates() -> pd.DataFrame:
         'which' (str, one of 'relative', 'absolute'),
         'asset' (str, 3-letter iso e.g. 'xrp'),
         'rate' (float)
+
+    Parameters
+    ----------
+    assets, start, end
+        see `get_perpetual`
+    which : list
+        of 'relative' and 'absolute'; both by default
+    """
+    res = _read_prepared(
+        "funding", "funding-r-kraken",
+        make_filter(start=start, end=end, asset=assets, which=which)
+    )
+
+    # strings, as documented, rather than the stored categoricals
+    res = res.astype({"asset": str, "which": str})
+
+    return res
+
+
+def _read_prepared(which, name, filter=None) -> pd.DataFrame:
+    """Read rows of a prepared dataset, pushing `filter` down to storage.
+
+    Reads the partitioned dataset data/prepared/<which>/kraken/<name>/ if
+    there is one, and the memory-mapped <name>.ftr file otherwise.
     """
-    data_path = os.path.join(data_dir, "prepared/funding/kraken")
-    res = pd.read_feather(os.path.join(data_path, "funding-r-kraken.ftr"))
+    res = read_dataset(_prepared_path(which, name), filter=filter)
+
+    if which == "funding":
+        # as stored in the .ftr file
+        res = res[["timestamp", "asset", "which", "rate"]]
+
+    return res
 
-    return res
\ No newline at end of file
+
+def _prepared_path(which, name) -> str:
+    """The partitioned dataset if there is one, the .ftr file otherwise."""
+    data_path = os.path.join(data_dir(), "prepared", which, "kraken", name)
+
+    if os.path.isdir(data_path):
+        return data_path
+
+    return f"{data_path}.ftr"
+
+
+def _select(panel, start=None, end=None, drop=True, **levels) \
+        -> pd.DataFrame:
+    """Cut a panel to a period and to some column labels.
+
+    With `drop=True`, rows and columns left empty by the selection are
+    dropped, as they would be missing from a pivot of the selected rows.
+    """
+    res = panel
+
+    mask = pd.Series(True, index=res.columns)
+    for level_, values in levels.items():
+        if values is None:
+            continue
+        values = [values] if isinstance(values, str) else values
+        mask &= res.columns.get_level_values(level_).isin(values)
+    if not mask.all():
+        res = res.loc[:, mask.values]
+        if drop:
+            res = res.dropna(how="all")
+
+    if (start is not None) or (end is not None):
+        start = _utc(start) if start is not None else None
+        if isinstance(end, str):
+            end = pd.Period(end).end_time
+        end = _utc(end) if end is not None else None
+        res = res.loc[start:end]
+        if drop:
+            res = res.dropna(axis=1, how="all")
+
+    return res
+
+
+def _mid_from_bidask(res, mids=None) -> pd.DataFrame:
+    """Mid quotes: ask (or bid) less (plus) the rolling mean half spread.
+
+    The rolling mean is over 144 bars, with at least 6 of them; with
+    `mids`, a `MidQuotes`, only bars new to it are computed.
+    """
+    if mids is None:
+        mids = MidQuotes(None)
+
+    return mids.get(res.xs("bid", 1, 1), res.xs("ask", 1, 1))
+
+
+def _pivot_perpetual(data) -> pd.DataFrame:
+    return pivot(data, index="timestamp", columns=["asset", "side"],
+                 values="price")
+
+
+def _read_perpetual_with_lookback(start, end, lookback=6 * 24) \
+        -> pd.DataFrame:
+    """Read perp quotes from `lookback` timestamps before `start` on.
+
+    The period to read is doubled until it includes `lookback` timestamps
+    before `start`, or the beginning of the data.
+    """
+    if start is None:
+        return _read_prepared("perpetual", "perp-bidask-kraken",
+                              make_filter(end=end))
+
+    start = _utc(start)
+    first = None
+    days = 2
+
+    while True:
+        since = start - pd.Timedelta(days=days)
+        data = _read_prepared("perpetual", "perp-bidask-kraken",
+                              make_filter(start=since, end=end))
+        n_before = data.loc[data["timestamp"] < start, "timestamp"].nunique()
+        if n_before >= lookback:
+            return data
+
+        if first is None:
+            first = first_timestamp(
+                _prepared_path("perpetual", "perp-bidask-kraken")
+            )
+        if (first is None) or (since <= first):
+            return data
+        days *= 2
+
+
+def _utc(t) -> pd.Timestamp:
+    """Timestamp `t` in UTC, naive ones taken to be in UTC already."""
+    t = pd.Timestamp(t)
+
+    return t.tz_localize("UTC") if t.tz is None else t.tz_convert("UTC")
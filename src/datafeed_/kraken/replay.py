@@ -0,0 +1,321 @@
+"""Local stand-in for the Kraken endpoints used by `upstream`.
+
+Serves spot 'Trades', futures 'executions' and 'historicalfundingrates'
+from data held in memory, recorded (the pages checkpointed by earlier
+pulls) or synthetic, with the cursors and rate limits of the exchange,
+so that the fetch path can be tested and load-tested offline:
+
+    >>> with ReplayServer(futures={"pi_xbtusd": executions}) as server:
+    ...     upstream.configure(**server.urls())
+    ...     upstream.update_perpetual_from_api()
+
+`python -m src.datafeed_.kraken.replay --checkpoints <path>` serves the
+checkpoints under <path> until interrupted.
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from ..fetcher import TokenBucket
+from .setup import RATE_LIMIT_PERP, RATE_LIMIT_SPOT
+
+logger = logging.getLogger(__name__)
+
+SPOT_COLUMNS = ["price", "volume", "time", "side", "ordertype", "misc"]
+FUTURES_COLUMNS = ["timestamp", "price", "quantity", "direction"]
+
+
+class ReplayServer:
+    """HTTP server replaying Kraken API responses.
+
+    Cursors behave as those of the exchange: spot trades are those after
+    `since` (in seconds, or nanoseconds as in the 'last' of a response),
+    oldest first; futures executions those from `since` on and before
+    `before` (in ms), in the order of `sort`; both up to `page_size` per
+    response. Funding rates come in one response per symbol.
+
+    Requests beyond the rate limit of the API are answered the way Kraken
+    does: 'EGeneral:Too many requests' in the body of a 200 for spot, a
+    429 with 'apiLimitExceeded' for futures.
+
+    Parameters
+    ----------
+    spot : dict
+        pair, e.g. 'xbtusd' -> pandas.DataFrame of trades with the columns
+        of `SPOT_COLUMNS` ('time' in seconds), 'ordertype' and 'misc'
+        optional
+    futures : dict
+        pair, e.g. 'pi_xbtusd' -> pandas.DataFrame of executions with the
+        columns of `FUTURES_COLUMNS` ('timestamp' in ms, 'direction' 'Buy'
+        or 'Sell')
+    funding : dict
+        symbol, e.g. 'PI_XBTUSD' -> body of the response
+    page_size : int
+    rate_limits : dict
+        'spot', 'futures' -> (requests per second, burst) or None for no
+        limit; those of `setup` by default
+    latency : float
+        seconds to wait before answering
+    host : str
+    port : int
+        0 for any free one
+
+    Attributes
+    ----------
+    stats : dict
+        'spot', 'futures', 'funding' -> number of requests answered, and
+        'limited' -> number of them refused for the rate limit
+    """
+    def __init__(self, spot=None, futures=None, funding=None,
+                 page_size: int = 1000, rate_limits: dict = None,
+                 latency: float = 0.0, host: str = "127.0.0.1",
+                 port: int = 0):
+        self.spot = {k_.lower(): _sorted(v_, "time")
+                     for k_, v_ in (spot or dict()).items()}
+        self.futures = {k_.lower(): _sorted(v_, "timestamp")
+                        for k_, v_ in (futures or dict()).items()}
+        self.funding = {k_.upper(): v_
+                        for k_, v_ in (funding or dict()).items()}
+        self.page_size = page_size
+        self.latency = latency
+
+        if rate_limits is None:
+            rate_limits = {"spot": RATE_LIMIT_SPOT,
+                           "futures": RATE_LIMIT_PERP}
+        self._buckets = {k_: TokenBucket(*v_)
+                         for k_, v_ in rate_limits.items() if v_ is not None}
+
+        self.stats = {"spot": 0, "futures": 0, "funding": 0, "limited": 0}
+        self._stats_lock = threading.Lock()
+
+        self._server = _Server((host, port), _handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @classmethod
+    def from_checkpoints(cls, path, **kwargs) -> "ReplayServer":
+        """Serve the pages checkpointed by `upstream` under `path`, the
+        'checkpoints/kraken' directory, its 'spot' and 'perp' logs."""
+        spot, futures = dict(), dict()
+
+        for which_, res_ in [("spot", spot), ("perp", futures)]:
+            path_ = os.path.join(path, which_)
+            if not os.path.isdir(path_):
+                continue
+
+            for f_ in sorted(os.listdir(path_)):
+                if not f_.endswith(".jsonl"):
+                    continue
+                asset = f_.rsplit("-", 1)[0]
+                with open(os.path.join(path_, f_)) as f:
+                    records = [r_ for line_ in f
+                               for r_ in json.loads(line_)["records"]]
+                if which_ == "spot":
+                    data = pd.DataFrame(records, columns=SPOT_COLUMNS[:4])
+                    res_.setdefault(f"{asset}usd", list()).append(data)
+                else:
+                    data = pd.DataFrame.from_records(records)\
+                        .rename(columns={"side": "direction"})
+                    res_.setdefault(f"pi_{asset}usd", list()).append(data)
+
+        def merge(frames, by):
+            return pd.concat(frames).drop_duplicates().sort_values(by)
+
+        return cls(spot={k_: merge(v_, "time") for k_, v_ in spot.items()},
+                   futures={k_: merge(v_, "timestamp")
+                            for k_, v_ in futures.items()},
+                   **kwargs)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def urls(self) -> dict:
+        """Base urls, as keyword arguments to `upstream.configure`."""
+        return {
+            "root_url": f"{self.url}/derivatives/api/v4",
+            "root_url_spot": f"{self.url}/0/public",
+            "root_url_perp": f"{self.url}/api/history/v2/market/{{}}"
+                             f"/executions",
+        }
+
+    def start(self) -> "ReplayServer":
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def respond(self, path, query) -> (int, dict):
+        """Status and body of the response to a GET of `path`?`query`."""
+        if path.endswith("/0/public/Trades"):
+            group = "spot"
+        elif path.endswith("/executions"):
+            group = "futures"
+        elif path.endswith("/historicalfundingrates"):
+            group = "funding"
+        else:
+            return 404, {"error": [f"unknown endpoint {path}"]}
+
+        bucket = self._buckets.get("spot" if group == "spot" else "futures")
+        if (bucket is not None) and not bucket.try_acquire():
+            self._count("limited")
+            if group == "spot":
+                return 200, {"error": ["EGeneral:Too many requests"]}
+            return 429, {"result": "error", "error": "apiLimitExceeded"}
+
+        self._count(group)
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        if group == "spot":
+            return self._trades(query)
+        if group == "futures":
+            return self._executions(path.split("/")[-2], query)
+
+        symbol = query.get("symbol", "").upper()
+        if symbol not in self.funding:
+            return 200, {"result": "error", "error": "Contract not found"}
+
+        return 200, self.funding[symbol]
+
+    def _trades(self, query) -> (int, dict):
+        pair = query.get("pair", "").lower()
+        if pair not in self.spot:
+            return 200, {"error": ["EQuery:Unknown asset pair"]}
+
+        data = self.spot[pair]
+        since = float(query.get("since", 0))
+        if since > 1e14:
+            since /= 1e9
+
+        i0 = np.searchsorted(data["time"].values, since, side="right")
+        page = data.iloc[i0:i0 + self.page_size]
+
+        last = page["time"].iloc[-1] if len(page) > 0 else since
+        rows = [[str(r_[0]), str(r_[1]), float(r_[2]), r_[3], r_[4], r_[5]]
+                for r_ in page[SPOT_COLUMNS].itertuples(index=False)]
+
+        return 200, {"error": [],
+                     "result": {pair.upper(): rows,
+                                "last": str(int(round(last * 1e9)))}}
+
+    def _executions(self, pair, query) -> (int, dict):
+        pair = pair.lower()
+        if pair not in self.futures:
+            return 404, {"result": "error", "error": "Contract not found"}
+
+        data = self.futures[pair]
+        t = data["timestamp"].values
+        i0 = np.searchsorted(t, int(query.get("since", 0)), side="left")
+        i1 = len(t) if "before" not in query else \
+            np.searchsorted(t, int(query["before"]), side="left")
+
+        if query.get("sort", "asc") == "desc":
+            page = data.iloc[max(i1 - self.page_size, i0):i1].iloc[::-1]
+        else:
+            page = data.iloc[i0:min(i0 + self.page_size, i1)]
+
+        elements = [
+            {"uid": f"{pair}-{int(r_.timestamp)}-{n_}",
+             "timestamp": int(r_.timestamp),
+             "event": {"Execution": {"execution": {
+                 "timestamp": int(r_.timestamp),
+                 "price": str(r_.price),
+                 "quantity": str(r_.quantity),
+                 "takerOrder": {"direction": r_.direction}
+             }}}}
+            for n_, r_ in enumerate(page.itertuples(index=False))
+        ]
+
+        return 200, {"elements": elements, "len": len(elements)}
+
+    def _count(self, key) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
+
+
+class _Server(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # clients hanging up are no concern of a load test
+        logger.debug(f"error serving {client_address}", exc_info=True)
+
+
+def _handler(server) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {k_: v_[-1] for k_, v_ in parse_qs(url.query).items()}
+            status, body = server.respond(url.path, query)
+
+            content = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return Handler
+
+
+def _sorted(data, by) -> pd.DataFrame:
+    data = data.sort_values(by, kind="stable").reset_index(drop=True)
+    if by == "time":
+        for c_ in SPOT_COLUMNS[4:]:
+            if c_ not in data.columns:
+                data[c_] = "l" if c_ == "ordertype" else ""
+        data = data[SPOT_COLUMNS]
+
+    return data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="python -m src.datafeed_.kraken.replay",
+        description="Serve checkpointed Kraken API pages."
+    )
+    parser.add_argument("--checkpoints", required=True,
+                        help="the 'data/checkpoints/kraken' directory")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--no-rate-limit", action="store_true")
+    args = parser.parse_args()
+
+    server = ReplayServer.from_checkpoints(
+        args.checkpoints, port=args.port,
+        rate_limits={"spot": None, "futures": None} if args.no_rate_limit
+        else None
+    )
+    for k_, v_ in server.urls().items():
+        print(f"KRAKEN_{k_.upper()}={v_}")
+
+    with server:
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
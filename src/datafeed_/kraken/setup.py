@@ -1,3 +1,23 @@
-ROOT_URL = "https://futures.kraken.com/derivatives/api/v4"
-ROOT_URL_SPOT = "https://api.kraken.com/0/public"
-ROOT_URL_PERP = "https://futures.kraken.com/api/history/v2/market/{}/executions"
+import os
+
+# base urls can be pointed elsewhere, e.g. at a `replay.ReplayServer`,
+# with the environment variables of the same name
+ROOT_URL = os.environ.get(
+    "KRAKEN_ROOT_URL", "https://futures.kraken.com/derivatives/api/v4"
+)
+ROOT_URL_SPOT = os.environ.get(
+    "KRAKEN_ROOT_URL_SPOT", "https://api.kraken.com/0/public"
+)
+ROOT_URL_PERP = os.environ.get(
+    "KRAKEN_ROOT_URL_PERP",
+    "https://futures.kraken.com/api/history/v2/market/{}/executions"
+)
+
+# public rate limits as (requests per second, burst): spot public endpoints
+# allow about one call per second per ip, futures are more lenient
+RATE_LIMIT_SPOT = (1.0, 1)
+RATE_LIMIT_PERP = (5.0, 10)
+
+# True to store prices and rates of prepared datasets in single precision,
+# halving their size; see `schema.encode`
+FLOAT32 = False
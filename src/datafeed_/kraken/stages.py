@@ -0,0 +1,78 @@
+"""Stages of the preparation of Kraken data, see `pipeline.Pipeline`."""
+import os
+
+from ..pipeline import Pipeline, Stage
+from . import upstream
+
+
+def make_pipeline(storage: str = "feather", streaming: bool = False,
+                  n_jobs: int = -1, stage_jobs: int = 1) -> Pipeline:
+    """Pipeline writing the prepared spot, funding and perpetual data.
+
+    The three are independent and run at the same time. Spot and
+    perpetual prices are rebuilt only if the raw files in
+    data/raw/spot(perpetual)/kraken have changed; funding rates, coming
+    from the API, always are.
+
+    Parameters
+    ----------
+    storage : str
+        'feather' or 'partitioned', see `upstream._save_prepared`
+    streaming : bool
+        see `upstream.save_perpetual_from_csv`
+    n_jobs : int
+        number of stages to run at the same time; -1 for all
+    stage_jobs : int
+        number of processes the spot and perpetual stages parse files
+        with; -1 for all cpus
+    """
+    data_dir = upstream.data_dir()
+
+    def prepared(which, name) -> str:
+        path = os.path.join(data_dir, "prepared", which, "kraken", name)
+        return f"{path}.ftr" if storage == "feather" else path
+
+    stages = [
+        Stage("spot", upstream.save_spot_from_ohlcv,
+              inputs=[os.path.join(data_dir, "raw/spot/kraken")],
+              outputs=[prepared("spot", "spot-close-kraken")],
+              params={"storage": storage, "n_jobs": stage_jobs}),
+        Stage("funding", upstream.save_funding_rates,
+              outputs=[prepared("funding", "funding-r-kraken")],
+              params={"storage": storage}),
+        Stage("perpetual", upstream.save_perpetual_from_csv,
+              inputs=[os.path.join(data_dir, "raw/perpetual/kraken")],
+              outputs=[prepared("perpetual", "perp-bidask-kraken")],
+              params={"storage": storage, "streaming": streaming,
+                      "n_jobs": stage_jobs}),
+    ]
+
+    return Pipeline(stages, os.path.join(data_dir, "checkpoints",
+                                         "pipeline-kraken.json"),
+                    n_jobs=n_jobs)
+
+
+def make_update_pipeline(storage: str = "feather",
+                         n_jobs: int = -1) -> Pipeline:
+    """Pipeline appending the latest data from the API to the prepared data.
+
+    Spot and perpetual prices are appended to, funding rates pulled anew;
+    the three run at the same time, and always, having no local inputs.
+
+    Parameters
+    ----------
+    storage, n_jobs
+        see `make_pipeline`
+    """
+    stages = [
+        Stage("spot", upstream.update_spot_from_api,
+              params={"storage": storage}),
+        Stage("funding", upstream.save_funding_rates,
+              params={"storage": storage}),
+        Stage("perpetual", upstream.update_perpetual_from_api,
+              params={"storage": storage}),
+    ]
+
+    return Pipeline(stages, os.path.join(upstream.data_dir(), "checkpoints",
+                                         "pipeline-kraken.json"),
+                    n_jobs=n_jobs)
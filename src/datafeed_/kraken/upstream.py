@@ -1,116 +1,144 @@
 import re
-import time
+import contextlib
+import threading
 import zipfile
 from typing import Tuple, List
 import pandas as pd
 import datetime
 import os
-import requests
-from joblib import Memory
+import pyarrow as pa
 import logging
 
-from ..utilities import aggregate_data
+from ..checkpoint import PageStore
+from ..fetcher import Fetcher
+from ..instrument import stage, count, file_size
+from ..schema import encode
+from ..storage import (write_partitions, read_last_partitions,
+                       remove_dataset, read_dataset, write_feather)
+from ..utilities import (aggregate_data, imap_ordered,
+                         pivot, pack_keys, drop_duplicates_max,
+                         StreamingDeduplicator, ChunkAggregator, LazyMemory,
+                         data_dir)
 
-from .setup import ROOT_URL, ROOT_URL_PERP, ROOT_URL_SPOT
+from .setup import (ROOT_URL, ROOT_URL_PERP, ROOT_URL_SPOT, RATE_LIMIT_PERP,
+                    RATE_LIMIT_SPOT, FLOAT32)
 
-data_dir = os.path.join(os.environ.get("PROJECT_ROOT"), "data")
-
-# cache; will use or create folder 'joblib'
-memory = Memory(cachedir=data_dir, verbose=False)
+# cache; will use or create folder 'joblib' on first use
+memory = LazyMemory(data_dir, verbose=False)
 
 logger = logging.getLogger(__name__)
 
+# columns identifying a trade (and a bar) of perpetual contracts
+TRADE_KEY = ["timestamp", "tradeable", "aggressor"]
+
+# sides of spot trades, buy and sell, the same in every page
+SPOT_SIDES = pd.CategoricalDtype(["b", "s"])
+
+# http fetchers shared by all threads, one per API; created on first use
+_fetchers = dict()
+_fetchers_lock = threading.Lock()
 
-def save_spot_from_ohlcv() -> None:
+
+@stage
+def save_spot_from_ohlcv(n_jobs: int = 1, storage: str = "feather") -> None:
     """Save spot prices from 1-min OHLCV data.
 
     Wrapper around `get_spot_from_ohlcv` (loop over currencies) - do read its
     docstring!
 
+    Parameters
+    ----------
+    n_jobs : int
+        number of processes to process currencies with, -1 for all cpus;
+        1 to read them in turn, without a pool
+    storage : str
+        'feather' for one .ftr file, 'partitioned' for a parquet dataset
+        partitioned by asset and month (see `_save_prepared`)
+
     """
     currencies = ["xbt", "bch", "xrp", "ltc", "eth"]
 
     data = dict()
 
-    for c_ in currencies:
-        logger.info(f"saving spot rates for {c_}...")
-        data[c_] = _get_spot_from_ohlcv(c_)
+    logger.info("saving spot rates...")
+    for c_, data_c in zip(currencies, imap_ordered(_get_spot_from_ohlcv,
+                                                   currencies,
+                                                   n_jobs=n_jobs)):
+        logger.info(f"spot rates for {c_} done")
+        data[c_] = data_c
 
-    # concat everything and store in feather format
+    # concat everything and store
     res = pd.concat(data, axis=0, names=["asset", "index"]) \
         .reset_index(level="asset").reset_index(drop=True)
 
-    path_to_out = os.path.join(data_dir, "prepared/spot/kraken",
-                               "spot-close-kraken.ftr")
-    res.to_feather(path_to_out)
+    path_to_out = _save_prepared(res, "spot", "spot-close-kraken", storage)
     logger.info(f"spot rates saved to {path_to_out}")
 
 
-def save_spot_from_api() -> None:
+@stage
+def save_spot_from_api(storage: str = "feather") -> None:
     """Save bid/ask spot prices using the API.
 
     This breaks down because of an API issue: in some requests, there are
     huge jumps in time.
 
+    Parameters
+    ----------
+    storage : str
+        'feather' or 'partitioned', see `_save_prepared`
+
     """
     start_dt = pd.Timestamp("2018-06-01")
     end_dt = pd.Timestamp(datetime.date.today())
 
-    data = {}
-
-    for c_ in ["xrp", "eth", "xbt", "bch", "ltc"]:
-
-        data_c = _get_spot_from_api(c_, start_dt, end_dt)
-
-        data[c_] = data_c
+    data = _map_currencies(_get_spot_from_api,
+                           ["xrp", "eth", "xbt", "bch", "ltc"],
+                           start_dt, end_dt)
 
     data = pd.concat(data, axis=0, names=["asset", "index"]) \
         .reset_index(level="asset").reset_index(drop=True)
 
-    # save in feather format
-    data.to_feather(
-        os.path.join(data_dir, "prepared/spot/kraken",
-                     "spot-bidask-api-kraken.ftr")
-    )
+    _save_prepared(data, "spot", "spot-bidask-api-kraken", storage)
 
 
-def update_spot_from_api() -> None:
-    """Update bid/ask spot prices using the API."""
-    path_to_ftr = os.path.join(data_dir, "prepared/spot/kraken")
+@stage
+def update_spot_from_api(storage: str = "feather") -> None:
+    """Update bid/ask spot prices using the API.
 
-    data_old = pd.read_feather(
-        os.path.join(path_to_ftr, "spot-bidask-api-kraken.ftr")
-    )
+    Parameters
+    ----------
+    storage : str
+        'feather' to rewrite the whole file, 'partitioned' to rewrite only
+        the (asset, month) partitions receiving new data, see
+        `_update_prepared`
+    """
+    data_old = _read_prepared_tail("spot", "spot-bidask-api-kraken",
+                                   storage)
 
     # those are the currencies to fetch data on
     currencies = data_old["asset"].unique()
 
     # start date is the last date of `data_old`
-    start_dt = data_old \
-        .pivot(index="timestamp", columns=["asset", "side"], values="price") \
-        .last_valid_index()
+    start_dt = pivot(data_old, index="timestamp", columns=["asset", "side"],
+                     values="price").last_valid_index()
 
     # end date is the start of today
     end_dt = pd.Timestamp(datetime.date.today(), tz="UTC")
 
-    data = dict()
-    for c_ in currencies:
-        data_c = _get_spot_from_api(c_, start_dt, end_dt)
-        data[c_] = data_c
+    data = _map_currencies(_get_spot_from_api, currencies, start_dt, end_dt)
 
     data_new = pd.concat(data, axis=0, names=["asset", "index"]) \
         .reset_index(level="asset").reset_index(drop=True)
 
-    data_upd = pd.concat((data_old, data_new)) \
-        .drop_duplicates(subset=["asset", "side", "timestamp"]) \
-        .reset_index(drop=True)
+    _update_prepared(data_old, data_new, "spot", "spot-bidask-api-kraken",
+                     storage, subset=["asset", "side", "timestamp"])
 
-    data_upd.to_feather(
-        os.path.join(path_to_ftr, "spot-bidask-api-kraken.ftr")
-    )
 
-
-def save_perpetual_from_csv() -> None:
+@stage
+def save_perpetual_from_csv(streaming: bool = False,
+                            chunksize: int = 1000000,
+                            n_jobs: int = 1,
+                            storage: str = "feather") -> None:
     """Process .csv files with perp prices downloadable from Kraken.
 
     The files keep actual trades, so the data must be aggregated at some
@@ -121,18 +149,45 @@ def save_perpetual_from_csv() -> None:
     later than that.
 
     This also means that the individual files must be processed in pairs of
-    two consecutive ones.
+    two consecutive ones; alternatively, with `streaming=True`, each file is
+    read once in chunks of `chunksize` rows, with only the trades of the
+    last unfinished bar carried over to the next chunk (or file), and the
+    finished bars are written to the feather file as they come. Memory use
+    is then bounded by one chunk, regardless of the number of files. This
+    relies on trades in the files being sorted by time; trades older than
+    bars already written, e.g. repeated at the start of a file, are skipped
+    and counted as 'rows_late' (see `instrument`).
+
+    The two modes give the same bars, but for those straddling the end of a
+    month other than the first: of the two pairs the pairwise mode sees them
+    in, it keeps the earlier one's version, which lacks the trades of the
+    next month unless the file of the month repeats at least the first 5
+    minutes of the next one. Streaming always sees all their trades.
 
     The zip files are downloadable from 'matches_history' folder within the
     Dropbox folder to be found here:
     https://support.kraken.com/hc/en-us/articles/360022835871-Historical-Data
 
     Download all of them, saving to $PROJECT_ROOT/data/perp/
+
+    Parameters
+    ----------
+    streaming : bool
+        True to process files in one pass, in chunks
+    chunksize : int
+        number of rows per chunk when `streaming` is True
+    n_jobs : int
+        number of processes to parse the files with when `streaming` is
+        False (-1 for all cpus); month pairs are still stitched in order, so
+        the output does not depend on this
+    storage : str
+        'feather' or 'partitioned', see `_save_prepared`; in streaming mode,
+        bars are appended to the partitions as they come
     """
     logger.info("saving perpetual prices...")
 
-    data_src = os.path.join(data_dir, "raw/perpetual/kraken")
-    data_tgt = os.path.join(data_dir, "prepared/perpetual/kraken")
+    data_src = os.path.join(data_dir(), "raw/perpetual/kraken")
+    data_tgt = os.path.join(data_dir(), "prepared/perpetual/kraken")
 
     # find all .csv (sometimes compressed as .zip)
     fs = [f for f in os.listdir(data_src) if f.endswith(("csv", "zip"))]
@@ -146,128 +201,329 @@ def save_perpetual_from_csv() -> None:
             "found in 'data/raw/perpetual/kraken'"
         )
 
-    res = list()
+    path_to_out = f"{data_tgt}/perp-bidask-kraken.ftr"
+    if storage == "partitioned":
+        path_to_out = f"{data_tgt}/perp-bidask-kraken"
 
-    # function to parse one file, possibly a .zip
-    @memory.cache
-    def parser(f_) -> pd.DataFrame:
-        if f_ == "matches_history_2020-10_rti.csv.zip":
-            # this one is special somehow
-            res_ = pd.read_csv(
-                f"{data_src}/{f_}",
-                compression="zip",
-                header=None, usecols=[1, 2, 3, 4, 5]
-            )
-            res_.columns = ["timestamp", "tradeable", "price", "size",
-                            "aggressor"]
-        else:
-            res_ = pd.read_csv(
-                f"{data_src}/{f_}",
-                compression="zip",
-                sep="[,\t]",
-                usecols=["timestamp", "tradeable", "aggressor", "price",
-                         "size"]
-            )
+    # files to parse, one per month
+    paths = [f"{data_src}/{[f_ for f_ in fs if str(m_) in f_][0]}"
+             for m_ in months]
+
+    if streaming:
+        logger.info("files found, streaming over months...")
+        _save_perpetual_streaming(paths, path_to_out, chunksize=chunksize,
+                                  storage=storage)
+        logger.info(f"perpetual prices saved to {path_to_out}")
+        return
+
+    res = list()
 
-        res_ = res_.loc[res_["tradeable"].str.startswith("PI_")]
+    n_cached = sum(_parse_matches_history.check_call_in_cache(p_)
+                   for p_ in paths)
+    count(cache_hits=n_cached, cache_misses=len(paths) - n_cached,
+          bytes_read=sum(file_size(p_) for p_ in paths))
 
-        return res_
+    # each file is parsed once, possibly in a pool, and returned in order;
+    # the last file comes with the last pair, so the pool is closed here
+    parsed = imap_ordered(_parse_matches_history, paths, n_jobs=n_jobs)
 
     # take pairs of files, parse, concat, resample
     logger.info("files found, starting iteration over month-pairs...")
-    for m1, m2 in zip(months[:-1], months[1:]):
+    with contextlib.closing(parsed):
+        d2 = next(parsed)
+        count(rows_in=len(d2))
+        for (m1, m2), d_ in zip(zip(months[:-1], months[1:]), parsed):
 
-        logger.info(f"{m1} & {m2}")
+            logger.info(f"{m1} & {m2}")
+            count(rows_in=len(d_))
 
-        f1 = [f_ for f_ in fs if str(m1) in f_][0]
-        f2 = [f_ for f_ in fs if str(m2) in f_][0]
+            d1, d2 = d2, d_
 
-        d1, d2 = parser(f1), parser(f2)
+            # skip if no PI_ prices are found
+            if (len(d1) < 1) & (len(d2) < 1):
+                continue
 
-        # skip if no PI_ prices are found
-        if (len(d1) < 1) & (len(d2) < 1):
-            continue
+            data_ = _prepare_trades(pd.concat((d1, d2)))
 
-        data_ = pd.concat((d1, d2)).dropna()
+            chunk = aggregate_data(data_, agg_freq="10T", offset_freq="5T",
+                                   datetime_col="timestamp",
+                                   objective_col="price", weight_col="size",
+                                   other_cols=["tradeable", "aggressor"])
 
-        # drop duplicated trades
-        data_ = data_ \
-            .sort_values(["timestamp", "tradeable", "aggressor", "size"]) \
-            .drop_duplicates(subset=["timestamp", "tradeable", "aggressor"],
-                             keep="last")
+            res.append(chunk)
 
-        data_.loc[:, "timestamp"] = \
-            pd.to_datetime(data_["timestamp"]).dt.tz_localize("UTC")
+    # bars of a month are in two pairs: keep those of the earlier one
+    to_save = pd.concat(res, axis=0, ignore_index=True)
+    to_save = to_save.loc[
+        ~pd.Series(pack_keys(to_save, TRADE_KEY)).duplicated().values
+    ]
 
-        chunk = aggregate_data(data_, agg_freq="10T", offset_freq="5T",
-                               datetime_col="timestamp",
-                               objective_col="price", weight_col="size",
-                               other_cols=["tradeable", "aggressor"])
+    to_save = _rename_perpetual_bars(to_save)
 
-        res.append(chunk)
+    _save_prepared(to_save, "perpetual", "perp-bidask-kraken", storage)
+    logger.info(f"perpetual prices saved to {path_to_out}")
 
-    to_save = pd.concat(res, axis=0, ignore_index=True)
-    to_save = to_save.drop_duplicates(
-        subset=["aggressor", "timestamp", "tradeable"]
-    )
+
+def _read_matches_history(path, chunksize: int = None):
+    """Read one 'matches_history' archive, keeping perpetual contracts only.
+
+    Parameters
+    ----------
+    path : str
+        path to the .csv.zip file
+    chunksize : int
+        if provided, an iterator over chunks of this many rows (before
+        filtering) is returned
+
+    Returns
+    -------
+    pandas.DataFrame or iterator of pandas.DataFrame
+        with columns 'timestamp' (str), 'tradeable', 'price', 'size',
+        'aggressor'
+    """
+    special = os.path.basename(path) == "matches_history_2020-10_rti.csv.zip"
+
+    if special:
+        # this one is special somehow
+        reader = pd.read_csv(path, compression="zip", header=None,
+                             usecols=[1, 2, 3, 4, 5], chunksize=chunksize)
+    else:
+        reader = pd.read_csv(path, compression="zip", sep="[,\t]",
+                             usecols=["timestamp", "tradeable", "aggressor",
+                                      "price", "size"],
+                             chunksize=chunksize)
+
+    def filter_(res_) -> pd.DataFrame:
+        if special:
+            res_.columns = ["timestamp", "tradeable", "price", "size",
+                            "aggressor"]
+        return res_.loc[res_["tradeable"].str.startswith("PI_", na=False)]
+
+    if chunksize is None:
+        return filter_(reader)
+
+    return (filter_(chunk_) for chunk_ in reader)
+
+
+# function to parse one file, cached
+_parse_matches_history = memory.cache(_read_matches_history)
+
+
+def _prepare_trades(data) -> pd.DataFrame:
+    """Drop duplicated trades and convert timestamps to UTC.
+
+    Of duplicated trades, the largest is kept, see
+    `utilities.drop_duplicates_max`; the order of trades is kept too.
+    """
+    data = data.dropna()
+
+    if not pd.api.types.is_datetime64_any_dtype(data["timestamp"]):
+        data = data.assign(
+            timestamp=pd.to_datetime(data["timestamp"]).dt.tz_localize("UTC")
+        )
+
+    return drop_duplicates_max(data, TRADE_KEY, by="size")
+
+
+def _rename_perpetual_bars(data) -> pd.DataFrame:
+    """Map 'aggressor' to 'side' and 'tradeable' to 'asset'."""
+    data = data.copy()
 
     # rename columns and map values
-    to_save.insert(
+    data.insert(
         0, "side",
-        to_save.pop("aggressor").map({"buyer": "ask", "seller": "bid"})
+        data.pop("aggressor").map({"buyer": "ask", "seller": "bid"})
     )
-    to_save.insert(
+    data.insert(
         0, "asset",
-        to_save.pop("tradeable").str.replace("PI_", "").str.replace("USD", "")\
+        data.pop("tradeable").str.replace("PI_", "").str.replace("USD", "")\
             .str.lower()
     )
 
-    path_to_out = f"{data_tgt}/perp-bidask-kraken.ftr"
+    return data
 
-    to_save.reset_index(drop=True).to_feather(path_to_out)
-    logger.info(f"perpetual prices saved to {path_to_out}")
 
+@stage
+def _save_perpetual_streaming(paths, path_to_out, chunksize: int,
+                              storage: str = "feather") -> None:
+    """Aggregate trades from `paths` in one pass, writing bars as they come.
+
+    Bars are 10 minutes long and span [T-5min, T+5min) around their label T;
+    a bar is finished once a trade at or after T+5min has been seen, so only
+    the trades after the start of the bar of the latest trade are carried
+    over to the next chunk.
+
+    Duplicated trades are dropped by a `utilities.StreamingDeduplicator`
+    before that, which holds back the last 10 minutes of trades of a chunk
+    (or file) to resolve duplicates straddling the boundary.
 
-def update_perpetual_from_api() -> None:
-    """Update feather with perpetual prices."""
+    Parameters
+    ----------
+    paths : list
+        paths to 'matches_history' files, ordered by month
+    path_to_out : str
+        feather (Arrow IPC) file or partitioned dataset to write to
+    chunksize : int
+        number of rows per chunk
+    storage : str
+        'feather' or 'partitioned'
+    """
+    freq = pd.Timedelta("10T").value
+    offset = pd.Timedelta("5T").value
+
+    # dictionaries of the arrow file may only grow from batch to batch
+    categories = dict()
+    options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+
+    dedup = StreamingDeduplicator(TRADE_KEY, by="size", window="10T")
+
+    carry = None
+    cutoff = None
+    n_late = 0
+
+    with contextlib.ExitStack() as stack:
+        if storage == "partitioned":
+            remove_dataset(path_to_out)
+        else:
+            sink = stack.enter_context(pa.OSFile(path_to_out, "wb"))
+        writer = None
+
+        def write_(trades) -> None:
+            nonlocal writer
+            bars = aggregate_data(trades, agg_freq="10T", offset_freq="5T",
+                                  datetime_col="timestamp",
+                                  objective_col="price", weight_col="size",
+                                  other_cols=["tradeable", "aggressor"])
+            bars = _rename_perpetual_bars(bars)
+            if storage == "partitioned":
+                write_partitions(bars, path_to_out, mode="append",
+                                 float32=FLOAT32)
+                return
+
+            count(rows_out=len(bars))
+            table = encode(bars, FLOAT32, categories)
+            if writer is None:
+                writer = stack.enter_context(
+                    pa.ipc.new_file(sink, table.schema, options=options)
+                )
+            writer.write_table(table)
+
+        def add_(trades) -> None:
+            nonlocal carry, cutoff, n_late
+            if (trades is None) or (len(trades) < 1):
+                return
+
+            data_ = trades if carry is None else pd.concat((carry, trades))
+            t = data_["timestamp"].values.view("int64")
+
+            # trades belonging to already written bars cannot be used
+            if cutoff is not None:
+                late = t < cutoff
+                if late.any():
+                    n_late += late.sum()
+                    data_, t = data_.loc[~late], t[~late]
+
+            if len(t) < 1:
+                carry = None
+                return
+
+            # start of the bar of the latest trade
+            cutoff = (t.max() - offset) // freq * freq + offset
+
+            done = t < cutoff
+            carry = data_.loc[~done]
+
+            if done.any():
+                write_(data_.loc[done])
+
+        for path_ in paths:
+            logger.info(f"streaming {os.path.basename(path_)}...")
+            count(bytes_read=file_size(path_))
+
+            for chunk_ in _read_matches_history(path_, chunksize=chunksize):
+                count(rows_in=len(chunk_))
+                chunk_ = chunk_.dropna()
+                if len(chunk_) < 1:
+                    continue
+
+                chunk_ = chunk_.assign(
+                    timestamp=pd.to_datetime(chunk_["timestamp"])
+                    .dt.tz_localize("UTC")
+                )
+                add_(dedup.push(chunk_))
+
+        add_(dedup.flush())
+        n_late += dedup.n_late
+
+        # flush the last unfinished bar
+        if (carry is not None) and (len(carry) > 0):
+            write_(carry)
+
+        if (storage != "partitioned") and (writer is None):
+            logger.warning("no trades found, writing an empty file")
+            empty = pd.DataFrame({"asset": [], "side": [],
+                                  "timestamp": pd.to_datetime([], utc=True),
+                                  "price": []})
+            table = encode(empty, FLOAT32)
+            stack.enter_context(pa.ipc.new_file(sink, table.schema))
+
+    if storage != "partitioned":
+        count(bytes_written=file_size(path_to_out))
+
+    count(rows_late=int(n_late))
+    if n_late > 0:
+        logger.warning(f"{n_late} trades older than already written bars "
+                       f"were skipped: these are either repeated in "
+                       f"overlapping files or the files are not sorted by "
+                       f"time")
+
+
+@stage
+def update_perpetual_from_api(storage: str = "feather") -> None:
+    """Update feather with perpetual prices.
+
+    Parameters
+    ----------
+    storage : str
+        'feather' to rewrite the whole file, 'partitioned' to rewrite only
+        the (asset, month) partitions receiving new data, see
+        `_update_prepared`
+    """
     # fetch old data first
-    path_to_ftr = os.path.join(data_dir, "prepared", "perpetual", "kraken")
+    path_to_ftr = os.path.join(data_dir(), "prepared", "perpetual", "kraken")
 
-    if "perp-bidask-kraken.ftr" not in os.listdir(path_to_ftr):
+    if storage == "feather" and \
+            "perp-bidask-kraken.ftr" not in os.listdir(path_to_ftr):
         raise ValueError("make sure 'perp-bidask-kraken.ftr' is in data/perp")
 
-    data_old = pd.read_feather(f"{path_to_ftr}/perp-bidask-kraken.ftr")
+    data_old = _read_prepared_tail("perpetual", "perp-bidask-kraken",
+                                   storage)
 
     # those are the currencies to fetch data on
     currencies = data_old["asset"].unique()
 
     # start date is the last date of `data_old`
-    start_dt = data_old\
-        .pivot(index="timestamp", columns=["asset", "side"], values="price")\
-        .last_valid_index()
+    start_dt = pivot(data_old, index="timestamp", columns=["asset", "side"],
+                     values="price").last_valid_index()
 
     # end date is the start of today
     end_dt = pd.Timestamp(datetime.date.today(), tz="UTC")
 
-    data = dict()
-    for c_ in currencies:
-        data_c = _get_perpetual_from_api(c_, start_dt, end_dt)
-        data[c_] = data_c
+    data = _map_currencies(_get_perpetual_from_api, currencies,
+                           start_dt, end_dt)
 
     data_new = pd.concat(data, axis=0, names=["asset", "index"])\
         .reset_index(level="asset").reset_index(drop=True)
 
-    data_upd = pd.concat((data_old, data_new))\
-        .drop_duplicates(subset=["asset", "side", "timestamp"])\
-        .reset_index(drop=True)
-
     # save
-    data_upd.to_feather(os.path.join(path_to_ftr, "perp-bidask-kraken.ftr"))
+    _update_prepared(data_old, data_new, "perpetual", "perp-bidask-kraken",
+                     storage, subset=["asset", "side", "timestamp"])
 
     return
 
 
-def save_funding_rates() -> None:
+@stage
+def save_funding_rates(storage: str = "feather") -> None:
     """Save abs and rel funding rates using the API.
 
     Works via an API call to kraken's website.
@@ -282,27 +538,34 @@ def save_funding_rates() -> None:
         'asset' (str, 3-letter iso e.g. 'xrp'),
         'rate' (float)
 
+    Parameters
+    ----------
+    storage : str
+        'feather' or 'partitioned', see `_save_prepared`
+
     """
     logger.info("saving funding rates...")
 
     endpoint = "historicalfundingrates"
 
-    res = dict()
-
-    for c in ["XBT", "BCH", "LTC", "ETH", "XRP"]:
+    @stage
+    def get_rates(c) -> pd.DataFrame:
         logger.info(f"saving funding rates for {c}...")
 
         # request
         parameters = f"symbol=PI_{c}USD"
         u = f"{ROOT_URL}/{endpoint}?{parameters}"
-        resp = requests.get(u)
+        resp = _get_fetcher("perp").get_json(u)
 
         # convert to DataFrame
-        chunk = pd.DataFrame.from_records(resp.json()["rates"])
+        chunk = pd.DataFrame.from_records(resp["rates"])
+        count(rows_in=len(chunk))
         chunk.index = chunk.pop("timestamp").map(pd.to_datetime)
         chunk = chunk.rename(columns={"fundingRate": "absolute",
                                       "relativeFundingRate": "relative"})
-        res[c] = chunk
+        return chunk
+
+    res = _map_currencies(get_rates, ["XBT", "BCH", "LTC", "ETH", "XRP"])
 
     res = pd.concat(res, axis=1, names=["asset", "which"])\
         .stack(level=[0, 1]).rename("rate")\
@@ -310,12 +573,11 @@ def save_funding_rates() -> None:
 
     res.loc[:, "asset"] = res.loc[:, "asset"].str.lower()
 
-    path_to_out = os.path.join(data_dir, "prepared/funding/kraken",
-                               "funding-r-kraken.ftr")
-    res.to_feather(path_to_out)
+    path_to_out = _save_prepared(res, "funding", "funding-r-kraken", storage)
     logger.info(f"funding rates saved to {path_to_out}")
 
 
+@stage
 def _get_spot_from_ohlcv(currency) -> pd.DataFrame:
     """Get spot ohlcvt data from .csv files saved from kraken.
 
@@ -338,7 +600,7 @@ def _get_spot_from_ohlcv(currency) -> pd.DataFrame:
     pandas.DataFrame
         with columns 'timestamp' (UTC-aware Timestamp), 'price' (float)
     """
-    data_src = os.path.join(data_dir, "raw/spot/kraken")
+    data_src = os.path.join(data_dir(), "raw/spot/kraken")
 
     # detect the .zip file
     z = [
@@ -355,21 +617,20 @@ def _get_spot_from_ohlcv(currency) -> pd.DataFrame:
     base_c = z.split("_")[0]
     csv_fname = f"{base_c}USD_1.csv"
 
-    # unzip if not yet
-    with zipfile.ZipFile(zip_fname, mode='r') as uz:
-        uz.extract(member=csv_fname, path=data_src)
-
-    # read in chunks, columns are timestamp, price, volume
-    chunk = pd.read_csv(f"{data_src}/{csv_fname}",
-                        header=None,
-                        dtype={0: int, 6: int})
-    os.remove(f"{data_src}/{csv_fname}")
-
-    # rename cols from ordinal to meaningful, rows to Timestamp
-    columns = ["timestamp", "open", "high", "low", "close", "volume", "trades"]
-    chunk.columns = columns
-    chunk.loc[:, "timestamp"] = chunk["timestamp"]\
-        .map(lambda x: pd.Timestamp(x, unit="s", tz="UTC"))
+    # read the needed columns straight from the archive member: timestamp,
+    # close price and volume, the latter two in single precision only if
+    # prepared prices are (volumes come with 8 decimals)
+    precision = "float32" if FLOAT32 else "float64"
+    with zipfile.ZipFile(zip_fname, mode='r') as uz, \
+            uz.open(csv_fname) as f:
+        chunk = pd.read_csv(f, header=None, usecols=[0, 4, 5],
+                            dtype={0: "int64", 4: precision, 5: precision})
+    count(bytes_read=file_size(zip_fname), rows_in=len(chunk))
+
+    # rename cols from ordinal to meaningful, epochs to Timestamp
+    chunk.columns = ["timestamp", "close", "volume"]
+    chunk.loc[:, "timestamp"] = pd.to_datetime(chunk["timestamp"], unit="s",
+                                               utc=True)
 
     res = aggregate_data(chunk, agg_freq="10T", offset_freq="5T",
                          datetime_col="timestamp", objective_col="close",
@@ -392,7 +653,7 @@ def _process_perpetual_api_call(request_str) -> Tuple[List, pd.Timestamp]:
     t_final : pd.Timestamp
         tz-agnostic timestamp of the latest data point to use for further calls
     """
-    response = requests.get(request_str).json()
+    response = _get_fetcher("perp").get_json(request_str)
 
     chunk = []
     timestamps = []
@@ -416,7 +677,7 @@ def _process_perpetual_api_call(request_str) -> Tuple[List, pd.Timestamp]:
     return chunk, t_final
 
 
-@memory.cache
+@stage
 def _get_perpetual_from_api(currency, start_dt, end_dt) -> pd.DataFrame:
     """Get perpetual bid/ask prices using the API.
 
@@ -424,8 +685,14 @@ def _get_perpetual_from_api(currency, start_dt, end_dt) -> pd.DataFrame:
 
     Pulls perpetual futures price data in chunks of size 1000, using the
     last timestamp of each call as the new start date until `end_dt` is
-    reached. Then aggregates at the 10-min frequency using the same
-    methodology as `get_spot_from_ohlcv`.
+    reached. Pages are aggregated at the 10-min frequency as they come in,
+    using the same methodology as `get_spot_from_ohlcv`.
+
+    Raw pages are checkpointed in data/checkpoints/kraken/perp as they
+    arrive, keyed by currency and the `since` cursor (in ms), together with
+    the bars aggregated so far: a pull that was interrupted, or one with a
+    later `end_dt`, resumes from the last committed page, and only pages
+    after it are aggregated, see `_aggregate_pages`.
 
     Parameters
     ----------
@@ -447,31 +714,36 @@ def _get_perpetual_from_api(currency, start_dt, end_dt) -> pd.DataFrame:
     t = start_dt.tz_localize(None)
     end_dt = end_dt.tz_localize(None)
 
-    res_raw = []
-
-    while t < end_dt:
-        print(f"timestamp: {t}")
+    def fetch_page(since) -> Tuple[List, int]:
+        logger.debug(f"{pair}: page from {pd.Timestamp(since, unit='ms')}")
 
         # request string: timestamp on Kraken is in ms and must be integer!
-        parameters = f"since={(t.timestamp() * 1000):.0f}&sort=asc"
+        parameters = f"since={since}&sort=asc"
         request_str = f"{ROOT_URL_PERP.format(pair)}?{parameters}"
 
-        chunk_, t = _process_perpetual_api_call(request_str)
+        chunk_, t_ = _process_perpetual_api_call(request_str)
 
-        res_raw += chunk_
+        return chunk_, int(round(t_.timestamp() * 1000))
 
-    # calculate price as weighted mean by buy/sell
-    data_df = pd.DataFrame.from_records(res_raw)
-    data_df.loc[:, ["price", "quantity"]] = \
-        data_df[["price", "quantity"]].astype(float)
-    data_df.loc[:, "timestamp"] = data_df["timestamp"]\
-        .map(lambda x: pd.Timestamp(x, unit="ms", tz="UTC"))
-    data_df.loc[:, "side"] = data_df["side"].map({"Buy": "ask", "Sell": "bid"})
-
-    # aggregate
-    res = aggregate_data(data_df, agg_freq="10T", offset_freq="5T",
-                         datetime_col="timestamp", objective_col="price",
-                         weight_col="quantity", other_cols=["side"])
+    def to_frame(records) -> pd.DataFrame:
+        count(rows_in=len(records))
+        data_ = pd.DataFrame.from_records(
+            records, columns=["timestamp", "price", "side", "quantity"]
+        )
+        data_[["price", "quantity"]] = \
+            data_[["price", "quantity"]].astype(float)
+        data_["timestamp"] = pd.to_datetime(data_["timestamp"], unit="ms",
+                                            utc=True)
+        data_["side"] = data_["side"].map({"Buy": "ask", "Sell": "bid"})
+        return data_
+
+    # calculate price as weighted mean by buy/sell, page by page
+    res = _aggregate_pages(
+        "perp", currency, int(round(t.timestamp() * 1000)),
+        int(round(end_dt.timestamp() * 1000)), fetch_page,
+        cursor_of=lambda x: x["timestamp"], to_frame=to_frame,
+        weight_col="quantity"
+    )
 
     return res
 
@@ -483,7 +755,7 @@ def _process_spot_api_call(request_str) -> (pd.DataFrame, pd.Timestamp):
     ----------
     request_str : str
     """
-    resp = requests.get(request_str).json()
+    resp = _get_fetcher("spot").get_json(request_str)
 
     # convert to DataFrame
     k = [k_ for k_ in resp["result"].keys() if k_ != "last"][0]
@@ -495,11 +767,14 @@ def _process_spot_api_call(request_str) -> (pd.DataFrame, pd.Timestamp):
     return chunk, t_final
 
 
-@memory.cache
+@stage
 def _get_spot_from_api(currency, start_dt, end_dt) -> pd.DataFrame:
     """Get spot prices of usd pairs from Kraken using API.
 
-    Introduces delay of 1.9 sec after each API call.
+    Calls are paced by the rate limiter of the shared spot fetcher. Raw
+    pages and bars are checkpointed in data/checkpoints/kraken/spot, keyed
+    by currency and the `since` cursor (in sec), the same way as in
+    `_get_perpetual_from_api`.
 
     Parameters
     ----------
@@ -515,31 +790,270 @@ def _get_spot_from_api(currency, start_dt, end_dt) -> pd.DataFrame:
     t = start_dt.tz_localize(None)
     end_dt = end_dt.tz_localize(None)
 
-    chunks = []
-
-    while t < end_dt:
-        print(f"{currency} - {t}")
+    def fetch_page(since) -> Tuple[List, float]:
+        logger.debug(f"{currency}: page from {pd.Timestamp(since, unit='s')}")
         # timestamp is in seconds
-        parameters = f"pair={currency}usd&since={(t.timestamp()):.4f}"
+        parameters = f"pair={currency}usd&since={since:.4f}"
         request_str = f"{ROOT_URL_SPOT}/{endpoint}?{parameters}"
 
-        chunk_, t = _process_spot_api_call(request_str)
+        chunk_, t_ = _process_spot_api_call(request_str)
+
+        return chunk_.values.tolist(), float(chunk_[2].max())
 
-        # idle time
-        time.sleep(1.9)
+    def to_frame(records) -> pd.DataFrame:
+        count(rows_in=len(records))
+        data_ = pd.DataFrame.from_records(records, columns=cols)
+        data_[["price", "volume"]] = data_[["price", "volume"]].astype(float)
+        data_["timestamp"] = pd.to_datetime(data_["timestamp"], unit="s",
+                                            utc=True)
+        data_["side"] = data_["side"].astype(SPOT_SIDES)
+        return data_
 
-        chunks.append(chunk_)
+    res = _aggregate_pages("spot", currency, t.timestamp(),
+                           end_dt.timestamp(), fetch_page,
+                           cursor_of=lambda x: x[2], to_frame=to_frame,
+                           weight_col="volume")
+
+    return res
+
+
+def configure(root_url: str = None, root_url_spot: str = None,
+              root_url_perp: str = None, rate_limit_spot: tuple = None,
+              rate_limit_perp: tuple = None) -> None:
+    """Point the API calls at other base urls or change the rate limits.
+
+    Arguments left None are not changed; fetchers are recreated on their
+    next use. See `setup` for the defaults and `replay.ReplayServer.urls`
+    for urls of a local server.
+
+    Parameters
+    ----------
+    root_url, root_url_spot, root_url_perp : str
+        as in `setup`
+    rate_limit_spot, rate_limit_perp : tuple
+        (requests per second, burst)
+    """
+    global ROOT_URL, ROOT_URL_SPOT, ROOT_URL_PERP, RATE_LIMIT_SPOT, \
+        RATE_LIMIT_PERP
+
+    with _fetchers_lock:
+        if root_url is not None:
+            ROOT_URL = root_url
+        if root_url_spot is not None:
+            ROOT_URL_SPOT = root_url_spot
+        if root_url_perp is not None:
+            ROOT_URL_PERP = root_url_perp
+        if rate_limit_spot is not None:
+            RATE_LIMIT_SPOT = tuple(rate_limit_spot)
+        if rate_limit_perp is not None:
+            RATE_LIMIT_PERP = tuple(rate_limit_perp)
+
+        for f_ in _fetchers.values():
+            f_.close()
+        _fetchers.clear()
+
+
+def _get_fetcher(which) -> Fetcher:
+    """Get the shared fetcher of the 'spot' or 'perp' API."""
+    with _fetchers_lock:
+        if which not in _fetchers:
+            rate, burst = {"spot": RATE_LIMIT_SPOT,
+                           "perp": RATE_LIMIT_PERP}[which]
+            _fetchers[which] = Fetcher(rate=rate, burst=burst)
+
+    return _fetchers[which]
+
+
+def _map_currencies(func, currencies, *args) -> dict:
+    """Call `func(c_, *args)` for all currencies concurrently.
+
+    Pages of each currency are fetched one after another, as every call
+    depends on the result of the previous one, but currencies are paged
+    through at the same time, in threads sharing the rate limit.
+
+    Returns
+    -------
+    dict
+        currency -> result of `func`
+    """
+    res = imap_ordered(lambda c_: func(c_, *args), currencies,
+                       n_jobs=max(len(currencies), 1), executor="thread")
 
-    data = pd.concat(chunks)
-    data.columns = cols
-    data.loc[:, ["price", "volume"]] = \
-        data[["price", "volume"]].astype(float)
-    data.loc[:, "timestamp"] = data["timestamp"] \
-        .map(lambda x: pd.Timestamp(x, unit="s", tz="UTC"))
-    data.loc[:, "side"] = data["side"].astype("category")
+    return dict(zip(currencies, res))
 
-    res = aggregate_data(data, agg_freq="10T", offset_freq="5T",
-                         datetime_col="timestamp", objective_col="price",
-                         weight_col="volume", other_cols=["side"])
+
+def _page_store(which) -> PageStore:
+    """Get the page checkpoints of the 'spot' or 'perp' API."""
+    return PageStore(os.path.join(data_dir(), "checkpoints/kraken", which))
+
+
+def _aggregate_pages(which, currency, start, end, fetch_page, cursor_of,
+                     to_frame, weight_col) -> pd.DataFrame:
+    """Aggregate the pages of an API pull into 10-minute bars by side.
+
+    The bars, and the rows of the bar still open, are checkpointed after
+    every page in the state log of the pages (see `PageStore.state_log`).
+    A pull from the same `start` picks them up as of the last page they
+    account for and only aggregates the pages after it, replayed or
+    fetched; one starting within the pages of another is aggregated from
+    `start` on without them.
+
+    Parameters
+    ----------
+    which : str
+        'spot' or 'perp'
+    currency : str
+    start, end, fetch_page, cursor_of
+        see `PageStore.pages`
+    to_frame : callable
+        records of a page -> pandas.DataFrame with columns 'timestamp',
+        'price', 'side' and `weight_col`
+    weight_col : str
+
+    Returns
+    -------
+    pandas.DataFrame
+        see `aggregate_data`
+    """
+    store = _page_store(which)
+    agg = ChunkAggregator(agg_freq="10T", offset_freq="5T",
+                          datetime_col="timestamp", objective_col="price",
+                          weight_col=weight_col, other_cols=["side"])
+
+    state = store.state_log(currency, start)
+    t = start
+    if state.first_cursor not in (None, start):
+        state = None
+    else:
+        # as far as the pages would be replayed
+        empty = to_frame(list())
+        for s_ in state.pages():
+            if t >= end:
+                break
+            bars = s_["records"]["bars"]
+            if bars:
+                agg.bars.append(_frame_from_json(
+                    bars, empty[["timestamp", "side", "price"]]
+                ))
+            agg.carry = _frame_from_json(s_["records"]["carry"], empty)
+            t = s_["next"]
+
+    pages = store.pages(currency, start, end, fetch_page, cursor_of,
+                        after=t)
+    for page_ in pages:
+        bars = agg.update(to_frame(page_["records"]))
+        if state is not None:
+            state.append(page_["since"], page_["next"], {
+                "bars": [] if bars is None else _frame_to_json(bars),
+                "carry": _frame_to_json(agg.carry),
+            })
+
+    return agg.result()
+
+
+def _frame_to_json(data) -> list:
+    """Rows of `data` as lists of values JSON can take; timestamps as
+    epoch ns, missing values as None (nan for floats)."""
+    cols = list()
+    for c_ in data.columns:
+        col = data[c_]
+        if pd.api.types.is_datetime64_any_dtype(col.dtype):
+            cols.append(col.values.view("int64").tolist())
+        elif pd.api.types.is_float_dtype(col.dtype):
+            cols.append(col.astype(float).tolist())
+        else:
+            cols.append(col.astype(object).where(col.notna(), None)
+                        .tolist())
+
+    return [list(r_) for r_ in zip(*cols)]
+
+
+def _frame_from_json(records, like) -> pd.DataFrame:
+    """Rows of `_frame_to_json` back as a frame of the columns and dtypes
+    of `like`."""
+    res = pd.DataFrame.from_records(records, columns=like.columns)
+    for c_, dtype_ in like.dtypes.items():
+        if pd.api.types.is_datetime64_any_dtype(dtype_):
+            res[c_] = pd.to_datetime(res[c_].astype("int64"), unit="ns",
+                                     utc=True)
+        else:
+            res[c_] = res[c_].astype(dtype_)
 
     return res
+
+
+@stage
+def _save_prepared(data, which, name, storage: str = "feather") -> str:
+    """Save a prepared dataset of prices or funding rates in full.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        long format, with columns 'asset' and 'timestamp' among others
+    which : str
+        'spot', 'perpetual' or 'funding'
+    name : str
+        name of the dataset, e.g. 'spot-close-kraken'
+    storage : str
+        'feather' to write data/prepared/<which>/kraken/<name>.ftr;
+        'partitioned' to write a parquet dataset partitioned by asset and
+        month to data/prepared/<which>/kraken/<name>/; either way, in the
+        schema of `schema.encode`, with floats in single precision if
+        `setup.FLOAT32` is True
+
+    Returns
+    -------
+    str
+        path written to
+    """
+    path = os.path.join(data_dir(), "prepared", which, "kraken", name)
+
+    if storage == "feather":
+        path = f"{path}.ftr"
+        write_feather(data, path, FLOAT32)
+    elif storage == "partitioned":
+        remove_dataset(path)
+        write_partitions(data, path, float32=FLOAT32)
+    else:
+        raise ValueError(f"unknown storage '{storage}'")
+
+    return path
+
+
+@stage
+def _read_prepared_tail(which, name, storage: str = "feather") \
+        -> pd.DataFrame:
+    """Read as much of a prepared dataset as needed to update it.
+
+    That is the whole .ftr file, or the latest month of every asset of a
+    partitioned dataset.
+    """
+    path = os.path.join(data_dir(), "prepared", which, "kraken", name)
+
+    if storage == "feather":
+        return read_dataset(f"{path}.ftr")
+    elif storage == "partitioned":
+        return read_last_partitions(path)
+    else:
+        raise ValueError(f"unknown storage '{storage}'")
+
+
+@stage
+def _update_prepared(data_old, data_new, which, name,
+                     storage: str = "feather", subset: list = None) -> None:
+    """Merge new rows into a prepared dataset, old rows winning duplicates.
+
+    With `storage='partitioned'`, only the (asset, month) partitions that
+    `data_new` falls into are read, deduplicated and rewritten.
+    """
+    path = os.path.join(data_dir(), "prepared", which, "kraken", name)
+
+    if storage == "feather":
+        data_upd = pd.concat((data_old, data_new)) \
+            .drop_duplicates(subset=subset) \
+            .reset_index(drop=True)
+        write_feather(data_upd, f"{path}.ftr", FLOAT32)
+    elif storage == "partitioned":
+        write_partitions(data_new, path, subset=subset, float32=FLOAT32)
+    else:
+        raise ValueError(f"unknown storage '{storage}'")
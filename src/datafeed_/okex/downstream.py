@@ -1,14 +1,45 @@
 import pandas as pd
 import os
 
-data_dir = os.path.join(os.environ.get("PROJECT_ROOT"), "data/")
+from ..storage import read_dataset, make_filter, make_month_filter
+from ..utilities import data_dir
 
 
-def get_perpetual(symbol: str) -> pd.Series:
-    data_path = os.path.join(data_dir, "perp")
-    res = pd.read_feather(f"{data_path}/perp-ohlc-okex.ftr")\
-        .query(f"tradeable == '{symbol}'")\
+def get_perpetual(symbol: str, start=None, end=None,
+                  columns: list = None):
+    """Read perpetual klines stored by `upstream.backfill_perpetual`.
+
+    Only the partitions of `symbol` and of the months between `start` and
+    `end` are opened.
+
+    Parameters
+    ----------
+    symbol : str
+        e.g. 'BTC'
+    start, end : str or pandas.Timestamp
+        inclusive bounds, as in `storage.make_filter`
+    columns : list
+        columns to read; None for the close price only
+
+    Returns
+    -------
+    pandas.Series or pandas.DataFrame
+        close prices, or `columns`, indexed by timestamp
+    """
+    path = os.path.join(data_dir(), "prepared", "perpetual", "okex",
+                        "perp-ohlc-okex")
+
+    filter_ = make_filter(start=start, end=end, asset=[symbol.lower()])
+    months = make_month_filter(start, end)
+    if months is not None:
+        filter_ = filter_ & months
+
+    res = read_dataset(path, columns=["timestamp"] + (columns or ["close"]),
+                       filter=filter_)\
         .set_index("timestamp")\
-        .loc[:, "close"]
+        .sort_index()
+
+    if columns is None:
+        res = res.loc[:, "close"]
 
     return res
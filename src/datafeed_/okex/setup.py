@@ -1 +1,12 @@
-ROOT_URL = "https://www.okex.com/api/v5"
+import os
+
+# base url can be pointed elsewhere with the environment variable of the
+# same name
+ROOT_URL = os.environ.get("OKEX_ROOT_URL", "https://www.okex.com/api/v5")
+
+# public market data allows 20 requests per 2 seconds per ip, as
+# (requests per second, burst)
+RATE_LIMIT = (10.0, 20)
+
+# number of shards to fetch at the same time
+N_THREADS = 4
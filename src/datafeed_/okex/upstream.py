@@ -1,51 +1,201 @@
+import logging
+import os
+import threading
+
 import pandas as pd
-import requests
-import time
-import pytz
-import datetime
 
-from .setup import ROOT_URL
+from ..fetcher import Fetcher
+from ..instrument import stage, count
+from ..storage import write_partitions, partition_keys
+from ..utilities import imap_ordered, data_dir
+from .setup import ROOT_URL, RATE_LIMIT, N_THREADS
+
+logger = logging.getLogger(__name__)
+
+# candles per page of 'history-candles', the maximum allowed
+PAGE_SIZE = 100
+
+# http fetcher shared by all threads, hence one rate limit for all shards
+# and symbols; created on first use
+_fetcher = None
+_fetcher_lock = threading.Lock()
 
 
-def save_perpetual(symbol: str):
-    """Get 4-hour klines from OKEX.
+def perpetual_path() -> str:
+    """Dataset of perpetual klines, partitioned by asset and month."""
+    return os.path.join(data_dir(), "prepared", "perpetual", "okex",
+                        "perp-ohlc-okex")
+
+
+@stage
+def save_perpetual(symbol: str, start="2018-12", end="2021-06") \
+        -> pd.DataFrame:
+    """Get hourly klines from OKEX.
+
+    Wrapper around `backfill_perpetual` for one symbol.
 
     Parameters
     ----------
     symbol
         3-letter xymbol, one of (BTC, ETH, XRP, LTC)
-
+    start, end : str
+        first and last months
+
+    Returns
+    -------
+    pandas.DataFrame
+        indexed by timestamp, with columns 'open', 'high', 'low', 'close',
+        'vol'
     """
-    endpoint = "market/history-candles"
+    from .downstream import get_perpetual
 
-    data = list()
-    end_dt = int(datetime.datetime(2021, 6, 30).timestamp() * 1000)
+    backfill_perpetual([symbol], start, end)
 
-    while True:
-        print(f"doing timestamp {end_dt}")
-        parameters = f"instId={symbol.upper()}-USD-SWAP&after={end_dt}&bar=1H"
-        u = f"{ROOT_URL}/{endpoint}?{parameters}"
+    return get_perpetual(symbol, start=start, end=end,
+                         columns=["open", "high", "low", "close", "vol"])
+
+
+@stage
+def backfill_perpetual(symbols: list, start, end, bar: str = "1H",
+                       n_jobs: int = N_THREADS, overwrite: bool = False) \
+        -> list:
+    """Fetch the history of perpetual swaps, month by month, concurrently.
 
-        resp = requests.get(u)
+    The history of each symbol is split into calendar months, the shards,
+    each paged backwards on its own; shards of all symbols are fetched in
+    `n_jobs` threads sharing one rate limit, `setup.RATE_LIMIT`. A shard is
+    written to its (asset, month) partition of `perpetual_path` as soon as
+    it is done, in order, so that an interrupted backfill loses only the
+    shards in flight and leaves no gaps; on a rerun, of the months stored
+    only the latest of each asset is fetched again.
 
-        chunk = pd.DataFrame.from_records(resp.json()["data"])
+    Parameters
+    ----------
+    symbols : list
+        3-letter symbols, e.g. ['BTC', 'ETH']; stored as lowercase 'asset'
+    start, end : str
+        first and last months, e.g. '2019-01'
+    bar : str
+        kline size as in the API, e.g. '1H'
+    n_jobs : int
+        number of shards to fetch at the same time
+    overwrite : bool
+        True to fetch all shards, including those stored already
+
+    Returns
+    -------
+    list
+        (asset, month) of the partitions written
+    """
+    path = perpetual_path()
+    months = pd.period_range(start, end, freq="M")
+
+    shards = list()
+    for s_ in symbols:
+        asset = s_.lower()
+        stored = set() if overwrite else _stored_months(path, asset)
+        shards += [(s_, m_) for m_ in months if str(m_) not in stored]
+
+    logger.info(f"backfilling {len(shards)} of "
+                f"{len(symbols) * len(months)} symbol-months...")
+    count(cache_hits=len(symbols) * len(months) - len(shards),
+          cache_misses=len(shards))
+
+    def fetch(shard):
+        return _fetch_shard(*shard, bar=bar)
+
+    written = list()
+    for (symbol_, month_), data_ in zip(
+            shards, imap_ordered(fetch, shards, n_jobs=n_jobs,
+                                 executor="thread")):
+        if len(data_) == 0:
+            logger.info(f"{symbol_} {month_}: no klines")
+            continue
+        data_.insert(0, "asset", symbol_.lower())
+        written += write_partitions(data_, path, subset=["timestamp"],
+                                    keep="last")
+
+    return written
+
+
+@stage
+def _fetch_shard(symbol, month, bar: str = "1H") -> pd.DataFrame:
+    """Klines of one symbol over one month, paged backwards from its end."""
+    after = int(month.end_time.ceil("ms").value // 10 ** 6)
+    before = int(month.start_time.value // 10 ** 6) - 1
 
-        if len(chunk) < 1:
+    data = list()
+    while True:
+        resp = _get_fetcher().get_json(
+            f"{ROOT_URL}/market/history-candles",
+            params={"instId": f"{symbol.upper()}-USD-SWAP", "bar": bar,
+                    "after": after, "before": before, "limit": PAGE_SIZE}
+        )
+        if resp.get("code", "0") != "0":
+            raise ValueError(f"{symbol} {month}: {resp.get('msg')}")
+        count(pages_fetched=1, rows_in=len(resp["data"]))
+
+        if len(resp["data"]) == 0:
             break
+        data += resp["data"]
 
-        data.append(chunk)
+        if len(resp["data"]) < PAGE_SIZE:
+            break
+        after = min(int(r_[0]) for r_ in resp["data"])
 
-        end_dt = chunk[0].min()
+    return _to_frame(data)
 
-        time.sleep(2 / 19)
 
-    res = pd.concat(data, axis=0).iloc[:, :-1]
-    res[0] = res[0].map(int).div(1000)\
-        .map(lambda x: datetime.datetime.fromtimestamp(x, tz=pytz.UTC))
-    res.columns = ["timestamp", "open", "high", "low", "close", "vol"]
-    res = res.set_index("timestamp").sort_index(axis=0).astype(float)
+def _to_frame(data) -> pd.DataFrame:
+    """Records of the API, newest first, to a frame sorted by time."""
+    columns = ["timestamp", "open", "high", "low", "close", "vol"]
+    res = pd.DataFrame([r_[:6] for r_ in data], columns=columns)
 
-    res.reset_index().to_feather(f"data/perp/perp-ohlc-okex-{symbol}.ftr")
+    res["timestamp"] = pd.to_datetime(res["timestamp"].astype("int64"),
+                                      unit="ms", utc=True)
+    res[columns[1:]] = res[columns[1:]].astype(float)
+    res = res.drop_duplicates(subset="timestamp")\
+        .sort_values("timestamp")\
+        .reset_index(drop=True)
 
     return res
 
+
+def _stored_months(path, asset) -> set:
+    """Months stored for `asset`, but the latest, which may be incomplete."""
+    if asset not in partition_keys(path):
+        return set()
+
+    months = sorted(d_.split("=", 1)[1] for d_ in
+                    os.listdir(os.path.join(path, f"asset={asset}"))
+                    if d_.startswith("month="))
+
+    return set(months[:-1])
+
+
+def _get_fetcher() -> Fetcher:
+    global _fetcher
+
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = Fetcher(*RATE_LIMIT, pool_size=N_THREADS)
+
+    return _fetcher
+
+
+def configure(root_url: str = None, rate_limit: tuple = None) -> None:
+    """Point the API calls at another base url or change the rate limit.
+
+    Arguments left None are not changed; the fetcher is recreated on its
+    next use.
+    """
+    global ROOT_URL, RATE_LIMIT, _fetcher
+
+    with _fetcher_lock:
+        if root_url is not None:
+            ROOT_URL = root_url
+        if rate_limit is not None:
+            RATE_LIMIT = tuple(rate_limit)
+        if _fetcher is not None:
+            _fetcher.close()
+        _fetcher = None
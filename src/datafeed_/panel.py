@@ -0,0 +1,321 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from .instrument import count
+from .storage import read_dataset
+from .utilities import pivot
+
+
+class PanelCache:
+    """Wide (pivoted) panels of long-format datasets, cached on disk and in
+    memory.
+
+    A panel is the result of `utilities.pivot(data, index, columns, values)`,
+    `data.pivot(index, columns, values)` with sorted columns. It is kept as
+    an uncompressed arrow file under `path`, memory-mapped when read, next
+    to a .json file with the fingerprint of the source it was built from;
+    the last `maxsize` panels used are also kept in memory.
+
+    A panel is valid as long as its source is unchanged: the size and
+    mtime of the source file(s) are compared first, and if these differ,
+    the hash of their contents, so that a source rewritten with the same
+    data does not trigger a rebuild.
+
+    Parameters
+    ----------
+    path : str
+        directory to keep the panels in; created if missing
+    maxsize : int
+        number of panels to keep in memory
+    """
+    def __init__(self, path, maxsize: int = 8):
+        self.path = path
+        self.maxsize = maxsize
+        self.n_builds = 0
+        self._lru = OrderedDict()
+
+    def get(self, source, index, columns, values) -> pd.DataFrame:
+        """Get the panel of `source`, building it if needed.
+
+        Parameters
+        ----------
+        source : str
+            .ftr file or partitioned dataset (see `storage.read_dataset`)
+        index, columns, values
+            as in `pandas.DataFrame.pivot`
+
+        Returns
+        -------
+        pandas.DataFrame
+            a copy, free to modify
+        """
+        columns = [columns] if isinstance(columns, str) else list(columns)
+        key = (os.path.abspath(source), index, tuple(columns), values)
+        fingerprint = _fingerprint(source)
+
+        if key in self._lru and self._lru[key][0] == fingerprint:
+            self._lru.move_to_end(key)
+            count(cache_hits=1)
+            return self._lru[key][1].copy()
+
+        name = hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()
+        path_panel = os.path.join(self.path, f"{name}.arrow")
+        path_meta = os.path.join(self.path, f"{name}.json")
+
+        meta = None
+        if os.path.exists(path_meta) and os.path.exists(path_panel):
+            with open(path_meta) as f:
+                meta = json.load(f)
+
+        if (meta is not None) and (meta["source"] != fingerprint):
+            if meta["hash"] == _content_hash(source):
+                # touched, not changed
+                meta["source"] = fingerprint
+                _dump_atomic(meta, path_meta)
+            else:
+                meta = None
+
+        if meta is None:
+            res = pivot(read_dataset(source), index, columns, values)
+            self._write(res, path_panel)
+            _dump_atomic({"source": fingerprint,
+                          "hash": _content_hash(source)}, path_meta)
+            self.n_builds += 1
+            count(cache_misses=1)
+        else:
+            res = self._read(path_panel)
+            count(cache_hits=1)
+
+        self._lru[key] = (fingerprint, res)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
+
+        return res.copy()
+
+    def clear(self) -> None:
+        """Forget the panels held in memory."""
+        self._lru.clear()
+
+    def _write(self, panel, path) -> None:
+        """Write a panel, its column labels going to the schema metadata."""
+        os.makedirs(self.path, exist_ok=True)
+
+        data = {panel.index.name: pa.array(panel.index)}
+        for n_, c_ in enumerate(panel.columns):
+            data[str(n_)] = pa.array(panel[c_].values)
+
+        labels = [list(c_) if isinstance(c_, tuple) else [c_]
+                  for c_ in panel.columns]
+        table = pa.table(data).replace_schema_metadata({
+            "index": json.dumps(panel.index.name),
+            "column_names": json.dumps(list(panel.columns.names)),
+            "columns": json.dumps(labels),
+        })
+
+        tmp = f"{path}.tmp"
+        with pa.OSFile(tmp, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _read(path) -> pd.DataFrame:
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+
+        meta = {k_.decode(): json.loads(v_)
+                for k_, v_ in table.schema.metadata.items()}
+        res = table.to_pandas().set_index(meta["index"])
+
+        if len(meta["column_names"]) > 1:
+            res.columns = pd.MultiIndex.from_tuples(
+                [tuple(c_) for c_ in meta["columns"]],
+                names=meta["column_names"]
+            )
+        else:
+            res.columns = pd.Index([c_[0] for c_ in meta["columns"]],
+                                   name=meta["column_names"][0])
+
+        return res
+
+
+class AlignedPanel:
+    """Series sampled on one time grid, as one array.
+
+    Parameters
+    ----------
+    index : pandas.DatetimeIndex
+        the grid, in UTC
+    columns : pandas.Index
+        one label per series, e.g. (venue, asset, instrument, field)
+    values : numpy.ndarray
+        (time, series), float64, C-contiguous; nan where a series has no
+        observation fresh enough
+    """
+    def __init__(self, index, columns, values):
+        self.index = index
+        self.columns = columns
+        self.values = values
+
+    @property
+    def shape(self) -> tuple:
+        return self.values.shape
+
+    def to_frame(self) -> pd.DataFrame:
+        """The panel as a DataFrame, a view of `values`."""
+        return pd.DataFrame(self.values, index=self.index,
+                            columns=self.columns, copy=False)
+
+    def select(self, **levels) -> "AlignedPanel":
+        """Series with the given labels, e.g. `select(asset=['xbt'])`."""
+        mask = np.ones(len(self.columns), dtype=bool)
+        for level_, values in levels.items():
+            if values is None:
+                continue
+            values = [values] if isinstance(values, str) else values
+            mask &= self.columns.get_level_values(level_).isin(values)
+
+        return AlignedPanel(self.index, self.columns[mask],
+                            np.ascontiguousarray(self.values[:, mask]))
+
+
+def align(series: dict, freq: str, start=None, end=None,
+          max_staleness=None, names: list = None) -> AlignedPanel:
+    """Sample series on a common grid with as-of joins.
+
+    The value of a series at a grid point is its last observation at or
+    before it, unless that is `max_staleness` old or older. With the
+    default staleness of one period, this is
+    `s.resample(freq, closed='right', label='right').last()` reindexed to
+    the grid, for all series in one pass each: a binary search of the grid
+    in the timestamps of the series, rather than a groupby.
+
+    Parameters
+    ----------
+    series : dict
+        label -> pandas.Series indexed by time (naive ones are taken to be
+        in UTC); nan values are skipped, and of equal timestamps the last
+        counts
+    freq : str
+        of the grid, e.g. '10T' or '4H'; points are multiples of it since
+        the epoch
+    start, end : str or pandas.Timestamp
+        first and last grid points, rounded up to the grid; the span of
+        `series` by default. A date string for `end` covers its whole
+        period, like with .loc and `storage.make_filter`: end='2021-03'
+        is the last grid point in March
+    max_staleness : str, pandas.Timedelta or dict
+        age from which observations are not used, the same for all series
+        or label -> age, None for no limit; one period of `freq` for
+        series not given
+    names : list
+        names of the levels of the labels
+
+    Returns
+    -------
+    AlignedPanel
+    """
+    step = pd.Timedelta(freq).value
+    labels = list(series)
+    if isinstance(max_staleness, dict):
+        limits = {l_: max_staleness.get(l_, freq) for l_ in labels}
+    else:
+        limits = dict.fromkeys(labels, max_staleness or freq)
+
+    times, values = list(), list()
+    for label_ in labels:
+        s_ = series[label_].dropna()
+        t_ = _epoch_ns(s_.index)
+        v_ = s_.values.astype(np.float64)
+        if not (np.diff(t_) >= 0).all():
+            order = np.argsort(t_, kind="stable")
+            t_, v_ = t_[order], v_[order]
+        times.append(t_)
+        values.append(v_)
+
+    nonempty = [t_ for t_ in times if len(t_) > 0]
+    t0 = _epoch_ns(pd.DatetimeIndex([start]))[0] if start is not None \
+        else min((t_[0] for t_ in nonempty), default=0)
+    t1 = _epoch_ns(pd.DatetimeIndex([end]))[0] if end is not None \
+        else max((t_[-1] for t_ in nonempty), default=-1)
+    t1 = -(-t1 // step) * step
+    if isinstance(end, str):
+        t1 = _epoch_ns(pd.DatetimeIndex([pd.Period(end).end_time]))[0] \
+            // step * step
+
+    grid = np.arange(-(-t0 // step) * step, t1 + 1, step, dtype=np.int64)
+
+    res = np.full((len(grid), len(labels)), np.nan)
+    for j_, (label_, t_, v_) in enumerate(zip(labels, times, values)):
+        if len(t_) == 0:
+            continue
+        i_ = np.searchsorted(t_, grid, side="right") - 1
+        ok = i_ >= 0
+        if limits[label_] is not None:
+            age = grid - t_[np.maximum(i_, 0)]
+            ok &= age < pd.Timedelta(limits[label_]).value
+        res[ok, j_] = v_[i_[ok]]
+
+    index = pd.DatetimeIndex(pd.to_datetime(grid, unit="ns", utc=True),
+                             name="timestamp")
+    if labels and all(isinstance(l_, tuple) for l_ in labels):
+        columns = pd.MultiIndex.from_tuples(labels, names=names)
+    else:
+        columns = pd.Index(labels, name=None if names is None else names[0])
+
+    return AlignedPanel(index, columns, res)
+
+
+def _epoch_ns(index) -> np.ndarray:
+    """Nanoseconds since the epoch, naive timestamps taken to be in UTC."""
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_convert("UTC").tz_localize(None)
+
+    return index.values.astype("datetime64[ns]").view(np.int64)
+
+
+def _source_files(source) -> list:
+    if not os.path.isdir(source):
+        return [source]
+
+    return sorted(os.path.join(d_, f_)
+                  for d_, _, fs in os.walk(source) for f_ in fs
+                  if f_.endswith(".parquet"))
+
+
+def _fingerprint(source) -> list:
+    """Relative path, size and mtime of each file of `source`."""
+    res = list()
+    for f_ in _source_files(source):
+        stat = os.stat(f_)
+        res.append([os.path.relpath(f_, source), stat.st_size,
+                    stat.st_mtime_ns])
+
+    return res
+
+
+def _content_hash(source) -> str:
+    """Hash of the names and contents of the files of `source`."""
+    h = hashlib.blake2b()
+    for f_ in _source_files(source):
+        h.update(os.path.relpath(f_, source).encode())
+        with open(f_, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+
+    return h.hexdigest()
+
+
+def _dump_atomic(obj, path) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
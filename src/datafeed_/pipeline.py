@@ -0,0 +1,304 @@
+"""Runner of the stages of data preparation.
+
+A stage declares the files and directories it reads and writes; a stage
+reading what another one writes runs after it, stages independent of each
+other run at the same time, in threads. A stage is skipped if its outputs
+exist and the contents of its inputs and its parameters are those of its
+last successful run, as kept in a .json state file. Stages without
+declared inputs, e.g. pulling from an API, always run.
+
+Contents are hashed file by file; a file with the size and mtime it had
+on the last run is not read again.
+"""
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """One step of a pipeline.
+
+    Parameters
+    ----------
+    name : str
+    func : callable
+        called with `params` as keyword arguments
+    inputs : list
+        files or directories the stage reads; None if it reads from
+        elsewhere, in which case it always runs
+    outputs : list
+        files or directories the stage writes
+    params : dict
+        keyword arguments to `func`; changing them triggers a rerun
+    """
+    def __init__(self, name: str, func, inputs: list = None,
+                 outputs: list = None, params: dict = None):
+        self.name = name
+        self.func = func
+        self.inputs = None if inputs is None else \
+            [os.path.abspath(p_) for p_ in inputs]
+        self.outputs = [os.path.abspath(p_) for p_ in (outputs or list())]
+        self.params = dict() if params is None else dict(params)
+
+    def __repr__(self):
+        return f"Stage({self.name})"
+
+    def reads_from(self, other) -> bool:
+        """Check if this stage reads what `other` writes."""
+        return any(_overlap(i_, o_) for i_ in (self.inputs or list())
+                   for o_ in other.outputs)
+
+
+class Pipeline:
+    """Stages to run in the order of their inputs and outputs.
+
+    Parameters
+    ----------
+    stages : list
+        of `Stage`, with unique names
+    state_path : str
+        .json file to keep the hashes of the inputs of the last successful
+        run of each stage in
+    n_jobs : int
+        number of stages to run at the same time; -1 for all of them
+    """
+    def __init__(self, stages: list, state_path, n_jobs: int = -1):
+        names = [s_.name for s_ in stages]
+        if len(set(names)) < len(names):
+            raise ValueError(f"stage names must be unique: {names}")
+
+        self.stages = {s_.name: s_ for s_ in stages}
+        self.state_path = state_path
+        self.n_jobs = len(stages) if n_jobs < 0 else n_jobs
+
+        self.deps = {
+            s_.name: [o_.name for o_ in stages
+                      if (o_ is not s_) and s_.reads_from(o_)]
+            for s_ in stages
+        }
+        self.order = _toposort(self.deps)
+
+        self._state = self._load_state()
+        self._lock = threading.Lock()
+
+    def plan(self, force: bool = False) -> dict:
+        """What a run would do, given the inputs as they are now.
+
+        Stages after one that is to run are reported as such, since their
+        inputs are yet to change.
+
+        Returns
+        -------
+        dict
+            stage name -> reason to run it, or 'up to date'
+        """
+        res = dict()
+        for name_ in self.order:
+            after = [d_ for d_ in self.deps[name_] if res[d_] != "up to date"]
+            if after:
+                res[name_] = f"after {', '.join(after)}"
+            else:
+                res[name_] = self._reason(self.stages[name_], force)[0] \
+                    or "up to date"
+
+        return res
+
+    def run(self, force: bool = False, only: list = None) -> dict:
+        """Run the stages that are out of date.
+
+        A failing stage does not stop the others, only those after it.
+
+        Parameters
+        ----------
+        force : bool
+            True to run stages regardless of their inputs
+        only : list
+            names of the stages to consider, all by default; stages they
+            depend on are not run if left out
+
+        Returns
+        -------
+        dict
+            stage name -> 'ran', 'skipped', 'failed' or 'blocked' (by a
+            failed stage before it)
+        """
+        names = self.order if only is None else \
+            [n_ for n_ in self.order if n_ in only]
+        unknown = set(only or list()) - set(self.order)
+        if unknown:
+            raise KeyError(f"unknown stages: {sorted(unknown)}")
+
+        status = dict()
+        todo = list(names)
+        running = dict()
+
+        with ThreadPoolExecutor(max_workers=max(self.n_jobs, 1)) as pool:
+            while todo or running:
+                for name_ in list(todo):
+                    deps = [d_ for d_ in self.deps[name_] if d_ in names]
+                    if any(status.get(d_) in ("failed", "blocked")
+                           for d_ in deps):
+                        logger.warning(f"stage {name_} blocked by a failure "
+                                       f"before it")
+                        status[name_] = "blocked"
+                        todo.remove(name_)
+                    elif all(d_ in status for d_ in deps):
+                        ctx = contextvars.copy_context()
+                        running[pool.submit(ctx.run, self._run_stage,
+                                            self.stages[name_], force)] = \
+                            name_
+                        todo.remove(name_)
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for f_ in done:
+                    status[running.pop(f_)] = f_.result()
+
+        return {n_: status[n_] for n_ in names}
+
+    def _run_stage(self, stage, force) -> str:
+        reason, hashes = self._reason(stage, force)
+        if reason is None:
+            logger.info(f"stage {stage.name}: up to date, skipped")
+            return "skipped"
+
+        logger.info(f"stage {stage.name}: running ({reason})")
+        try:
+            stage.func(**stage.params)
+        except Exception:
+            logger.exception(f"stage {stage.name} failed")
+            return "failed"
+
+        if stage.inputs is not None:
+            with self._lock:
+                self._state[stage.name] = {"params": _jsonable(stage.params),
+                                           "inputs": hashes}
+                self._dump_state()
+
+        return "ran"
+
+    def _reason(self, stage, force) -> (str, dict):
+        """Reason to run a stage, None if it is up to date, and the hashes
+        of its inputs."""
+        if stage.inputs is None:
+            return "no inputs to check", None
+
+        with self._lock:
+            last = self._state.get(stage.name)
+
+        hashes = {p_: _hash_files(p_, None if last is None else
+                                  last["inputs"].get(p_))
+                  for p_ in stage.inputs}
+
+        if force:
+            return "forced", hashes
+        if last is None:
+            return "never run", hashes
+        if not all(os.path.exists(p_) for p_ in stage.outputs):
+            return "outputs missing", hashes
+        if last["params"] != _jsonable(stage.params):
+            return "parameters changed", hashes
+        if _strip(last["inputs"]) != _strip(hashes):
+            return "inputs changed", hashes
+
+        return None, hashes
+
+    def _load_state(self) -> dict:
+        if not os.path.exists(self.state_path):
+            return dict()
+
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def _dump_state(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)),
+                    exist_ok=True)
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._state, f, indent=2)
+        os.replace(tmp, self.state_path)
+
+
+def _files(path) -> list:
+    """Files under `path`, or `path` itself if it is a file."""
+    if not os.path.exists(path):
+        return list()
+    if not os.path.isdir(path):
+        return [path]
+
+    return sorted(os.path.join(d_, f_)
+                  for d_, _, fs in os.walk(path) for f_ in fs
+                  if not f_.endswith(".tmp"))
+
+
+def _hash_files(path, last: dict = None) -> dict:
+    """Size, mtime and content hash of each file under `path`.
+
+    Files whose size and mtime are those in `last` are not read again.
+    """
+    last = dict() if last is None else last
+
+    res = dict()
+    for f_ in _files(path):
+        stat = os.stat(f_)
+        key = os.path.relpath(f_, path) if os.path.isdir(path) \
+            else os.path.basename(f_)
+        prev = last.get(key)
+        if (prev is not None) and \
+                (prev[:2] == [stat.st_size, stat.st_mtime_ns]):
+            res[key] = prev
+            continue
+
+        h = hashlib.blake2b()
+        with open(f_, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        res[key] = [stat.st_size, stat.st_mtime_ns, h.hexdigest()]
+
+    return res
+
+
+def _strip(hashes) -> dict:
+    """Content hashes only, mtimes aside."""
+    return {p_: {f_: v_[2] for f_, v_ in h_.items()}
+            for p_, h_ in hashes.items()}
+
+
+def _jsonable(params) -> dict:
+    return json.loads(json.dumps(params, default=str))
+
+
+def _overlap(a, b) -> bool:
+    """Check if one path is the other or lies under it."""
+    return (a == b) or a.startswith(b + os.sep) or b.startswith(a + os.sep)
+
+
+def _toposort(deps) -> list:
+    """Names in an order where each comes after those it depends on."""
+    res = list()
+    visiting = set()
+
+    def visit(name):
+        if name in res:
+            return
+        if name in visiting:
+            raise ValueError(f"stages depend on each other in a cycle "
+                             f"through {name}")
+        visiting.add(name)
+        for d_ in deps[name]:
+            visit(d_)
+        visiting.discard(name)
+        res.append(name)
+
+    for n_ in deps:
+        visit(n_)
+
+    return res
@@ -0,0 +1,125 @@
+"""Storage schema of prepared datasets (spot, perpetual, funding).
+
+Columns are typed by their role:
+
+    - 'asset', 'side', 'tradeable', 'which': dictionary-encoded strings
+      (pandas categoricals);
+    - 'timestamp': int64 nanoseconds since the epoch, in UTC;
+    - other float columns (prices, rates): float64, or float32 if asked
+      for.
+
+Tables carry the version of the schema in their metadata; tables without
+it (files written before the schema existed) are read as they are.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+SCHEMA_VERSION = 1
+
+DICTIONARY_COLS = ("asset", "side", "tradeable", "which")
+TIMESTAMP_COLS = ("timestamp",)
+
+_METADATA_KEY = b"datafeed_schema"
+
+
+def encode(data, float32: bool = False, categories: dict = None) \
+        -> pa.Table:
+    """Convert a prepared dataset to an arrow table of the schema.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+    float32 : bool
+        True to store float columns in single precision
+    categories : dict
+        column -> list of categories to encode it with, extended in place
+        with any new ones; for tables written batch by batch to one file,
+        whose dictionaries may only grow
+
+    Returns
+    -------
+    pyarrow.Table
+    """
+    arrays = dict()
+
+    for c_ in data.columns:
+        col = data[c_]
+
+        if c_ in DICTIONARY_COLS:
+            arrays[c_] = _dictionary(col, categories, c_)
+        elif c_ in TIMESTAMP_COLS:
+            if isinstance(col.dtype, pd.DatetimeTZDtype):
+                col = col.dt.tz_convert("UTC").dt.tz_localize(None)
+            arrays[c_] = pa.array(
+                col.values.astype("datetime64[ns]").view("int64")
+            )
+        elif float32 and pd.api.types.is_float_dtype(col.dtype):
+            arrays[c_] = pa.array(col.values.astype("float32"))
+        else:
+            arrays[c_] = pa.array(col.values)
+
+    meta = {"version": SCHEMA_VERSION, "timestamp_unit": "ns",
+            "float32": float32}
+
+    return pa.table(arrays)\
+        .replace_schema_metadata({_METADATA_KEY: json.dumps(meta)})
+
+
+def decode(table) -> pd.DataFrame:
+    """Convert an arrow table of the schema to a pandas.DataFrame.
+
+    Dictionary columns become categoricals with sorted categories, epoch
+    timestamps tz-aware (UTC) datetimes; float32 columns stay float32.
+    """
+    meta = schema_of(table)
+    res = table.to_pandas()
+
+    for c_ in res.columns:
+        if c_ in DICTIONARY_COLS:
+            col = res[c_]
+            if not isinstance(col.dtype, pd.CategoricalDtype):
+                col = col.astype("category")
+            categories = col.cat.categories
+            if not categories.is_monotonic_increasing:
+                col = col.cat.reorder_categories(categories.sort_values())
+            res[c_] = col
+        elif (c_ in TIMESTAMP_COLS) and (meta is not None):
+            res[c_] = pd.to_datetime(res[c_].values, unit="ns", utc=True)
+
+    return res
+
+
+def schema_of(table) -> dict:
+    """Schema metadata of an arrow table; None for pre-schema tables."""
+    metadata = table.schema.metadata or dict()
+    if _METADATA_KEY not in metadata:
+        return None
+
+    meta = json.loads(metadata[_METADATA_KEY])
+    if meta["version"] > SCHEMA_VERSION:
+        raise ValueError(f"schema version {meta['version']} is newer than "
+                         f"the supported {SCHEMA_VERSION}")
+
+    return meta
+
+
+def _dictionary(col, categories, name) -> pa.DictionaryArray:
+    if categories is None:
+        # sorted categories, as pandas would have them
+        col = pd.Categorical(col).remove_unused_categories()
+        if not col.categories.is_monotonic_increasing:
+            col = col.reorder_categories(col.categories.sort_values())
+    else:
+        known = categories.setdefault(name, list())
+        new = pd.Index(np.asarray(col.dropna().unique(), dtype=object))\
+            .difference(known)
+        known.extend(new)
+        col = pd.Categorical(col, categories=known)
+
+    return pa.DictionaryArray.from_arrays(
+        pa.array(col.codes.astype("int16"), mask=col.codes < 0),
+        pa.array(col.categories.values.astype(str)),
+    )
@@ -0,0 +1,405 @@
+import functools
+import operator
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from .instrument import count, file_size
+from .schema import encode, decode
+
+
+def month_of(timestamp) -> pd.Series:
+    """Label of the month partition ('yyyy-mm') of each timestamp.
+
+    Timestamps are truncated to months as datetime64 values, in UTC; only
+    the distinct months are formatted. Missing timestamps have no label.
+    """
+    timestamp = pd.Series(pd.to_datetime(timestamp))
+
+    # numpy values of tz-aware timestamps are in UTC
+    months = timestamp.values.astype("datetime64[M]")
+    codes, uniques = pd.factorize(months)
+    labels = np.append(np.datetime_as_string(uniques, unit="M"), None)\
+        .astype(object)
+
+    return pd.Series(labels[codes], index=timestamp.index,
+                     name=timestamp.name)
+
+
+def partition_path(path, key, month, partition_col: str = "asset") -> str:
+    """Directory of one partition of a dataset."""
+    return os.path.join(path, f"{partition_col}={key}", f"month={month}")
+
+
+def write_partitions(data, path, partition_col: str = "asset",
+                     time_col: str = "timestamp", subset: list = None,
+                     keep: str = "first", mode: str = "replace",
+                     float32: bool = False) -> list:
+    """Write `data` into a dataset partitioned by `partition_col` and month.
+
+    The layout is hive-style,
+    '<path>/<partition_col>=<key>/month=<yyyy-mm>/*.parquet', readable with
+    `pyarrow.dataset` or `read_partitions`. Only partitions that `data` has
+    rows in are touched. Files follow the schema of `schema.encode`.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+    path : str
+        root directory of the dataset
+    partition_col : str
+        column to partition by, stored in the directory names only
+    time_col : str
+        column of timestamps defining the month partitions
+    subset : list
+        with `mode='replace'`, columns identifying duplicates: rows already
+        stored win over the new ones, the way `pd.concat((old, new))
+        .drop_duplicates(subset)` would have it
+    keep : str
+        'last' for the new rows to win duplicates instead, e.g. to
+        overwrite a bar that was incomplete when stored
+    mode : str
+        'replace' to merge each partition with the new rows and rewrite it,
+        'append' to add the new rows as a separate file to the partition
+    float32 : bool
+        True to store float columns in single precision
+
+    Returns
+    -------
+    list
+        (key, month) of the partitions written
+    """
+    written = list()
+
+    months = month_of(data[time_col])
+
+    for (key_, month_), chunk in data.groupby([data[partition_col], months],
+                                              sort=True):
+        chunk = chunk.drop(columns=partition_col)
+        dir_ = partition_path(path, key_, month_, partition_col)
+        os.makedirs(dir_, exist_ok=True)
+
+        if mode == "replace":
+            old = [os.path.join(dir_, f_) for f_ in sorted(os.listdir(dir_))
+                   if f_.endswith(".parquet")]
+            if old:
+                chunk = pd.concat(
+                    [decode(pq.read_table(f_)) for f_ in old] + [chunk],
+                    axis=0, ignore_index=True
+                )
+                if subset is not None:
+                    chunk = chunk.drop_duplicates(
+                        subset=[c_ for c_ in subset if c_ != partition_col],
+                        keep=keep
+                    )
+            chunk = chunk.sort_values(time_col, kind="mergesort")
+
+            _write_atomic(chunk, os.path.join(dir_, "part-0.parquet"),
+                          float32)
+            count(rows_out=len(chunk))
+
+            for f_ in old:
+                if os.path.basename(f_) != "part-0.parquet":
+                    os.remove(f_)
+
+        elif mode == "append":
+            _write_atomic(chunk, os.path.join(
+                dir_, f"part-{uuid.uuid4().hex}.parquet"
+            ), float32)
+            count(rows_out=len(chunk))
+
+        else:
+            raise ValueError(f"unknown mode '{mode}'")
+
+        written.append((key_, month_))
+
+    return written
+
+
+def read_partitions(path, columns: list = None,
+                    partition_col: str = "asset") -> pd.DataFrame:
+    """Read a dataset written by `write_partitions` into one DataFrame.
+
+    Partition keys are restored as the first column; the month is not.
+    Unlike with `read_dataset`, dictionary columns are plain strings.
+    """
+    res = read_dataset(path, columns=columns, partition_col=partition_col)
+
+    for c_ in res.columns:
+        if isinstance(res[c_].dtype, pd.CategoricalDtype):
+            res[c_] = res[c_].astype(str)
+
+    return res
+
+
+def read_dataset(path, columns: list = None, filter=None,
+                 partition_col: str = "asset") -> pd.DataFrame:
+    """Read the rows of a prepared dataset matching `filter`.
+
+    `path` is either a partitioned dataset written by `write_partitions`, in
+    which case partitions not matching `filter` are not opened at all, or a
+    .ftr file, which is memory-mapped so that only the rows passing
+    `filter` get materialized (zero-copy for uncompressed files). Columns
+    are decoded with `schema.decode`.
+
+    Parameters
+    ----------
+    path : str
+        dataset directory or path to the .ftr file
+    columns : list
+        columns to read, all by default
+    filter : pyarrow.dataset.Expression
+        e.g. from `make_filter`
+    partition_col : str
+
+    Returns
+    -------
+    pandas.DataFrame
+        with the partition keys, if any, in the first column
+    """
+    if os.path.isdir(path):
+        if columns is not None:
+            columns = [c_ for c_ in columns if c_ != "month"]
+        dataset = ds.dataset(path, format="parquet", partitioning="hive")
+        table = dataset.to_table(columns=columns, filter=filter)
+        count(bytes_read=table.nbytes, rows_in=table.num_rows)
+        res = decode(table)
+
+        if "month" in res.columns:
+            res = res.drop(columns="month")
+        if partition_col in res.columns:
+            res.insert(0, partition_col, res.pop(partition_col))
+
+        return res
+
+    with pa.memory_map(path) as source:
+        table = pa.ipc.open_file(source).read_all()
+        table = ds.dataset(table).to_table(columns=columns, filter=filter)
+        count(bytes_read=table.nbytes, rows_in=table.num_rows)
+        res = decode(table)
+
+    return res
+
+
+def write_feather(data, path, float32: bool = False) -> None:
+    """Write a prepared dataset to an uncompressed .ftr file.
+
+    The file follows the schema of `schema.encode` and, being uncompressed,
+    can be memory-mapped by `read_dataset`.
+    """
+    tmp = f"{path}.tmp"
+    feather.write_feather(encode(data, float32), tmp,
+                          compression="uncompressed")
+    os.replace(tmp, path)
+    count(rows_out=len(data), bytes_written=file_size(path))
+
+
+def make_filter(time_col: str = "timestamp", start=None, end=None,
+                **isin):
+    """Row filter on a time range and on the values of some columns.
+
+    Parameters
+    ----------
+    time_col : str
+    start, end : str or pandas.Timestamp
+        inclusive bounds, compared with the epoch value of `time_col`
+        (stored as int64 or as timestamps); naive ones are taken to be in
+        UTC, and a partial
+        date string for `end` covers its whole period, like with .loc,
+        e.g. end='2021-03' is until the end of March
+    **isin
+        column name -> list of values to keep; None to keep everything
+
+    Returns
+    -------
+    pyarrow.dataset.Expression or None
+        None if there is nothing to filter on
+    """
+    res = list()
+
+    epoch = ds.field(time_col).cast(pa.int64())
+
+    if start is not None:
+        res.append(epoch >= _epoch(start))
+    if end is not None:
+        if isinstance(end, str):
+            end = pd.Period(end).end_time
+        res.append(epoch <= _epoch(end))
+
+    for c_, values in isin.items():
+        if values is None:
+            continue
+        if isinstance(values, str):
+            values = [values]
+        res.append(ds.field(c_).isin(list(values)))
+
+    if not res:
+        return None
+
+    return functools.reduce(operator.and_, res)
+
+
+def make_month_filter(start=None, end=None):
+    """Filter on the month partitions of a dataset covering a time range.
+
+    Combined with `make_filter` on the same range, partitions outside of it
+    are not opened at all; `read_dataset` of a partitioned dataset only.
+
+    Returns
+    -------
+    pyarrow.dataset.Expression or None
+        None if there is nothing to filter on
+    """
+    res = list()
+
+    if start is not None:
+        res.append(ds.field("month") >= _month(start))
+    if end is not None:
+        res.append(ds.field("month") <= _month(end))
+
+    if not res:
+        return None
+
+    return functools.reduce(operator.and_, res)
+
+
+def partition_keys(path, partition_col: str = "asset") -> list:
+    """Keys (e.g. assets) of a dataset."""
+    if not os.path.isdir(path):
+        return list()
+
+    return sorted(d_.split("=", 1)[1] for d_ in os.listdir(path)
+                  if d_.startswith(f"{partition_col}="))
+
+
+def read_last_partitions(path, partition_col: str = "asset",
+                         keys: list = None) -> pd.DataFrame:
+    """Read the latest month partition of every key of a dataset, or of
+    `keys` only; an empty frame if there is none."""
+    res = list()
+
+    for key_ in partition_keys(path, partition_col):
+        if (keys is not None) and (key_ not in keys):
+            continue
+        key_dir = os.path.join(path, f"{partition_col}={key_}")
+        months = sorted(d_ for d_ in os.listdir(key_dir)
+                        if d_.startswith("month="))
+        if not months:
+            continue
+        chunk = decode(ds.dataset(os.path.join(key_dir, months[-1]),
+                                  format="parquet").to_table())
+        chunk.insert(0, partition_col, key_)
+        res.append(chunk)
+
+    if not res:
+        return pd.DataFrame()
+
+    return pd.concat(res, axis=0, ignore_index=True)
+
+
+def first_timestamp(path, time_col: str = "timestamp",
+                    partition_col: str = "asset"):
+    """Earliest timestamp of a dataset, without reading its rows.
+
+    For a partitioned dataset, only the footers of the earliest month
+    partition of each key are read, the minimum coming from the row group
+    statistics; of a .ftr file, only the memory-mapped `time_col`.
+
+    Returns
+    -------
+    pandas.Timestamp or None
+        tz-aware (UTC); None if the dataset is empty or missing
+    """
+    if os.path.isdir(path):
+        res = list()
+        for key_ in partition_keys(path, partition_col):
+            key_dir = os.path.join(path, f"{partition_col}={key_}")
+            months = sorted(d_ for d_ in os.listdir(key_dir)
+                            if d_.startswith("month="))
+            if not months:
+                continue
+            month_dir = os.path.join(key_dir, months[0])
+            res.extend(_parquet_min(os.path.join(month_dir, f_), time_col)
+                       for f_ in os.listdir(month_dir)
+                       if f_.endswith(".parquet"))
+        res = [t_ for t_ in res if t_ is not None]
+
+        return min(res) if res else None
+
+    if not os.path.exists(path):
+        return None
+
+    with pa.memory_map(path) as source:
+        column = pa.ipc.open_file(source).read_all().column(time_col)
+        res = pc.min(column).as_py()
+
+    return _timestamp(res)
+
+
+def remove_dataset(path) -> None:
+    """Delete a dataset, e.g. before rewriting it in full."""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+
+
+def _parquet_min(path, time_col):
+    """Minimum of `time_col` of a parquet file, by its statistics if every
+    row group has them, by reading that column otherwise."""
+    meta = pq.ParquetFile(path).metadata
+    j = meta.schema.names.index(time_col)
+
+    res = list()
+    for i_ in range(meta.num_row_groups):
+        stats = meta.row_group(i_).column(j).statistics
+        if (stats is None) or not stats.has_min_max:
+            res = [pc.min(pq.read_table(path, columns=[time_col])
+                          .column(time_col)).as_py()]
+            break
+        res.append(stats.min)
+    res = [t_ for t_ in res if t_ is not None]
+
+    return _timestamp(min(res)) if res else None
+
+
+def _timestamp(t):
+    """Timestamp in UTC of an int64 (ns) or datetime value; None to None."""
+    if t is None:
+        return None
+    if isinstance(t, int):
+        return pd.Timestamp(t, unit="ns", tz="UTC")
+
+    t = pd.Timestamp(t)
+
+    return t.tz_localize("UTC") if t.tz is None else t.tz_convert("UTC")
+
+
+def _epoch(t) -> pa.Scalar:
+    """Nanoseconds since the epoch, naive timestamps taken to be in UTC."""
+    t = pd.Timestamp(t)
+    t = t.tz_localize("UTC") if t.tz is None else t.tz_convert("UTC")
+
+    return pa.scalar(t.value, type=pa.int64())
+
+
+def _month(t) -> str:
+    t = pd.Timestamp(t)
+    if t.tz is not None:
+        t = t.tz_convert("UTC")
+
+    return t.strftime("%Y-%m")
+
+
+def _write_atomic(data, path, float32: bool = False) -> None:
+    """Write parquet to a temp file first, then move it into place."""
+    tmp = f"{path}.tmp"
+    pq.write_table(encode(data, float32), tmp)
+    os.replace(tmp, path)
+    count(bytes_written=file_size(path))
@@ -1,14 +1,390 @@
+import contextvars
+import functools
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
+from pandas.tseries.frequencies import to_offset
+from pandas.tseries.offsets import Tick
+
+# above this many (bar, category) cells per input row the dense accumulators
+# are replaced by a sort-based compression of the observed keys
+_DENSE_CELLS_PER_ROW = 4
+
+
+def bar_kernel(t, price, weight, freq: int, offset: int = 0, origin: int = 0,
+               codes=None, n_codes: int = 1, observed: bool = True):
+    """Accumulate weighted-average bars over int64 epochs.
+
+    Bar ids are computed arithmetically as `(t - offset - origin) // freq`,
+    combined with the category codes into one integer key and reduced with
+    `numpy.bincount`; no sorting or hashing of timestamps is involved.
+
+    Parameters
+    ----------
+    t : numpy.ndarray
+        int64 epoch timestamps, in the same unit as `freq`, `offset` and
+        `origin`
+    price : numpy.ndarray
+        values to average
+    weight : numpy.ndarray
+        weights to average `price` with; NaNs in `price * weight` and in
+        `weight` are skipped, as in pandas sums
+    freq : int
+        bar length
+    offset : int
+        `t` is shifted back by this much before binning
+    origin : int
+        bars start at `origin + k * freq`
+    codes : numpy.ndarray, optional
+        category of each row as an integer in [0, n_codes); rows with
+        negative codes are dropped
+    n_codes : int
+        number of categories
+    observed : bool
+        True to return only (bar, category) pairs with at least one row,
+        False to return all categories for every bar between the first and
+        the last one
+
+    Returns
+    -------
+    label : numpy.ndarray
+        int64 right edge of each bar, in units of `t`
+    code : numpy.ndarray
+        int64 category of each bar
+    price : numpy.ndarray
+        weighted average of `price`
+    weight : numpy.ndarray
+        sum of `weight` (bar volume)
+    count : numpy.ndarray
+        int64 number of rows (trade count)
+    """
+    t = np.asarray(t, dtype=np.int64)
+    price = np.asarray(price, dtype=np.float64)
+    weight = np.asarray(weight, dtype=np.float64)
+
+    bar = (t - offset - origin) // freq
+    code = np.zeros(len(t), dtype=np.int64) if codes is None \
+        else np.asarray(codes, dtype=np.int64)
+
+    if len(bar) < 1:
+        empty_i, empty_f = np.empty(0, dtype=np.int64), np.empty(0)
+        return empty_i, empty_i, empty_f, empty_f, empty_i
+
+    # the bar range is set by all rows, categories or not
+    bar_min, bar_max = bar.min(), bar.max()
+    n_bars = int(bar_max - bar_min) + 1
+
+    keep = code >= 0
+    if not keep.all():
+        bar, code = bar[keep], code[keep]
+        price, weight = price[keep], weight[keep]
+
+    key = (bar - bar_min) * n_codes + code
+
+    pw = price * weight
+    pw[np.isnan(pw)] = 0.0
+    w = np.where(np.isnan(weight), 0.0, weight)
+
+    n_cells = n_bars * n_codes
+
+    if (not observed) or (n_cells <= _DENSE_CELLS_PER_ROW * len(key) + 1024):
+        # dense accumulators over the whole (bar, category) grid
+        count = np.bincount(key, minlength=n_cells)
+        pw_sum = np.bincount(key, weights=pw, minlength=n_cells)
+        w_sum = np.bincount(key, weights=w, minlength=n_cells)
+        cell = np.flatnonzero(count) if observed \
+            else np.arange(n_cells, dtype=np.int64)
+        count, pw_sum, w_sum = count[cell], pw_sum[cell], w_sum[cell]
+    else:
+        # sparse grid: compress the observed keys first
+        cell, inv = np.unique(key, return_inverse=True)
+        count = np.bincount(inv)
+        pw_sum = np.bincount(inv, weights=pw)
+        w_sum = np.bincount(inv, weights=w)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        res_price = pw_sum / w_sum
+
+    label = origin + (cell // n_codes + bar_min + 1) * freq
+
+    return (label.astype(np.int64), (cell % n_codes).astype(np.int64),
+            res_price, w_sum, count.astype(np.int64))
 
 
 def aggregate_data(data, agg_freq: str, offset_freq: str, datetime_col: str,
                    objective_col: str, weight_col: str,
-                   other_cols: list = None):
-    """Aggregate data at a frequency, with offset and weighting."""
+                   other_cols: list = None, return_stats: bool = False):
+    """Aggregate data at a frequency, with offset and weighting.
+
+    Timestamps are shifted back by `offset_freq` and binned into intervals of
+    `agg_freq` (closed left, labeled right, anchored at midnight of the first
+    day), within which `objective_col` is averaged with `weight_col` as
+    weights. The heavy lifting is done by `bar_kernel`; calendar frequencies
+    (such as 'M') are handled by a pandas groupby.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+    agg_freq : str
+        frequency of bars, e.g. '10T'
+    offset_freq : str
+        offset of timestamps, e.g. '5T'
+    datetime_col : str
+        column of (possibly tz-aware) timestamps
+    objective_col : str
+        column to average
+    weight_col : str
+        column of weights
+    other_cols : list
+        columns to group by in addition to time
+    return_stats : bool
+        True to also return the sum of weights (under `weight_col`) and the
+        number of rows (under 'count') in each bar
+
+    Returns
+    -------
+    pandas.DataFrame
+        with columns `datetime_col`, *`other_cols`, `objective_col`
+    """
+    if not isinstance(to_offset(agg_freq), Tick):
+        return _aggregate_data_groupby(data, agg_freq, offset_freq,
+                                       datetime_col, objective_col,
+                                       weight_col, other_cols, return_stats)
+
+    other_cols = list() if other_cols is None else list(other_cols)
+
+    dt = data[datetime_col]
+    valid = dt.notna().values
+    dt = dt.loc[valid]
+
+    # int64 epochs, in ns
+    t = dt.values.view(np.int64)
+    freq = to_offset(agg_freq).nanos
+    offset = pd.to_timedelta(offset_freq).value
+
+    # origin 'start_day' of pandas: midnight of the first shifted stamp
+    origin = (dt.min() - pd.to_timedelta(offset_freq)).normalize().value \
+        if len(dt) > 0 else 0
+
+    # integer-code the other columns into one mixed-radix category code
+    codes = np.zeros(len(dt), dtype=np.int64)
+    n_codes = 1
+    levels = list()
+    is_cat = list()
+
+    for c_ in other_cols:
+        col = data.loc[valid, c_]
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            c_codes, c_levels = col.cat.codes.values, col.cat.categories
+            is_cat.append(True)
+        else:
+            c_codes, c_levels = pd.factorize(col, sort=True)
+            is_cat.append(False)
+
+        c_codes = np.asarray(c_codes, dtype=np.int64)
+        codes = np.where((codes < 0) | (c_codes < 0), -1,
+                         codes * len(c_levels) + c_codes)
+        n_codes *= len(c_levels)
+        levels.append(c_levels)
+
+    # pandas returns the full product of groups if any of the groupers is
+    # not 'observed': the time grouper alone or a categorical
+    observed = (len(other_cols) > 0) and not any(is_cat)
+    # but there are no groups if all values of a column are missing
+    observed = observed or (n_codes == 0)
+
+    label, code, price, weight, count = bar_kernel(
+        t, data.loc[valid, objective_col].values,
+        data.loc[valid, weight_col].values,
+        freq=freq, offset=offset, origin=origin, codes=codes,
+        n_codes=max(n_codes, 1), observed=observed
+    )
+
+    res = dict()
+
+    timestamp = pd.DatetimeIndex(label)
+    if dt.dt.tz is not None:
+        timestamp = timestamp.tz_localize("UTC").tz_convert(dt.dt.tz)
+    res[datetime_col] = timestamp
+
+    # decode mixed-radix category codes back into values
+    radix = n_codes
+    for c_, c_levels, c_is_cat in zip(other_cols, levels, is_cat):
+        radix //= max(len(c_levels), 1)
+        c_codes = code // radix % max(len(c_levels), 1)
+        if c_is_cat:
+            res[c_] = pd.Categorical.from_codes(
+                c_codes, dtype=data[c_].dtype
+            )
+        else:
+            res[c_] = np.asarray(c_levels).take(c_codes)
+
+    res[objective_col] = price
+
+    if return_stats:
+        res[weight_col] = weight
+        res["count"] = count
+
+    res = pd.DataFrame(res)
+
+    return res
+
+
+def aggregate_chunks(chunks, agg_freq: str, offset_freq: str,
+                     datetime_col: str, objective_col: str, weight_col: str,
+                     other_cols: list = None) -> pd.DataFrame:
+    """Aggregate data arriving in chunks, as `aggregate_data` would in full.
+
+    See `ChunkAggregator`, which this feeds the chunks to one by one.
+
+    Parameters
+    ----------
+    chunks : iterable
+        of pandas.DataFrame, with the same columns and dtypes
+    agg_freq, offset_freq, datetime_col, objective_col, weight_col,
+    other_cols
+        see `ChunkAggregator`
+
+    Returns
+    -------
+    pandas.DataFrame
+        see `aggregate_data`
+    """
+    agg = ChunkAggregator(agg_freq=agg_freq, offset_freq=offset_freq,
+                          datetime_col=datetime_col,
+                          objective_col=objective_col, weight_col=weight_col,
+                          other_cols=other_cols)
+    for chunk_ in chunks:
+        agg.update(chunk_)
+
+    return agg.result()
+
+
+class ChunkAggregator:
+    """Aggregate data arriving in chunks, as `aggregate_data` would in full.
+
+    Chunks must follow one another in time. Of each chunk, the bars before
+    that of its last row are complete, hence aggregated at once; the rows of
+    the last bar are carried over to the next chunk. Only one chunk is held
+    in memory besides the bars, and each bar is averaged over all its rows
+    at once, as in `aggregate_data`.
+
+    The state is the complete bars and the rows carried over, in `bars` and
+    `carry`: an aggregator started from a saved state goes on as if it had
+    been fed the chunks that state came from.
+
+    Parameters
+    ----------
+    agg_freq : str
+        fixed frequency dividing a day, e.g. '10T'
+    offset_freq, datetime_col, objective_col, weight_col, other_cols
+        see `aggregate_data`
+    bars : list
+        of pandas.DataFrame, complete bars to start from
+    carry : pandas.DataFrame
+        rows of the bar still open, to start from
+    """
+    def __init__(self, agg_freq: str, offset_freq: str, datetime_col: str,
+                 objective_col: str, weight_col: str,
+                 other_cols: list = None, bars: list = None, carry=None):
+        self.kwargs = dict(agg_freq=agg_freq, offset_freq=offset_freq,
+                           datetime_col=datetime_col,
+                           objective_col=objective_col,
+                           weight_col=weight_col, other_cols=other_cols)
+        self.freq = pd.Timedelta(to_offset(agg_freq).nanos)
+        self.offset = pd.to_timedelta(offset_freq)
+
+        self.bars = list() if bars is None else list(bars)
+        self.carry = carry
+
+    def update(self, chunk) -> pd.DataFrame:
+        """Feed one chunk.
+
+        Returns
+        -------
+        pandas.DataFrame
+            the bars it completed, if any; None otherwise
+        """
+        if len(chunk) == 0:
+            return None
+        if self.carry is not None:
+            chunk = pd.concat([self.carry, chunk], ignore_index=True)
+
+        datetime_col = self.kwargs["datetime_col"]
+
+        # start of the bar of the last row
+        cutoff = (chunk[datetime_col].max() - self.offset)\
+            .floor(self.freq) + self.offset
+        done = (chunk[datetime_col] < cutoff).values
+        self.carry = chunk.loc[~done].reset_index(drop=True)
+        if not done.any():
+            return None
+
+        res = aggregate_data(chunk.loc[done], **self.kwargs)
+        self.bars.append(res)
+
+        return res
+
+    def result(self) -> pd.DataFrame:
+        """All bars so far, that of the rows carried over included.
+
+        Returns
+        -------
+        pandas.DataFrame
+            see `aggregate_data`
+        """
+        datetime_col = self.kwargs["datetime_col"]
+        other_cols = list(self.kwargs["other_cols"] or [])
+
+        res = list(self.bars)
+        if (self.carry is not None) and (len(self.carry) > 0):
+            res.append(aggregate_data(self.carry, **self.kwargs))
+
+        if len(res) == 0:
+            return aggregate_data(pd.DataFrame(
+                columns=[datetime_col, self.kwargs["objective_col"],
+                         self.kwargs["weight_col"]] + other_cols
+            ), **self.kwargs)
+
+        res = pd.concat(res, ignore_index=True)
+
+        # unless grouped by observed values only, `aggregate_data` returns
+        # all bars between the first and the last, empty ones between
+        # chunks too
+        dtypes = res.dtypes
+        is_cat = [isinstance(dtypes[c_], pd.CategoricalDtype)
+                  for c_ in other_cols]
+        if (len(other_cols) == 0) or any(is_cat):
+            keys = [datetime_col] + other_cols
+            levels = [pd.date_range(res[datetime_col].min(),
+                                    res[datetime_col].max(), freq=self.freq)]
+            levels += [dtypes[c_].categories if cat_
+                       else np.sort(res[c_].unique())
+                       for c_, cat_ in zip(other_cols, is_cat)]
+            grid = pd.MultiIndex.from_product(levels, names=keys) \
+                if len(keys) > 1 else levels[0].rename(datetime_col)
+            res = res.set_index(keys).reindex(grid).reset_index()
+            for c_ in other_cols:
+                res[c_] = res[c_].astype(dtypes[c_])
+
+        return res
+
+
+def _aggregate_data_groupby(data, agg_freq: str, offset_freq: str,
+                            datetime_col: str, objective_col: str,
+                            weight_col: str, other_cols: list = None,
+                            return_stats: bool = False):
+    """Aggregate data at a frequency using a pandas groupby."""
     to_agg = pd.concat((
         data[datetime_col].sub(pd.to_timedelta(offset_freq)),
         data[[objective_col, weight_col]],
         data[objective_col].mul(data[weight_col]).rename("_aggw"),
+        pd.Series(1, index=data.index, name="_count"),
     ), axis=1)
 
     # calculate size-weighted mean price in those windows
@@ -19,13 +395,408 @@ def aggregate_data(data, agg_freq: str, offset_freq: str, datetime_col: str,
         to_agg = pd.concat((to_agg, data[other_cols]), axis=1)
 
     data_agg = to_agg\
-        .set_index("timestamp")\
+        .set_index(datetime_col)\
         .groupby(group_list)\
         .sum()
 
     res = data_agg["_aggw"] / data_agg[weight_col]
 
     # rename, reindex
-    res = res.rename(objective_col).reset_index()
+    res = res.rename(objective_col).to_frame()
+
+    if return_stats:
+        res[weight_col] = data_agg[weight_col]
+        res["count"] = data_agg["_count"]
+
+    res = res.reset_index()
 
     return res
+
+
+def pivot(data, index: str, columns, values: str) -> pd.DataFrame:
+    """Reshape long data to wide, like `DataFrame.pivot`, on integer codes.
+
+    Categorical columns are pivoted on their codes, which avoids hashing
+    strings; the result is the same as that of `DataFrame.pivot` with
+    plain columns, with (possibly multi-level) columns of observed labels
+    only, except that these are always sorted. Rows with missing keys are
+    dropped.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+    index : str
+    columns : str or list
+    values : str
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    columns = [columns] if isinstance(columns, str) else list(columns)
+
+    row, row_labels = pd.factorize(data[index], sort=True)
+
+    code = np.zeros(len(data), dtype=np.int64)
+    valid = row >= 0
+    levels = list()
+    for c_ in columns:
+        col = data[c_]
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            order = col.cat.categories.argsort()
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            codes_c = np.where(col.cat.codes.values >= 0,
+                               rank[col.cat.codes.values], -1)
+            labels_c = col.cat.categories[order]
+        else:
+            codes_c, labels_c = pd.factorize(col, sort=True)
+        valid &= codes_c >= 0
+        code = code * len(labels_c) + codes_c
+        levels.append((codes_c, np.asarray(labels_c, dtype=object)))
+
+    row, code = row[valid], code[valid]
+
+    # observed combinations of column labels, sorted
+    col_codes, col = np.unique(code, return_inverse=True)
+
+    cell = row * len(col_codes) + col
+    if len(np.unique(cell)) < len(cell):
+        raise ValueError("Index contains duplicate entries, cannot reshape")
+
+    vals = data[values].values[valid]
+    res = np.full((len(row_labels), len(col_codes)), np.nan,
+                  dtype=np.result_type(vals.dtype, np.float32))
+    res.flat[cell] = vals
+
+    # labels of each observed combination
+    first = np.zeros(len(col_codes), dtype=np.int64)
+    first[col] = np.arange(len(col))
+    labels = [lab_[c_[valid][first]] for c_, lab_ in levels]
+    if len(columns) > 1:
+        res_columns = pd.MultiIndex.from_arrays(labels, names=columns)
+    else:
+        res_columns = pd.Index(labels[0], name=columns[0])
+
+    res = pd.DataFrame(res, index=pd.Index(row_labels, name=index),
+                       columns=res_columns)
+
+    return res
+
+
+def pack_keys(data, columns: list) -> np.ndarray:
+    """One int64 key per row, equal for rows equal in all of `columns`.
+
+    Integer and datetime columns enter as offsets from their minimum,
+    other columns as codes from a (hash-based) `pandas.factorize`, missing
+    values being a value of their own; the parts are combined in mixed
+    radix. Should the next part not fit into int64, the key so far is
+    factorized into consecutive codes first.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+    columns : list
+
+    Returns
+    -------
+    numpy.ndarray
+        of int64, not comparable across calls
+    """
+    key = np.zeros(len(data), dtype=np.int64)
+    if len(data) < 1:
+        return key
+
+    radix = 1
+    for c_ in columns:
+        col = data[c_]
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            codes = col.cat.codes.values.astype(np.int64) + 1
+            n = len(col.cat.categories) + 1
+        elif (pd.api.types.is_datetime64_any_dtype(col) or
+              pd.api.types.is_integer_dtype(col)) and not col.isna().any():
+            values = col.values.view(np.int64) \
+                if pd.api.types.is_datetime64_any_dtype(col) \
+                else col.values.astype(np.int64)
+            lo = values.min()
+            codes = values - lo
+            n = int(values.max()) - int(lo) + 1
+        else:
+            codes, uniques = pd.factorize(col)
+            codes = codes.astype(np.int64) + 1
+            n = len(uniques) + 1
+
+        if radix * n >= 2 ** 63:
+            key, uniques = pd.factorize(key)
+            radix = len(uniques)
+        if radix * n >= 2 ** 63:
+            codes, uniques = pd.factorize(codes)
+            n = len(uniques)
+
+        key = key * n + codes
+        radix *= n
+
+    return key
+
+
+def drop_duplicates_max(data, subset: list, by: str) -> pd.DataFrame:
+    """Of rows equal in `subset`, keep the one largest in `by`.
+
+    The rows kept are those of `data.sort_values(subset + [by])
+    .drop_duplicates(subset, keep='last')`, i.e. ties in `by` go to the
+    later row and missing values count as the largest, but in the order of
+    `data`, and found by hashing the keys of `pack_keys` in linear time
+    rather than by sorting. Only rows with duplicated keys go through the
+    groupby.
+    """
+    key = pd.Series(pack_keys(data, subset))
+    dup = key.duplicated(keep=False).values
+    if not dup.any():
+        return data
+
+    pos = np.flatnonzero(dup)
+    key_dup = key.values[pos]
+    values = pd.Series(data[by].values[pos])
+
+    is_na = values.isna()
+    best = values.groupby(key_dup).transform("max").values
+    has_na = is_na.groupby(key_dup).transform("any").values
+    is_best = np.where(has_na, is_na.values, values.values == best)
+
+    # the last of the best
+    pos = pos[is_best]
+    last = ~pd.Series(key.values[pos]).duplicated(keep="last").values
+
+    keep = ~dup
+    keep[pos[last]] = True
+
+    return data.loc[keep]
+
+
+class StreamingDeduplicator:
+    """`drop_duplicates_max` over chunks of rows coming in time order.
+
+    Duplicates may straddle chunks, e.g. trades repeated at the end of one
+    month's file and the start of the next one's. The rows within `window`
+    of the latest time seen are held back until the next chunk, so that
+    their duplicates there are resolved as if in one frame; older rows are
+    final. Memory is bounded by that of a chunk and the window.
+
+    Rows older than those already final cannot be resolved any more and
+    are dropped, counted in `n_late`.
+
+    Parameters
+    ----------
+    subset : list
+    by : str
+        see `drop_duplicates_max`
+    time_col : str
+        column of timestamps
+    window : str
+        length of the window held back, e.g. '10T'
+    """
+    def __init__(self, subset: list, by: str, time_col: str = "timestamp",
+                 window: str = "10T"):
+        self.subset = list(subset)
+        self.by = by
+        self.time_col = time_col
+        self.window = pd.Timedelta(window).value
+
+        self.n_late = 0
+        self._held = None
+        self._watermark = None
+
+    def push(self, chunk) -> pd.DataFrame:
+        """Add a chunk, get the rows that have become final."""
+        t = chunk[self.time_col].values.view(np.int64)
+
+        if self._watermark is not None:
+            late = t < self._watermark
+            if late.any():
+                self.n_late += int(late.sum())
+                chunk, t = chunk.loc[~late], t[~late]
+
+        if self._held is not None:
+            chunk = pd.concat((self._held, chunk))
+        if len(chunk) < 1:
+            return chunk
+
+        data = drop_duplicates_max(chunk, self.subset, self.by)
+        t = data[self.time_col].values.view(np.int64)
+
+        self._watermark = max(t.max() - self.window,
+                              self._watermark or np.iinfo(np.int64).min)
+        final = t < self._watermark
+        self._held = data.loc[~final]
+
+        return data.loc[final]
+
+    def flush(self) -> pd.DataFrame:
+        """Get the rows held back, None if there are none."""
+        res, self._held = self._held, None
+
+        return res
+
+
+def data_dir() -> str:
+    """Folder 'data' of the project, under PROJECT_ROOT as of the call.
+
+    Modules locate their files with it when they run, not when they are
+    imported, so that they can be imported before PROJECT_ROOT is set.
+    """
+    root = os.environ.get("PROJECT_ROOT")
+    if not root:
+        raise EnvironmentError("PROJECT_ROOT is not set")
+
+    return os.path.join(root, "data")
+
+
+class LazyMemory:
+    """`joblib.Memory`, created on first use.
+
+    Modules caching with joblib can then be imported without importing
+    joblib or creating the cache folder. Functions decorated with `cache`
+    are picklable, as with joblib, if the undecorated ones are.
+
+    Parameters
+    ----------
+    location : str or callable
+        folder to create the 'joblib' cache folder in, or a function
+        returning it, called on every use: the cache follows it
+    **kwargs
+        to `joblib.Memory`
+    """
+    def __init__(self, location, **kwargs):
+        self.location = location
+        self.kwargs = kwargs
+        self._memory = None
+        self._location = None
+
+    @property
+    def memory(self):
+        location = self.location() if callable(self.location) \
+            else self.location
+        if (self._memory is None) or (self._location != location):
+            from joblib import Memory
+            self._memory = Memory(location, **self.kwargs)
+            self._location = location
+
+        return self._memory
+
+    def cache(self, func=None, **kwargs):
+        """Decorate `func` as `joblib.Memory.cache` would, lazily."""
+        if func is None:
+            return lambda f_: self.cache(f_, **kwargs)
+
+        return _LazyMemorizedFunc(self, func, kwargs)
+
+    def __getattr__(self, name):
+        # e.g. `clear`, `reduce_size`
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        return getattr(self.memory, name)
+
+    def __getstate__(self):
+        return {"location": self.location, "kwargs": self.kwargs,
+                "_memory": None, "_location": None}
+
+
+class _LazyMemorizedFunc:
+    def __init__(self, memory, func, kwargs):
+        self.memory = memory
+        self.func = func
+        self.kwargs = kwargs
+        self._memorized = None
+        self._memory = None
+        functools.update_wrapper(self, func)
+
+    @property
+    def memorized(self):
+        memory = self.memory.memory
+        if (self._memorized is None) or (self._memory is not memory):
+            self._memorized = memory.cache(self.func, **self.kwargs)
+            self._memory = memory
+
+        return self._memorized
+
+    def __call__(self, *args, **kwargs):
+        return self.memorized(*args, **kwargs)
+
+    def check_call_in_cache(self, *args, **kwargs) -> bool:
+        return self.memorized.check_call_in_cache(*args, **kwargs)
+
+    def __reduce__(self):
+        return self.__class__, (self.memory, self.func, self.kwargs)
+
+
+def imap_ordered(func, iterable, n_jobs: int = 1, executor: str = "process",
+                 initializer=None, initargs: tuple = ()):
+    """Map `func` over `iterable` in a pool, yielding results in order.
+
+    At most `2 * n_jobs` calls are in flight at any time, so that results
+    do not pile up ahead of the consumer.
+
+    Parameters
+    ----------
+    func : callable
+        must be picklable for `executor='process'`
+    iterable : iterable
+    n_jobs : int
+        number of workers; -1 for all cpus, 1 to map in this process
+    executor : str
+        'process' or 'thread'
+    initializer : callable
+        called with `initargs` once in each worker before any `func`, or
+        once in this process if `n_jobs` is 1
+    initargs : tuple
+
+    Threads run `func` in a copy of the context of the caller, so that
+    e.g. the stage recorded by `instrument` carries over. Processes are
+    forked, unless the caller is not the main thread, e.g. a stage run by
+    `pipeline.Pipeline`: forking a threaded process may deadlock the child
+    on a lock held by another thread, so they are started by a fork server.
+
+    Yields
+    ------
+    object
+        result of `func` for each item of `iterable`, in order
+    """
+    if n_jobs is None or n_jobs == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for x_ in iterable:
+            yield func(x_)
+        return
+
+    if n_jobs < 0:
+        n_jobs = os.cpu_count()
+
+    pool_cls = {"process": ProcessPoolExecutor,
+                "thread": ThreadPoolExecutor}[executor]
+    kwargs = dict()
+    if (executor == "process") and \
+            (threading.current_thread() is not threading.main_thread()):
+        kwargs["mp_context"] = multiprocessing.get_context("forkserver")
+
+    items = iter(iterable)
+    pending = deque()
+
+    def submit(pool, x):
+        if executor == "thread":
+            return pool.submit(contextvars.copy_context().run, func, x)
+        return pool.submit(func, x)
+
+    with pool_cls(max_workers=n_jobs, initializer=initializer,
+                  initargs=initargs, **kwargs) as pool:
+        for x_ in items:
+            pending.append(submit(pool, x_))
+            if len(pending) >= 2 * n_jobs:
+                break
+
+        while pending:
+            res = pending.popleft().result()
+            for x_ in items:
+                pending.append(submit(pool, x_))
+                break
+            yield res
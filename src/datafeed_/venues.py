@@ -0,0 +1,194 @@
+"""Prices of Kraken, Binance and OKEx in one form, aligned on one grid.
+
+A series is labelled (venue, asset, instrument, field):
+
+    - venue: 'kraken', 'binance' or 'okex';
+    - asset: lowercase code as in Kraken data, e.g. 'xbt' for bitcoin;
+    - instrument: 'spot' or 'perpetual';
+    - field: 'close', 'bid', 'ask' or 'mid';
+
+and is a float64 pandas.Series indexed by tz-aware UTC timestamps, those
+of the data: klines of Binance and OKEx are stamped with the end of their
+bar rather than their open, when their close is known; Kraken bars, VWAPs
+of [T-5min, T+5min), keep their label T, as everywhere else in the repo.
+
+    >>> panel = build_panel([("kraken", "xbt", "perpetual", "mid"),
+    ...                      ("binance", "xbt", "spot", "close"),
+    ...                      ("okex", "xbt", "perpetual", "close")],
+    ...                     freq="4H", start="2021-01")
+    >>> panel.to_frame()
+
+Modules of the venues are imported on first use, only those of the venues
+loaded.
+"""
+import pandas as pd
+
+from .panel import align, AlignedPanel
+from .utilities import imap_ordered
+
+LEVELS = ["venue", "asset", "instrument", "field"]
+
+# asset codes of the other exchanges, where they differ from Kraken's
+ASSET_CODES = {"xbt": "btc"}
+
+
+def load(venue: str, asset: str, instrument: str = "spot",
+         field: str = "close", start=None, end=None, **kwargs) -> pd.Series:
+    """Load one series of a venue.
+
+    Parameters
+    ----------
+    venue, asset, instrument, field : str
+        see the module docstring
+    start, end : str or pandas.Timestamp
+        inclusive bounds; naive ones are taken to be in UTC
+    kwargs
+        passed on to the loader of the venue: `cache` for Kraken,
+        `kline_size` (spot, '1m' by default) and `interval` (perpetual,
+        '1h') for Binance, `bar` ('1H') for OKEx
+
+    Returns
+    -------
+    pandas.Series
+    """
+    loaders = {"kraken": _load_kraken, "binance": _load_binance,
+               "okex": _load_okex}
+    if venue not in loaders:
+        raise ValueError(f"unknown venue '{venue}'; one of {list(loaders)}")
+
+    res = loaders[venue](asset, instrument, field, start, end, **kwargs)
+    res = res.astype("float64").rename((venue, asset, instrument, field))
+
+    if res.index.tz is None:
+        res.index = res.index.tz_localize("UTC")
+    res.index.name = "timestamp"
+
+    return res.sort_index()
+
+
+def build_panel(labels: list, freq: str = "10T", start=None, end=None,
+                max_staleness=None, n_jobs: int = 4, **kwargs) \
+        -> AlignedPanel:
+    """Load series of several venues and align them on one grid.
+
+    Series are loaded in `n_jobs` threads, then sampled with
+    `panel.align`: the value at each grid point is the last one at or
+    before it no older than `max_staleness`.
+
+    Parameters
+    ----------
+    labels : list
+        of (venue, asset, instrument, field)
+    freq : str
+        of the grid, e.g. '10T' or '4H'
+    start, end : str or pandas.Timestamp
+        of the grid; the span of the data by default
+    max_staleness : str, pandas.Timedelta or dict
+        see `panel.align`; one period of `freq` by default
+    n_jobs : int
+        number of series to load at the same time
+    kwargs
+        passed on to `load`
+
+    Returns
+    -------
+    panel.AlignedPanel
+        with columns labelled by `LEVELS`
+    """
+    labels = [tuple(l_) for l_ in labels]
+
+    # observations up to `max_staleness` before `start` count too
+    limits = max_staleness.values() if isinstance(max_staleness, dict) \
+        else [max_staleness or freq]
+    since = start
+    if start is not None:
+        since = None if None in limits else \
+            _utc(start) - max(pd.Timedelta(l_) for l_ in [freq, *limits])
+
+    def load_one(label):
+        return load(*label, start=since, end=end, **kwargs)
+
+    series = dict(zip(labels, imap_ordered(load_one, labels, n_jobs=n_jobs,
+                                           executor="thread")))
+
+    return align(series, freq, start=start, end=end,
+                 max_staleness=max_staleness, names=LEVELS)
+
+
+def _load_kraken(asset, instrument, field, start, end, cache=True) \
+        -> pd.Series:
+    from .kraken import downstream
+
+    if (instrument, field) == ("spot", "close"):
+        res = downstream.get_spot(assets=[asset], start=start, end=end,
+                                  cache=cache)
+        return res[asset]
+
+    if (instrument, field) == ("perpetual", "mid"):
+        res = downstream.get_perpetual(mid=True, assets=[asset],
+                                       start=start, end=end, cache=cache)
+        return res[asset]
+
+    if (instrument, field) in (("perpetual", "bid"), ("perpetual", "ask")):
+        res = downstream.get_perpetual(assets=[asset], sides=[field],
+                                       start=start, end=end, cache=cache)
+        return res[(asset, field)]
+
+    raise ValueError(f"no {instrument} {field} at kraken")
+
+
+def _load_binance(asset, instrument, field, start, end,
+                  kline_size="1m", interval="1h") -> pd.Series:
+    code = ASSET_CODES.get(asset, asset).upper()
+
+    if (instrument, field) == ("spot", "close"):
+        from .binance import upstream
+
+        res = upstream.read_spot(f"{code}USDT", kline_size, start=start,
+                                 end=end, columns=["close", "timestamp_close"])
+        res.index = res["timestamp_close"] + pd.Timedelta("1ms")
+        return res["close"]
+
+    if (instrument, field) == ("perpetual", "close"):
+        from .binance import downstream
+
+        months = {k_: pd.Period(_utc(v_).tz_localize(None), freq="M")
+                  for k_, v_ in [("start", start), ("end", end)]
+                  if v_ is not None}
+        res = downstream.get_perpetual(f"{code}USD_PERP", interval,
+                                       **months)
+        res.index = res["Close time"] + pd.Timedelta("1ms")
+        return _cut(res["Close"], start, end)
+
+    raise ValueError(f"no {instrument} {field} at binance")
+
+
+def _load_okex(asset, instrument, field, start, end, bar="1H") \
+        -> pd.Series:
+    from .okex import downstream
+
+    if (instrument, field) != ("perpetual", "close"):
+        raise ValueError(f"no {instrument} {field} at okex")
+
+    code = ASSET_CODES.get(asset, asset).upper()
+    res = downstream.get_perpetual(code, start=start, end=end)
+    res.index = res.index + pd.Timedelta(bar)
+
+    return res
+
+
+def _cut(res, start, end) -> pd.Series:
+    """Rows between `start` and `end`, inclusive, as in `make_filter`."""
+    if res.index.tz is None:
+        res.index = res.index.tz_localize("UTC")
+    if isinstance(end, str):
+        end = pd.Period(end).end_time
+
+    return res.loc[(None if start is None else _utc(start)):
+                   (None if end is None else _utc(end))]
+
+
+def _utc(t) -> pd.Timestamp:
+    t = pd.Timestamp(t)
+
+    return t.tz_localize("UTC") if t.tz is None else t.tz_convert("UTC")
@@ -1,15 +1,9 @@
-import logging
+import sys
 from config import *
-from datafeed_.kraken.upstream import *
-
-
-logging.basicConfig(format='%(asctime)s: %(message)s',
-                    datefmt='%m/%d/%Y %I:%M:%S %p',
-                    level=logging.INFO,
-                    handlers=[logging.StreamHandler()])
+from datafeed_.cli import main
 
 
 if __name__ == '__main__':
-    save_spot_from_ohlcv()
-    save_funding_rates()
-    save_perpetual_from_csv()
+    # `python -m src.datafeed_ build`, reporting to a fixed place
+    sys.exit(main(["build", "--report", "output/reports/organize_data.json",
+                   *sys.argv[1:]]))
@@ -0,0 +1,181 @@
+from unittest import TestCase, skipIf
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from src.backtest.carry import CarryBacktest, rank_sort
+from src.backtest.data import CarryData
+
+try:
+    from foolbox.backtesting.sorting import rank_sort as foolbox_rank_sort
+except ImportError:
+    foolbox_rank_sort = None
+
+# signals of five assets and the portfolios they sort into, by legsize:
+# ties, nans, rows with too few signals for both legs and none at all
+_SIGNALS = np.array([
+    [0.3, 0.1, 0.5, 0.2, 0.4],
+    [0.1, 0.1, 0.1, 0.2, 0.2],
+    [0.2, 0.1, 0.2, 0.1, 0.2],
+    [np.nan, 0.4, 0.1, 0.3, 0.2],
+    [np.nan, 0.1, np.nan, 0.2, 0.3],
+    [np.nan] * 5,
+])
+_SORTS = {
+    1: ([[0, 1, 0, 0, 0],
+         [1, 0, 0, 0, 0],
+         [0, 1, 0, 0, 0],
+         [0, 0, 1, 0, 0],
+         [0, 1, 0, 0, 0],
+         [0, 0, 0, 0, 0]],
+        [[0, 0, 1, 0, 0],
+         [0, 0, 0, 0, 1],
+         [0, 0, 0, 0, 1],
+         [0, 1, 0, 0, 0],
+         [0, 0, 0, 0, 1],
+         [0, 0, 0, 0, 0]]),
+    2: ([[0, 1, 0, 1, 0],
+         [1, 1, 0, 0, 0],
+         [0, 1, 0, 1, 0],
+         [0, 0, 1, 0, 1],
+         [0, 0, 0, 0, 0],
+         [0, 0, 0, 0, 0]],
+        [[0, 0, 1, 0, 1],
+         [0, 0, 0, 1, 1],
+         [0, 0, 1, 0, 1],
+         [0, 1, 0, 1, 0],
+         [0, 0, 0, 0, 0],
+         [0, 0, 0, 0, 0]]),
+}
+
+
+def _data(seed=0) -> (pd.DataFrame, pd.DataFrame, pd.DataFrame):
+    """Spot and perp every 4 hours, hourly funding with gaps."""
+    rng = np.random.default_rng(seed)
+    assets = ["bch", "eth", "ltc", "xbt", "xrp"]
+
+    index = pd.date_range("2019-01-01", periods=600, freq="4H", tz="UTC",
+                          name="timestamp")
+    spot = pd.DataFrame(
+        100 * np.exp(np.cumsum(rng.normal(0, 0.01, (600, 5)), axis=0)),
+        index=index, columns=pd.Index(assets, name="asset")
+    )
+    spot.iloc[:50, 2] = np.nan
+    perp = spot * (1 + rng.normal(0, 1e-3, spot.shape))
+    perp["ada"] = 1.0
+    perp = perp.mask(rng.random(perp.shape) < 0.02)
+
+    # funding of one more asset, starting later, hourly with gaps
+    f_index = pd.date_range("2019-01-02", periods=2300, freq="H", tz="UTC")
+    f_index = f_index[rng.random(len(f_index)) > 0.05]
+    funding = list()
+    for c_ in assets[1:] + ["dot"]:
+        rate = rng.normal(1e-5, 1e-5, len(f_index))
+        for w_, r_ in [("relative", rate), ("absolute", rate / 100)]:
+            funding.append(pd.DataFrame({"timestamp": f_index, "which": w_,
+                                         "asset": c_, "rate": r_}))
+    funding = pd.concat(funding, ignore_index=True)
+    funding = funding.loc[rng.random(len(funding)) > 0.02]
+
+    return spot, perp, funding
+
+
+def _rank_sort(signal, legsize) -> pd.DataFrame:
+    """`foolbox.rank_sort` where foolbox is not installed, as pinned down
+    by `_SORTS`."""
+    n_valid = signal.notnull().sum(axis=1)
+    rank = signal.rank(axis=1, method="first")
+    enough = (n_valid >= 2 * legsize)
+    p_low = rank.le(legsize).mul(enough, axis=0)
+    p_high = rank.gt(n_valid - legsize, axis=0).mul(enough, axis=0)
+
+    return pd.concat([p_low, p_high], axis=1, keys=["p_low", "p_high"],
+                     names=["portfolio", "asset"]).astype(float)
+
+
+def _walkthrough(data_s, data_p, data_f, t_hold, legsize, signal_lookback,
+                 n_long, n_short) -> pd.DataFrame:
+    """The strategy as in walkthrough.ipynb."""
+    data_p = data_p.reindex_like(data_s)
+
+    carry = data_f \
+        .query("which == 'relative'").drop("which", axis=1) \
+        .pivot(index="timestamp", columns="asset", values="rate")\
+        .mul(-1)
+    carry_sig = carry\
+        .rolling(signal_lookback, min_periods=signal_lookback // 2)\
+        .median()\
+        .shift(1)
+    sorts = (foolbox_rank_sort or _rank_sort)(carry_sig, legsize=legsize)
+
+    f_rate = data_f \
+        .query("which == 'absolute'").drop("which", axis=1) \
+        .pivot(index="timestamp", columns="asset", values="rate")
+
+    r_long = n_long * data_s.shift(-t_hold) * \
+        (1 / data_p - 1 / data_p.shift(-t_hold) -
+         f_rate.shift(1).mul(4).rolling(t_hold).sum().shift(-t_hold + 1)) + \
+        data_s.shift(-t_hold) / data_s - 1
+    r_short = n_short * data_s.shift(-t_hold) * \
+        (1 / data_p.shift(-t_hold) - 1 / data_p +
+         f_rate.shift(1).mul(4).rolling(t_hold).sum().shift(-t_hold + 1)) + \
+        data_s.shift(-t_hold) / data_s - 1
+    rx = pd.concat([r_long, r_short], axis=1, keys=["p_high", "p_low"],
+                   names=["portfolio", "asset"])
+
+    res_hl = rx.mul(sorts / legsize) \
+        .groupby(axis=1, level="portfolio").sum(min_count=1) \
+        .loc[:, ["p_high", "p_low"]].dropna()
+    res_hl.insert(0, "p_hml", res_hl.eval("p_high + p_low"))
+
+    return res_hl
+
+
+class TestRankSort(TestCase):
+    def test_fixture(self):
+        """Portfolios of `_SORTS`, from the backtest and from the sorting
+        of the walkthrough test."""
+        signal = pd.DataFrame(_SIGNALS, columns=list("abcde"))
+        for legsize_, (p_low, p_high) in _SORTS.items():
+            res = rank_sort(_SIGNALS, legsize_)
+            np.testing.assert_array_equal(res[0], p_low)
+            np.testing.assert_array_equal(res[1], p_high)
+
+            res = _rank_sort(signal, legsize_)
+            np.testing.assert_array_equal(res["p_low"].values, p_low)
+            np.testing.assert_array_equal(res["p_high"].values, p_high)
+
+    @skipIf(foolbox_rank_sort is None, "foolbox is not installed")
+    def test_same_as_foolbox(self):
+        """The same as `foolbox.rank_sort`, on `_SIGNALS` and at random."""
+        signal = np.random.default_rng(3).normal(size=(300, 6))
+        signal[np.random.default_rng(4).random(signal.shape) < 0.3] = np.nan
+        for signal_ in [_SIGNALS, signal.round(1)]:
+            frame = pd.DataFrame(signal_)
+            for legsize_ in [1, 2]:
+                expected = foolbox_rank_sort(frame, legsize=legsize_)
+                p_low, p_high = rank_sort(signal_, legsize_)
+                np.testing.assert_array_equal(
+                    p_low, expected["p_low"].fillna(0.0).values
+                )
+                np.testing.assert_array_equal(
+                    p_high, expected["p_high"].fillna(0.0).values
+                )
+
+
+class TestCarryBacktest(TestCase):
+    def test_same_as_walkthrough(self):
+        """Returns equal those of the walkthrough, for several parameters."""
+        spot, perp, funding = _data()
+        bt = CarryBacktest(CarryData(spot, perp, funding))
+
+        for kwargs in [dict(t_hold=1, legsize=2, signal_lookback=42,
+                            n_long=1, n_short=3),
+                       dict(t_hold=3, legsize=1, signal_lookback=13,
+                            n_long=2, n_short=2)]:
+            expected = _walkthrough(spot, perp, funding, **kwargs)
+            res = bt.run_frame(**kwargs)
+            self.assertGreater(len(res), 100)
+            assert_frame_equal(res, expected, check_names=False,
+                               check_freq=False, rtol=1e-12)
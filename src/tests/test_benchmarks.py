@@ -0,0 +1,83 @@
+import os
+import tempfile
+import zipfile
+from unittest import TestCase, mock
+
+import pandas as pd
+
+from src.benchmarks import synthetic
+from src.benchmarks.suite import BENCHMARKS, Context
+from src.datafeed_.kraken import setup, upstream
+from src.datafeed_.kraken.upstream import _read_matches_history
+
+
+class TestSynthetic(TestCase):
+    def test_matches_history(self):
+        """Trade files parse as the downloaded ones do."""
+        data = synthetic.make_matches_history("2020-02", 1000, ["xbt", "eth"])
+        self.assertTrue(data["timestamp"].is_monotonic_increasing)
+        self.assertTrue(data["timestamp"].str.startswith("2020-02").all())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = synthetic.write_matches_history(tmp, data)
+            self.assertEqual(os.path.basename(path),
+                             "matches_history_2020-02.csv.zip")
+            res = _read_matches_history(path)
+
+        self.assertEqual(list(res.columns), ["timestamp", "tradeable",
+                                             "price", "size", "aggressor"])
+        self.assertEqual(set(res["tradeable"]), {"PI_XBTUSD", "PI_ETHUSD"})
+        self.assertGreater(len(res), 700)
+
+    def test_ohlcvt(self):
+        data = synthetic.make_ohlcvt("xbt", "2020-01", 500)
+        self.assertTrue((data["high"] >= data["low"]).all())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = synthetic.write_ohlcvt(tmp, "xbt", data)
+            with zipfile.ZipFile(path) as z, z.open("XBTUSD_1.csv") as f:
+                res = pd.read_csv(f, header=None)
+
+        self.assertEqual(res.shape, (500, 7))
+        self.assertEqual(pd.to_datetime(res[0].iloc[0], unit="s").month, 1)
+
+    def test_funding_payload(self):
+        payload = synthetic.make_funding_payload("eth", "2020-01", 48)
+        res = pd.DataFrame.from_records(payload["rates"])
+
+        self.assertEqual(list(res.columns), ["timestamp", "fundingRate",
+                                             "relativeFundingRate"])
+        self.assertEqual(pd.to_datetime(res["timestamp"]).diff().max(),
+                         pd.Timedelta("1H"))
+        self.assertEqual(
+            synthetic.make_funding_payload("eth", "2020-01", 48), payload
+        )
+
+
+class TestContext(TestCase):
+    def test_project_root(self):
+        """PROJECT_ROOT is the synthetic root in the context only."""
+        for before_ in [{"PROJECT_ROOT": "/elsewhere"}, {}]:
+            with mock.patch.dict(os.environ, before_), \
+                    tempfile.TemporaryDirectory() as tmp:
+                os.environ.pop("PROJECT_ROOT", None)
+                os.environ.update(before_)
+                with Context(tmp, months=1, n_rows=100) as context:
+                    self.assertEqual(os.environ["PROJECT_ROOT"],
+                                     context.root)
+                self.assertEqual(os.environ.get("PROJECT_ROOT"),
+                                 before_.get("PROJECT_ROOT"))
+
+    def test_api_restored(self):
+        """The Kraken urls and rate limits are those of `setup` again once
+        the API benchmarks are done."""
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.dict(os.environ, {}), \
+                Context(tmp, months=1, n_rows=100) as context:
+            func, _ = BENCHMARKS["fetch_spot_api"](context)
+            func()
+            self.assertNotEqual(upstream.ROOT_URL_SPOT, setup.ROOT_URL_SPOT)
+
+        self.assertEqual(upstream.ROOT_URL_SPOT, setup.ROOT_URL_SPOT)
+        self.assertEqual(upstream.ROOT_URL_PERP, setup.ROOT_URL_PERP)
+        self.assertEqual(upstream.RATE_LIMIT_SPOT, setup.RATE_LIMIT_SPOT)
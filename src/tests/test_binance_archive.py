@@ -0,0 +1,151 @@
+import functools
+import hashlib
+import os
+import tempfile
+import threading
+import zipfile
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, mock
+
+import numpy as np
+import pandas as pd
+
+from src.datafeed_.binance import archive
+from src.datafeed_.binance.archive import (archive_path, download_klines,
+                                           get_klines, read_klines,
+                                           KLINE_COLUMNS)
+
+
+def _write_month(root, month, unit="ms", header=False, checksum=True):
+    """Hourly klines of BTCUSD_PERP for `month`, as published."""
+    t = pd.period_range(month, periods=1, freq="M")[0]
+    t = pd.date_range(t.start_time, t.end_time, freq="H")
+    epoch = t.values.astype(np.int64) // {"ms": 10 ** 6, "us": 10 ** 3}[unit]
+
+    data = pd.DataFrame({c_: np.arange(len(t)) % 7 + 1.0
+                         for c_ in KLINE_COLUMNS})
+    data["timestamp_open"] = epoch
+    data["timestamp_close"] = epoch + 3600 * {"ms": 10 ** 3,
+                                              "us": 10 ** 6}[unit] - 1
+    data["trades"] = 10
+    csv = data.to_csv(index=False, header=header)
+
+    path = os.path.join(root, archive_path("BTCUSD_PERP", "1h", month, "cm"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr(os.path.basename(path).replace(".zip", ".csv"), csv)
+
+    if checksum:
+        with open(path, "rb") as f:
+            h = hashlib.sha256(f.read()).hexdigest()
+        with open(path + ".CHECKSUM", "w") as f:
+            f.write(f"{h}  {os.path.basename(path)}\n")
+
+    return path
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class TestArchive(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.mirror = os.path.join(self.tmp.name, "mirror")
+        self.store = os.path.join(self.tmp.name, "store")
+        for m_ in ["2020-08", "2020-09", "2020-10"]:
+            _write_month(self.mirror, m_)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def download(self, start="2020-08", end="2020-10", **kwargs):
+        return download_klines("BTCUSD_PERP", "1h", start, end,
+                               market="cm", root_url=self.mirror,
+                               store=self.store, **kwargs)
+
+    def test_download(self):
+        paths = self.download()
+        self.assertEqual(len(paths), 3)
+        self.assertTrue(all(os.path.exists(p_ + ".CHECKSUM")
+                            for p_ in paths))
+
+        # stored months are not read from the mirror again
+        os.remove(os.path.join(self.mirror, archive_path(
+            "BTCUSD_PERP", "1h", "2020-09", "cm")))
+        self.assertListEqual(self.download(), paths)
+
+        # months the mirror lacks are skipped
+        paths = self.download(end="2020-11")
+        self.assertEqual(len(paths), 3)
+
+    def test_checksum(self):
+        path = archive_path("BTCUSD_PERP", "1h", "2020-08", "cm")
+        with open(os.path.join(self.mirror, path), "ab") as f:
+            f.write(b"0")
+
+        with self.assertRaises(ValueError):
+            self.download(end="2020-08")
+        self.assertFalse(os.path.exists(os.path.join(self.store, path)))
+
+        paths = self.download(end="2020-08", checksum=False)
+        self.assertEqual(len(paths), 1)
+
+        # stored archives failing their checksum are downloaded anew
+        _write_month(self.mirror, "2020-08")
+        self.download(end="2020-08", verify=True)
+        with open(paths[0], "rb") as f:
+            h = hashlib.sha256(f.read()).hexdigest()
+        with open(paths[0] + ".CHECKSUM") as f:
+            self.assertEqual(f.read().split()[0], h)
+
+    def test_gone(self):
+        """An archive failing its checksum, then gone from the source when
+        downloaded again, is skipped."""
+        path = archive_path("BTCUSD_PERP", "1h", "2020-08", "cm")
+        get = archive._get
+        calls = list()
+
+        def get_once(root_url, path_):
+            calls.append(path_)
+            if (path_ == path) and (len(calls) > 1):
+                return None
+            res = get(root_url, path_)
+            return res + b"0" if path_ == path else res
+
+        with mock.patch.object(archive, "_get", get_once):
+            paths = self.download(end="2020-08")
+
+        self.assertListEqual(paths, [])
+        self.assertListEqual(calls, [path, path + ".CHECKSUM", path])
+        self.assertFalse(os.path.exists(os.path.join(self.store, path)))
+
+    def test_read(self):
+        _write_month(self.mirror, "2020-11", unit="us", header=True)
+        data = read_klines(self.download(end="2020-11"))
+
+        self.assertEqual(data.index[0], pd.Timestamp("2020-08-01"))
+        self.assertEqual(data.index[-1], pd.Timestamp("2020-11-30 23:00"))
+        self.assertTrue(data.index.is_monotonic_increasing)
+        self.assertEqual(len(data), 24 * (31 + 30 + 31 + 30))
+        self.assertTrue(((data["timestamp_close"] - data.index) <
+                         pd.Timedelta("1H")).all())
+        self.assertNotIn("ignore", data.columns)
+
+    def test_http(self):
+        handler = functools.partial(_QuietHandler, directory=self.mirror)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address[:2]
+
+        try:
+            data = get_klines("BTCUSD_PERP", "1h", "2020-09", "2020-11",
+                              market="cm", root_url=f"http://{host}:{port}",
+                              store=self.store)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(data.index[0], pd.Timestamp("2020-09-01"))
+        self.assertEqual(len(data), 24 * (30 + 31))
@@ -0,0 +1,91 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import numpy as np
+import pandas as pd
+
+from src.datafeed_.binance import upstream
+
+
+class _Client:
+    """Serves hourly klines up to `now`, the last one incomplete."""
+    def __init__(self, now):
+        self.now = pd.Timestamp(now)
+        self.n_rows = 0
+
+    def get_klines(self, symbol, interval):
+        return self._klines(self.now - pd.Timedelta("1H"), self.now)
+
+    def get_historical_klines(self, symbol, interval, start_str, end_str):
+        res = self._klines(pd.Timestamp(start_str), pd.Timestamp(end_str))
+        self.n_rows += len(res)
+        return res
+
+    def _klines(self, start, end):
+        t = pd.date_range(start.ceil("H"), end, freq="H")
+        # the close of the last kline moves until the hour is over
+        close = (t - pd.Timestamp("2021-01-01")) / pd.Timedelta("1H") + \
+            np.where(t == self.now.floor("H"), self.now.minute / 60, 0)
+        ms = t.values.astype(np.int64) // 10 ** 6
+        return [[m_, "1", "2", "0.5", str(c_), "10", m_ + 3599999, "10", 5,
+                 "5", "5", "0"] for m_, c_ in zip(ms, close)]
+
+
+class TestSaveSpot(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.environ = mock.patch.dict(os.environ,
+                                       {"PROJECT_ROOT": self.tmp.name})
+        self.environ.start()
+
+    def tearDown(self):
+        self.environ.stop()
+        del upstream.CLIENT
+        self.tmp.cleanup()
+
+    def test_update(self):
+        """Updates query only new klines and overwrite the last one."""
+        upstream.CLIENT = _Client("2021-01-31 10:30")
+        res = upstream.save_spot("BTCUSDT", "1h",
+                                 start_str="2021-01-01 00:00:00")
+        self.assertEqual(len(res), 30 * 24 + 11)
+
+        path = upstream.klines_path("1h")
+        jan = os.path.join(path, "symbol=BTCUSDT", "month=2021-01",
+                           "part-0.parquet")
+        os.utime(jan, ns=(0, 0))
+
+        upstream.CLIENT = _Client("2021-02-02 00:30")
+        upstream.save_spot("BTCUSDT", "1h")
+        self.assertEqual(upstream.CLIENT.n_rows, 14 + 24 + 1)
+
+        data = upstream.read_spot("BTCUSDT", "1h")
+        self.assertEqual(len(data), 32 * 24 + 1)
+        self.assertTrue(data.index.is_unique)
+        self.assertTrue(data.index.is_monotonic_increasing)
+        self.assertEqual(data.loc["2021-01-31 10:00", "close"], 30 * 24 + 10)
+        self.assertEqual(data["close"].iloc[-1], 32 * 24 + 0.5)
+
+        self.assertNotEqual(os.stat(jan).st_mtime_ns, 0)
+
+        # one month, read without opening the others
+        with open(jan.replace("2021-01", "2021-02"), "wb") as f:
+            f.write(b"not parquet")
+        res = upstream.read_spot("BTCUSDT", "1h", start="2021-01-31",
+                                 end="2021-01", columns=["close"])
+        self.assertListEqual(list(res.columns), ["close"])
+        self.assertEqual(len(res), 24)
+
+    def test_take_over_csv(self):
+        """Klines of an earlier .csv are moved to the dataset."""
+        upstream.CLIENT = _Client("2021-01-02 00:00")
+        old = upstream.save_spot("BTCUSDT", "1h", save=False,
+                                 start_str="2021-01-01 00:00:00")
+        os.makedirs(upstream.data_dir())
+        old.iloc[:-1].to_csv(os.path.join(upstream.data_dir(),
+                                          "BTCUSDT_1h.csv"))
+
+        upstream.save_spot("BTCUSDT", "1h")
+        self.assertEqual(upstream.CLIENT.n_rows, 25 + 2)
+        self.assertEqual(len(upstream.read_spot("BTCUSDT", "1h")), 25)
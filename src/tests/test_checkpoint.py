@@ -0,0 +1,94 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from src.datafeed_.checkpoint import PageLog, PageStore
+
+
+def _fetch_page(since):
+    """Ten records per page, one per cursor step."""
+    return list(range(since, since + 10)), since + 10
+
+
+def _records(pages) -> list:
+    return [r_ for p_ in pages for r_ in p_]
+
+
+class TestPageStore(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.calls = list()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def fetch_page(self, since):
+        self.calls.append(since)
+        return _fetch_page(since)
+
+    def test_resume(self):
+        """An extended pull only fetches the pages it is missing."""
+        store = PageStore(self.tmp.name)
+        res = _records(store.paginate("xbt", 0, 30, self.fetch_page))
+        self.assertListEqual(res, list(range(30)))
+        self.assertListEqual(self.calls, [0, 10, 20])
+
+        res = _records(store.paginate("xbt", 0, 50, self.fetch_page))
+        self.assertListEqual(res, list(range(50)))
+        self.assertListEqual(self.calls, [0, 10, 20, 30, 40])
+
+        # start in the middle of a stored page
+        res = _records(store.paginate("xbt", 15, 50, self.fetch_page,
+                                      cursor_of=lambda x: x))
+        self.assertListEqual(res, list(range(15, 50)))
+        self.assertEqual(len(self.calls), 5)
+
+    def test_torn_page(self):
+        """A partially written page is dropped and fetched again."""
+        store = PageStore(self.tmp.name)
+        _records(store.paginate("xbt", 0, 20, self.fetch_page))
+
+        path = os.path.join(self.tmp.name, "xbt-0.jsonl")
+        with open(path, "a") as f:
+            f.write('{"since": 20, "next": 30, "rec')
+
+        self.assertEqual(len(PageLog(path)), 2)
+
+        res = _records(store.paginate("xbt", 0, 30, self.fetch_page))
+        self.assertListEqual(res, list(range(30)))
+        self.assertListEqual(self.calls, [0, 10, 20])
+        self.assertEqual(len(PageLog(path)), 3)
+
+    def test_streaming(self):
+        """Pages are fetched as they are consumed, and replayed from the
+        page of `start` on."""
+        store = PageStore(self.tmp.name)
+        pages = store.paginate("xbt", 0, 50, self.fetch_page)
+        self.assertListEqual(next(pages), list(range(10)))
+        self.assertListEqual(self.calls, [0])
+        pages.close()
+
+        _records(store.paginate("xbt", 0, 50, self.fetch_page))
+        log = PageLog(os.path.join(self.tmp.name, "xbt-0.jsonl"))
+        self.assertEqual((log.first_cursor, log.last_cursor), (0, 50))
+        self.assertListEqual([p_["since"] for p_ in log.pages(25)],
+                             [20, 30, 40])
+
+    def test_state(self):
+        """Pages processed before are skipped; a state log ahead of its
+        pages is dropped, and not taken for a page log."""
+        store = PageStore(self.tmp.name)
+        state = store.state_log("xbt", 0)
+        for page_ in store.pages("xbt", 0, 30, self.fetch_page):
+            state.append(page_["since"], page_["next"],
+                         sum(page_["records"]))
+        self.assertEqual(state.last_cursor, 30)
+
+        res = store.pages("xbt", 0, 50, self.fetch_page,
+                          after=store.state_log("xbt", 0).last_cursor)
+        self.assertListEqual([p_["since"] for p_ in res], [30, 40])
+        self.assertListEqual(self.calls, [0, 10, 20, 30, 40])
+
+        os.remove(os.path.join(self.tmp.name, "xbt-0.jsonl"))
+        self.assertIsNone(store.state_log("xbt", 0).last_cursor)
+        self.assertListEqual(os.listdir(self.tmp.name), [])
@@ -0,0 +1,81 @@
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+from src.datafeed_ import cli
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+
+class TestCli(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.environ = dict(os.environ)
+
+        path = os.path.join(self.tmp.name, "data", "prepared", "spot",
+                            "kraken")
+        os.makedirs(path)
+        with open(os.path.join(path, "spot-close-kraken.ftr"), "wb") as f:
+            f.write(b"0" * 1024)
+
+        path = os.path.join(self.tmp.name, "data", "checkpoints", "kraken",
+                            "perp")
+        os.makedirs(path)
+        with open(os.path.join(path, "xbt-0.jsonl"), "w") as f:
+            f.write('{"since": 0}\n{"since": 1}\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        os.environ.clear()
+        os.environ.update(self.environ)
+
+    def run_cli(self, *argv) -> (int, str):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            code = cli.main(["--root", self.tmp.name, "-q", *argv])
+
+        return code, out.getvalue()
+
+    def test_status(self):
+        code, out = self.run_cli("status", "--json")
+        res = json.loads(out)
+
+        self.assertEqual(code, 0)
+        self.assertEqual(res["prepared"][0]["name"],
+                         "spot/kraken/spot-close-kraken.ftr")
+        self.assertEqual(res["prepared"][0]["files"], 1)
+        self.assertEqual(res["checkpoints"][0]["name"], "kraken/perp")
+        self.assertEqual(res["checkpoints"][0]["pages"], 2)
+
+    def test_cold_start(self):
+        """Status and help do without pandas."""
+        code = "import sys; from src.datafeed_.cli import main; " \
+               f"main(['--root', {self.tmp.name!r}, 'status']); " \
+               "print('pandas' in sys.modules)"
+        res = subprocess.run([sys.executable, "-c", code], cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+
+        self.assertIn("spot/kraken/spot-close-kraken.ftr", res.stdout)
+        self.assertEqual(res.stdout.split()[-1], "False")
+
+    def test_lock(self):
+        """Runs do not overlap."""
+        path = os.path.join(self.tmp.name, "data", "checkpoints")
+        with cli._lock(path) as acquired:
+            self.assertTrue(acquired)
+            code, _ = self.run_cli("build", "--dry-run")
+        self.assertEqual(code, cli.EXIT_BUSY)
+
+    def test_arguments(self):
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                self.run_cli("build", "futures")
+
+        code, _ = self.run_cli("fetch", "perpetual", "--exchange", "kraken")
+        self.assertEqual(code, cli.EXIT_FAILED)
@@ -0,0 +1,123 @@
+import json
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+import requests
+
+from src.datafeed_.fetcher import Fetcher, TokenBucket, _seconds_until
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves {"ok": n} on /ok; /flaky fails the first `n_fail` calls."""
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.n_connections += 1
+
+    def do_GET(self):
+        self.server.n_calls += 1
+
+        if self.path.startswith("/flaky") and \
+                (self.server.n_calls <= self.server.n_fail):
+            self._send(503, {"error": []})
+        elif self.path.startswith("/limited") and \
+                (self.server.n_calls <= self.server.n_fail):
+            self._send(200, {"error": ["EGeneral:Too many requests"]})
+        elif self.path.startswith("/missing"):
+            self._send(404, {"error": ["not found"]})
+        else:
+            self._send(200, {"error": [], "ok": self.server.n_calls})
+
+    def _send(self, status, body):
+        body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestFetcher(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.n_calls = 0
+        self.server.n_connections = 0
+        self.server.n_fail = 2
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_rate_limit(self):
+        """Requests are paced by the token bucket."""
+        fetcher = Fetcher(rate=20.0, burst=1)
+        t0 = time.monotonic()
+        for _ in range(6):
+            fetcher.get_json(f"{self.url}/ok")
+        self.assertGreaterEqual(time.monotonic() - t0, 0.25)
+        fetcher.close()
+
+    def test_keep_alive(self):
+        """One connection is reused for consecutive requests."""
+        fetcher = Fetcher(rate=1000.0, burst=10)
+        for _ in range(5):
+            fetcher.get_json(f"{self.url}/ok")
+        self.assertEqual(self.server.n_connections, 1)
+        fetcher.close()
+
+    def test_retries(self):
+        """Server errors and rate limit messages are retried."""
+        for path_ in ["flaky", "limited"]:
+            self.server.n_calls = 0
+            fetcher = Fetcher(rate=1000.0, burst=10, backoff=0.01)
+            res = fetcher.get_json(f"{self.url}/{path_}")
+            self.assertEqual(res["ok"], 3)
+            self.assertEqual(fetcher.n_requests, 3)
+            fetcher.close()
+
+    def test_no_retry_on_client_error(self):
+        """Client errors are raised at once."""
+        fetcher = Fetcher(rate=1000.0, burst=10, backoff=0.01)
+        with self.assertRaises(requests.HTTPError):
+            fetcher.get_json(f"{self.url}/missing")
+        self.assertEqual(fetcher.n_requests, 1)
+        fetcher.close()
+
+
+class TestTokenBucket(TestCase):
+    def test_concurrent_callers(self):
+        """The rate holds across threads."""
+        bucket = TokenBucket(rate=50.0, capacity=1)
+        t0 = time.monotonic()
+        threads = [threading.Thread(target=bucket.acquire)
+                   for _ in range(11)]
+        for t_ in threads:
+            t_.start()
+        for t_ in threads:
+            t_.join()
+        self.assertGreaterEqual(time.monotonic() - t0, 0.19)
+
+
+class TestSecondsUntil(TestCase):
+    def test_retry_after(self):
+        """Retry-After is read as seconds or as an HTTP date."""
+        self.assertEqual(_seconds_until("2"), 2.0)
+        self.assertAlmostEqual(
+            _seconds_until(formatdate(time.time() + 5, usegmt=True)), 5.0,
+            delta=1.0
+        )
+        self.assertEqual(
+            _seconds_until(formatdate(time.time() - 5, usegmt=True)), 0.0
+        )
+        for value_ in [None, "", "soon"]:
+            self.assertIsNone(_seconds_until(value_))
@@ -0,0 +1,115 @@
+import json
+import os
+import pstats
+import tempfile
+from unittest import TestCase
+
+import pandas as pd
+
+from src.datafeed_ import instrument
+from src.datafeed_.instrument import Recorder, stage, count
+from src.datafeed_.storage import read_dataset, write_feather
+from src.datafeed_.utilities import imap_ordered
+
+
+@stage
+def _inner(asset, n) -> pd.DataFrame:
+    count(rows_in=n)
+    return pd.DataFrame({"x": range(n)})
+
+
+@stage
+def _outer(assets) -> None:
+    list(imap_ordered(lambda a_: _inner(a_, 10), assets, n_jobs=2,
+                      executor="thread"))
+    count(cache_hits=1)
+
+
+@stage
+def _failing(currency) -> None:
+    raise KeyError(currency)
+
+
+class TestInstrument(TestCase):
+    def test_stages(self):
+        """Counters add up to the enclosing stages, across threads."""
+        with Recorder() as rec:
+            _outer(["xbt", "eth"])
+
+        inner = [r_ for r_ in rec.records if r_["stage"] == "_inner"]
+        self.assertEqual(sorted(r_["asset"] for r_ in inner), ["eth", "xbt"])
+        self.assertTrue(all(r_["parent"] == "_outer" for r_ in inner))
+        self.assertTrue(all(r_["rows_returned"] == 10 for r_ in inner))
+
+        outer = rec.records[-1]
+        self.assertEqual(outer["stage"], "_outer")
+        self.assertEqual(outer["counters"], {"rows_in": 20, "cache_hits": 1})
+        self.assertGreater(outer["peak_rss_mb"], 0)
+
+        totals = rec.report()["totals"]
+        self.assertEqual(totals["_inner"]["calls"], 2)
+        self.assertEqual(totals["_inner"]["rows_in"], 20)
+
+    def test_error(self):
+        with Recorder() as rec:
+            with self.assertRaises(KeyError):
+                _failing("xrp")
+
+        self.assertEqual(rec.records[0]["asset"], "xrp")
+        self.assertEqual(rec.records[0]["error"], "KeyError('xrp')")
+
+    def test_inactive(self):
+        """Without a recorder, stages are plain calls."""
+        self.assertIsNone(instrument._recorder)
+        self.assertEqual(len(_inner("xbt", 3)), 3)
+        count(rows_in=1)
+
+    def test_storage(self):
+        """Rows and bytes of prepared files are counted."""
+        data = pd.DataFrame({
+            "asset": ["xbt", "eth"] * 50,
+            "timestamp": pd.date_range("2021-01-01", periods=100, freq="H",
+                                       tz="UTC"),
+            "price": 1.0,
+        })
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "data.ftr")
+
+            @stage
+            def roundtrip():
+                write_feather(data, path)
+                return read_dataset(path)
+
+            with Recorder() as rec:
+                roundtrip()
+            size = os.path.getsize(path)
+
+        counters = rec.records[0]["counters"]
+        self.assertEqual(counters["rows_out"], 100)
+        self.assertEqual(counters["rows_in"], 100)
+        self.assertEqual(counters["bytes_written"], size)
+        self.assertGreater(counters["bytes_read"], 0)
+
+    def test_report(self):
+        """The report and profile are written on exit."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "reports", "run.json")
+            profile = os.path.join(tmp, "run.prof")
+
+            with Recorder(path, profile=profile):
+                _inner("xbt", 5)
+
+            with open(path) as f:
+                res = json.load(f)
+            stats = pstats.Stats(profile)
+
+        self.assertEqual([r_["stage"] for r_ in res["stages"]], ["_inner"])
+        self.assertEqual(res["totals"]["_inner"]["rows_in"], 5)
+        self.assertGreater(res["wall_time"], 0)
+        self.assertTrue(any(k_[2] == "_inner" for k_ in stats.stats))
+
+    def test_nested_recorders(self):
+        with Recorder():
+            with self.assertRaises(RuntimeError):
+                Recorder().__enter__()
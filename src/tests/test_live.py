@@ -0,0 +1,56 @@
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from src.backtest.carry import CarryBacktest, rank_sort
+from src.backtest.data import CarryData
+from src.backtest.live import LiveCarry
+from src.tests.test_backtest import _data
+
+
+class TestLiveCarry(TestCase):
+    def test_same_as_backtest(self):
+        """Fed in pieces, with restarts, the target portfolio is the one
+        of the backtest at the last funding print."""
+        spot, perp, funding = _data()
+        data = CarryData(spot, perp, funding)
+        bt = CarryBacktest(data)
+        p_low, p_high = rank_sort(bt.signal(13), legsize=1)
+
+        cuts = pd.to_datetime(["2019-01-20 13:00", "2019-02-10 04:00",
+                               "2019-03-01", "2019-05-01"], utc=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            t0 = None
+            for t_ in cuts:
+                live = LiveCarry(legsize=1, signal_lookback=13, n_long=2,
+                                 n_short=3, path=tmp)
+                new = (funding["timestamp"] <= t_) if t0 is None else \
+                    (funding["timestamp"] > t0) & (funding["timestamp"] <= t_)
+                res = live.update(funding=funding.loc[new],
+                                  spot=spot.loc[t0:t_])
+                t0 = t_
+
+                as_of = funding.loc[new, "timestamp"].max()
+                self.assertEqual(live.as_of, as_of)
+                self.assertEqual(live.bar.name, spot.loc[:t_].index[-1])
+
+                row = data.index.get_loc(as_of)
+                cols = data.cols["funding_rel"]
+                expected = pd.Series(
+                    2 * p_high[row, cols] - 3 * p_low[row, cols],
+                    index=data.assets[cols]
+                )
+                self.assertGreater((expected != 0).sum(), 0)
+                np.testing.assert_array_equal(res["position"], expected)
+                np.testing.assert_array_equal(
+                    res["spot"], spot.loc[:t_].iloc[-1].reindex(res.index)
+                )
+
+    def test_other_parameters(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            LiveCarry(path=tmp).update(funding=_data()[2],
+                                       spot=_data()[0])
+            with self.assertRaises(ValueError):
+                LiveCarry(legsize=1, path=tmp)
@@ -0,0 +1,65 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from src.datafeed_.midquote import MidQuotes
+
+# rolling sums are differences of cumulative sums, pandas' are running
+# sums with compensation: the mean half spreads differ by about 1e-16
+# relative, which can flip the last bit of a mid quote
+_RTOL = 1e-15
+
+
+def _quotes(n) -> (pd.DataFrame, pd.DataFrame):
+    """Bid and ask quotes with missing values."""
+    rng = np.random.default_rng(42)
+    index = pd.date_range("2021-01-01", periods=n, freq="10T", tz="UTC",
+                          name="timestamp")
+    columns = pd.Index(["eth", "xbt"], name="asset")
+
+    price = 100 * np.exp(np.cumsum(rng.normal(0, 1e-3, (n, 2)), axis=0))
+    spread = np.abs(rng.normal(0.1, 0.05, (n, 2)))
+    bid = pd.DataFrame(price - spread / 2, index, columns)
+    ask = pd.DataFrame(price + spread / 2, index, columns)
+    bid = bid.mask(rng.random((n, 2)) < 0.3)
+    ask = ask.mask(rng.random((n, 2)) < 0.3)
+    ask.iloc[100:400, 0] = np.nan
+
+    return bid, ask
+
+
+def _mid(bid, ask) -> pd.DataFrame:
+    """Mid quotes, as defined in `get_perpetual`."""
+    ba = (ask - bid).rolling(6 * 24, min_periods=6).mean() / 2
+
+    return ask.sub(ba).fillna(bid.add(ba))
+
+
+class TestMidQuotes(TestCase):
+    def test_mid(self):
+        """Mid quotes match those from pandas, to the last bit or so, see
+        `_RTOL`."""
+        bid, ask = _quotes(1000)
+        assert_frame_equal(MidQuotes(None).get(bid, ask), _mid(bid, ask),
+                           rtol=_RTOL)
+
+    def test_incremental(self):
+        """Appended quotes are the only ones computed."""
+        bid, ask = _quotes(1000)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            mids = MidQuotes(os.path.join(tmp, "mid.npz"))
+            mids.get(bid.iloc[:700], ask.iloc[:700])
+            res = mids.get(bid, ask)
+            self.assertEqual(mids.n_computed, 1000)
+            assert_frame_equal(res, _mid(bid, ask), rtol=_RTOL)
+
+            # quotes changed in the past: start over
+            bid.iloc[10, 1] = 1.0
+            res = mids.get(bid, ask)
+            self.assertEqual(mids.n_computed, 2000)
+            assert_frame_equal(res, _mid(bid, ask), rtol=_RTOL)
@@ -0,0 +1,121 @@
+import json
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, mock
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from src.datafeed_.okex import upstream, downstream, setup
+
+# hourly candles from 2021-01-01 to 2021-03-15, newest last
+_T = pd.date_range("2021-01-01", "2021-03-15", freq="H", tz="UTC")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """'history-candles' of OKEx: candles before `after` and after `before`,
+    newest first; the first request is refused for the rate limit."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k_: v_[-1] for k_, v_ in parse_qs(url.query).items()}
+
+        with self.server.lock:
+            self.server.n_calls += 1
+            is_limited = self.server.n_calls == 1
+        if is_limited:
+            return self._send(429, {"code": "50011",
+                                    "msg": "Too Many Requests"})
+
+        ms = _T.values.astype(np.int64) // 10 ** 6
+        ms = ms[(ms < int(query["after"])) & (ms > int(query["before"]))]
+        ms = ms[::-1][:int(query["limit"])]
+        price = 1.0 if query["instId"] == "BTC-USD-SWAP" else 2.0
+
+        self._send(200, {"code": "0", "msg": "", "data": [
+            [str(m_), str(price), str(price), str(price),
+             str(price + m_ / 1e13), "10", "1", "1", "1"] for m_ in ms
+        ]})
+
+    def _send(self, status, body):
+        body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestBackfill(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.environ = mock.patch.dict(os.environ,
+                                       {"PROJECT_ROOT": self.tmp.name})
+        self.environ.start()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.n_calls = 0
+        self.server.lock = threading.Lock()
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        host, port = self.server.server_address[:2]
+        upstream.configure(root_url=f"http://{host}:{port}",
+                           rate_limit=(1000.0, 100))
+        upstream._get_fetcher().backoff = 0.01
+
+    def tearDown(self):
+        upstream.configure(root_url=setup.ROOT_URL,
+                           rate_limit=setup.RATE_LIMIT)
+        self.environ.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_backfill(self):
+        """Shards of all symbols come out as if fetched in one go."""
+        written = upstream.backfill_perpetual(["BTC", "ETH"], "2020-12",
+                                              "2021-03", n_jobs=3)
+        self.assertListEqual(written, [
+            (a_, m_) for a_ in ["btc", "eth"]
+            for m_ in ["2021-01", "2021-02", "2021-03"]
+        ])
+
+        for symbol_, price_ in [("BTC", 1.0), ("ETH", 2.0)]:
+            res = downstream.get_perpetual(symbol_)
+            self.assertTrue(res.index.equals(pd.DatetimeIndex(_T)))
+            np.testing.assert_allclose(
+                res.values, price_ + _T.values.astype(np.int64) / 1e19
+            )
+
+        # of the months stored, only the latest is fetched again
+        n_calls = self.server.n_calls
+        written = upstream.backfill_perpetual(["BTC"], "2021-01", "2021-03")
+        self.assertListEqual(written, [("btc", "2021-03")])
+        self.assertEqual(self.server.n_calls - n_calls, 4)
+
+    def test_selective_read(self):
+        """Partitions of other symbols and months are not opened."""
+        upstream.save_perpetual("ETH", "2021-02", "2021-03")
+        upstream.save_perpetual("BTC", "2021-02", "2021-03")
+
+        path = upstream.perpetual_path()
+        for a_ in ["btc", "eth"]:
+            with open(os.path.join(path, f"asset={a_}", "month=2021-03",
+                                   "part-0.parquet"), "wb") as f:
+                f.write(b"not parquet")
+
+        res = downstream.get_perpetual("ETH", start="2021-02-10",
+                                       end="2021-02",
+                                       columns=["open", "close"])
+        self.assertListEqual(list(res.columns), ["open", "close"])
+        self.assertEqual(res.index[0], pd.Timestamp("2021-02-10", tz="UTC"))
+        self.assertEqual(res.index[-1],
+                         pd.Timestamp("2021-02-28 23:00", tz="UTC"))
+        self.assertTrue((res["open"] == 2.0).all())
@@ -0,0 +1,107 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal, assert_series_equal
+
+from src.datafeed_.panel import PanelCache, align
+
+
+def _prices(price=1.0) -> pd.DataFrame:
+    timestamp = pd.date_range("2021-01-01", periods=5, freq="10T", tz="UTC")
+    res = pd.concat([
+        pd.DataFrame({"asset": a_, "side": s_, "timestamp": timestamp,
+                      "price": price})
+        for a_ in ["eth", "xbt"] for s_ in ["ask", "bid"]
+    ], axis=0, ignore_index=True)
+
+    return res
+
+
+class TestPanelCache(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, "prices.ftr")
+        self.cache = PanelCache(os.path.join(self.tmp.name, "panels"))
+        _prices().to_feather(self.source)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def get(self) -> pd.DataFrame:
+        return self.cache.get(self.source, index="timestamp",
+                              columns=["asset", "side"], values="price")
+
+    def test_panel(self):
+        """The panel equals the pivot and is built once."""
+        expected = _prices().pivot(index="timestamp",
+                                   columns=["asset", "side"], values="price")
+        assert_frame_equal(self.get(), expected)
+        assert_frame_equal(self.get(), expected)
+
+        # from disk
+        self.cache.clear()
+        assert_frame_equal(self.get(), expected)
+        self.assertEqual(self.cache.n_builds, 1)
+
+    def test_invalidation(self):
+        """Panels are rebuilt when the source changes, not when touched."""
+        self.get()
+
+        stat = os.stat(self.source)
+        os.utime(self.source, ns=(stat.st_atime_ns,
+                                  stat.st_mtime_ns + 10 ** 9))
+        self.get()
+        self.assertEqual(self.cache.n_builds, 1)
+
+        _prices(price=2.0).to_feather(self.source)
+        self.assertEqual(self.get().iloc[0, 0], 2.0)
+        self.assertEqual(self.cache.n_builds, 2)
+
+
+class TestAlign(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        t = pd.Timestamp("2021-01-01", tz="UTC") + \
+            pd.to_timedelta(np.sort(rng.integers(0, 10 ** 6, 5000)), "s")
+        self.s = pd.Series(rng.normal(size=len(t)), index=t)
+        self.s.iloc[::7] = np.nan
+
+    def test_resample(self):
+        """With the default staleness, as resample().last() on the grid."""
+        res = align({("kraken", "xbt"): self.s,
+                     ("okex", "xbt"): self.s.iloc[100:].tz_localize(None)},
+                    "4H", names=["venue", "asset"])
+        self.assertTrue(res.values.flags["C_CONTIGUOUS"])
+        self.assertListEqual(list(res.columns.names), ["venue", "asset"])
+
+        expected = self.s.resample("4H", closed="right", label="right")\
+            .last().reindex(res.index)
+        for c_ in res.columns:
+            assert_series_equal(res.to_frame()[c_].loc[expected.index[5]:],
+                                expected.loc[expected.index[5]:],
+                                check_names=False, check_freq=False)
+
+        # a subset, still as one array
+        sub = res.select(venue="okex")
+        self.assertEqual(sub.shape, (len(res.index), 1))
+        self.assertTrue(sub.values.flags["C_CONTIGUOUS"])
+
+    def test_staleness(self):
+        """Observations are carried forward for less than `max_staleness`."""
+        s = pd.Series([1.0, 2.0, np.nan], index=pd.to_datetime(
+            ["2021-01-01 00:05", "2021-01-01 01:00", "2021-01-01 01:20"],
+            utc=True
+        ))
+        res = align({"a": s, "b": s}, "10T", end="2021-01-01 01:40",
+                    max_staleness={"a": "20T", "b": None}).to_frame()
+
+        self.assertEqual(res.index[0], pd.Timestamp("2021-01-01 00:10",
+                                                    tz="UTC"))
+        np.testing.assert_array_equal(
+            res["a"].values, [1, 1] + [np.nan] * 3 + [2, 2] + [np.nan] * 3
+        )
+        self.assertTrue((res["b"].values[:5] == 1).all())
+        self.assertTrue((res["b"].values[5:] == 2).all())
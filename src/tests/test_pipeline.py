@@ -0,0 +1,127 @@
+import os
+import tempfile
+import threading
+from unittest import TestCase
+
+from src.datafeed_.pipeline import Pipeline, Stage
+
+
+class TestPipeline(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.calls = list()
+
+        self.raw = self.path("raw")
+        os.makedirs(self.raw)
+        self.write(os.path.join(self.raw, "a.csv"), "1,2\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def path(self, name) -> str:
+        return os.path.join(self.tmp.name, name)
+
+    @staticmethod
+    def write(path, content) -> None:
+        with open(path, "w") as f:
+            f.write(content)
+
+    def copy(self, name, src, dst):
+        """Stage function copying a file, or all files of a directory."""
+        def func(**params):
+            self.calls.append(name)
+            fs = [os.path.join(src, f_) for f_ in sorted(os.listdir(src))] \
+                if os.path.isdir(src) else [src]
+            content = "".join(open(f_).read() for f_ in fs)
+            self.write(dst, content + str(params.get("suffix", "")))
+
+        return func
+
+    def make_pipeline(self, suffix="") -> Pipeline:
+        stages = [
+            Stage("merged", self.copy("merged", self.path("prepared.csv"),
+                                      self.path("merged.csv")),
+                  inputs=[self.path("prepared.csv")],
+                  outputs=[self.path("merged.csv")]),
+            Stage("prepared", self.copy("prepared", self.raw,
+                                        self.path("prepared.csv")),
+                  inputs=[self.raw], outputs=[self.path("prepared.csv")],
+                  params={"suffix": suffix}),
+        ]
+
+        return Pipeline(stages, self.path("state.json"))
+
+    def test_skip(self):
+        """Stages rerun only once their inputs change."""
+        pipeline = self.make_pipeline()
+        self.assertListEqual(pipeline.order, ["prepared", "merged"])
+        self.assertEqual(pipeline.run(),
+                         {"prepared": "ran", "merged": "ran"})
+
+        # state survives the pipeline
+        pipeline = self.make_pipeline()
+        self.assertEqual(pipeline.plan(),
+                         {"prepared": "up to date", "merged": "up to date"})
+        self.assertEqual(pipeline.run(),
+                         {"prepared": "skipped", "merged": "skipped"})
+
+        # rewritten with the same content
+        self.write(os.path.join(self.raw, "a.csv"), "1,2\n")
+        self.assertEqual(set(pipeline.run().values()), {"skipped"})
+
+        self.write(os.path.join(self.raw, "b.csv"), "3,4\n")
+        self.assertEqual(pipeline.plan(), {"prepared": "inputs changed",
+                                           "merged": "after prepared"})
+        self.assertEqual(pipeline.run(),
+                         {"prepared": "ran", "merged": "ran"})
+        with open(self.path("merged.csv")) as f:
+            self.assertEqual(f.read(), "1,2\n3,4\n")
+
+        self.assertListEqual(self.calls, ["prepared", "merged"] * 2)
+
+    def test_params_outputs(self):
+        self.make_pipeline().run()
+
+        self.assertEqual(self.make_pipeline(suffix="x").plan()["prepared"],
+                         "parameters changed")
+
+        os.remove(self.path("merged.csv"))
+        self.assertEqual(self.make_pipeline().plan(),
+                         {"prepared": "up to date",
+                          "merged": "outputs missing"})
+        self.assertEqual(self.make_pipeline().run(),
+                         {"prepared": "skipped", "merged": "ran"})
+
+    def test_failure(self):
+        """A failed stage blocks those after it, and is retried."""
+        def fail():
+            raise ValueError
+
+        stages = [
+            Stage("a", fail, inputs=[self.raw], outputs=[self.path("a")]),
+            Stage("b", lambda: None, inputs=[self.path("a")]),
+            Stage("c", lambda: None, inputs=[self.raw]),
+        ]
+        pipeline = Pipeline(stages, self.path("state.json"))
+
+        with self.assertLogs("src.datafeed_.pipeline", level="ERROR"):
+            res = pipeline.run()
+        self.assertEqual(res, {"a": "failed", "b": "blocked", "c": "ran"})
+        self.assertEqual(pipeline.plan()["a"], "never run")
+
+    def test_concurrent(self):
+        """Independent stages run at the same time; those without inputs
+        always run."""
+        barrier = threading.Barrier(3, timeout=10)
+        stages = [Stage(n_, barrier.wait) for n_ in "abc"]
+        pipeline = Pipeline(stages, self.path("state.json"))
+
+        for _ in range(2):
+            self.assertEqual(set(pipeline.run().values()), {"ran"})
+
+    def test_cycle(self):
+        stages = [Stage("a", None, inputs=["x"], outputs=["y"]),
+                  Stage("b", None, inputs=["y"], outputs=["x"])]
+
+        with self.assertRaises(ValueError):
+            Pipeline(stages, self.path("state.json"))
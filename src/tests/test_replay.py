@@ -0,0 +1,138 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from src.benchmarks import synthetic
+from src.datafeed_.fetcher import Fetcher
+from src.datafeed_.instrument import Recorder
+from src.datafeed_.kraken import setup, upstream
+from src.datafeed_.kraken.replay import ReplayServer
+
+_START = "2031-01-01"
+
+
+class TestReplayServer(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.data = synthetic.make_api_data(_START, 2500, ["xbt", "eth"])
+        cls.server = ReplayServer(**cls.data, page_size=1000,
+                                  rate_limits={"spot": None,
+                                               "futures": None}).start()
+        cls.fetcher = Fetcher(rate=1000, burst=100)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        cls.fetcher.close()
+
+    def test_executions(self):
+        """From `since` on, in pages, either way."""
+        url = self.server.urls()["root_url_perp"].format("pi_xbtusd")
+        t = self.data["futures"]["pi_xbtusd"]["timestamp"]
+
+        res = self.fetcher.get_json(url, {"since": int(t[10]),
+                                          "sort": "asc"})
+        timestamps = [e_["timestamp"] for e_ in res["elements"]]
+        self.assertEqual(len(timestamps), 1000)
+        self.assertListEqual(timestamps, t[10:1010].tolist())
+
+        res = self.fetcher.get_json(url, {"since": int(t[10]),
+                                          "before": int(t[20]),
+                                          "sort": "desc"})
+        timestamps = [e_["timestamp"] for e_ in res["elements"]]
+        self.assertListEqual(timestamps, t[10:20].tolist()[::-1])
+
+    def test_trades(self):
+        """After `since`, in seconds or nanoseconds."""
+        url = f"{self.server.urls()['root_url_spot']}/Trades"
+        t = self.data["spot"]["ethusd"]["time"]
+
+        res = self.fetcher.get_json(url, {"pair": "ethusd",
+                                          "since": f"{t[5]:.4f}"})
+        self.assertEqual(res["result"]["ETHUSD"][0][2], t[6])
+        self.assertEqual(len(res["result"]["ETHUSD"]), 1000)
+
+        res = self.fetcher.get_json(url, {"pair": "ethusd",
+                                          "since": res["result"]["last"]})
+        self.assertEqual(res["result"]["ETHUSD"][0][2], t[1006])
+
+    def test_rate_limit(self):
+        """Requests beyond the limit are refused, and retried."""
+        with ReplayServer(**self.data, rate_limits={"spot": (20.0, 1),
+                                                    "futures": None}) as s_:
+            fetcher = Fetcher(rate=1000, burst=100, backoff=0.01)
+            url = f"{s_.urls()['root_url_spot']}/Trades"
+            for _ in range(5):
+                res = fetcher.get_json(url, {"pair": "xbtusd", "since": 0})
+                self.assertEqual(len(res["result"]["XBTUSD"]), 1000)
+            fetcher.close()
+
+            self.assertEqual(s_.stats["spot"], 5)
+            self.assertGreater(s_.stats["limited"], 0)
+
+    def test_perpetual_from_api(self):
+        """The fetch path of `upstream` pages through the server."""
+        executions = self.data["futures"]["pi_ethusd"]
+        start = pd.Timestamp(_START, tz="UTC")
+        end = pd.Timestamp(executions["timestamp"].iloc[-1], unit="ms",
+                           tz="UTC")
+        n0 = self.server.stats["futures"]
+
+        upstream.configure(**self.server.urls(),
+                           rate_limit_perp=(1000.0, 100))
+        try:
+            with tempfile.TemporaryDirectory() as tmp, \
+                    mock.patch.dict(os.environ, {"PROJECT_ROOT": tmp}):
+                res = upstream._get_perpetual_from_api("eth", start, end)
+        finally:
+            upstream.configure(setup.ROOT_URL, setup.ROOT_URL_SPOT,
+                               setup.ROOT_URL_PERP, setup.RATE_LIMIT_SPOT,
+                               setup.RATE_LIMIT_PERP)
+
+        # pages overlap by the execution at their boundary
+        self.assertEqual(self.server.stats["futures"] - n0, 3)
+        self.assertEqual(res["timestamp"].min().floor("10T"),
+                         start.ceil("10T"))
+        self.assertEqual(set(res["side"]), {"bid", "ask"})
+
+    def test_extended_pull(self):
+        """A pull with a later end only aggregates the pages after those
+        of the earlier one, and gives the bars of a pull in one go."""
+        executions = self.data["futures"]["pi_xbtusd"]
+        start = pd.Timestamp(_START, tz="UTC")
+        t = pd.to_datetime(executions["timestamp"], unit="ms", utc=True)
+
+        def pull(end):
+            with Recorder() as rec:
+                res = upstream._get_perpetual_from_api("xbt", start, end)
+            counters = [r_["counters"] for r_ in rec.records
+                        if r_["stage"].endswith("_get_perpetual_from_api")]
+            return res, counters[0]
+
+        upstream.configure(**self.server.urls(),
+                           rate_limit_perp=(1000.0, 100))
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                with mock.patch.dict(os.environ, {"PROJECT_ROOT": tmp}):
+                    pull(t.iloc[1200])
+                    res, counters = pull(t.iloc[-1])
+                    # and back to the earlier end, from the stored bars
+                    res_early, _ = pull(t.iloc[1200])
+                with mock.patch.dict(os.environ,
+                                     {"PROJECT_ROOT": f"{tmp}/once"}):
+                    expected, _ = pull(t.iloc[-1])
+                    expected_early, _ = pull(t.iloc[1200])
+        finally:
+            upstream.configure(setup.ROOT_URL, setup.ROOT_URL_SPOT,
+                               setup.ROOT_URL_PERP, setup.RATE_LIMIT_SPOT,
+                               setup.RATE_LIMIT_PERP)
+
+        self.assertEqual(counters.get("pages_replayed", 0), 0)
+        self.assertEqual(counters["pages_fetched"], 1)
+        # the third page, from the last execution of the second on
+        self.assertEqual(counters["rows_in"], 2500 - 1998)
+        assert_frame_equal(res, expected)
+        assert_frame_equal(res_early, expected_early)
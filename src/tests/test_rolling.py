@@ -0,0 +1,127 @@
+import os
+import pickle
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from src.backtest.rolling import (IndexableSkiplist, RollingQuantile,
+                                  rolling_median)
+
+
+def _data(n=300, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    res = pd.DataFrame(rng.normal(size=(n, 4)).round(2),
+                       index=pd.date_range("2021-01-01", periods=n, freq="H",
+                                           tz="UTC", name="timestamp"),
+                       columns=pd.Index(list("abcd"), name="asset"))
+    res = res.mask(rng.random(res.shape) < 0.2)
+    res.iloc[:100, 3] = np.nan
+
+    return res
+
+
+class TestIndexableSkiplist(TestCase):
+    def test_sorted(self):
+        rng = np.random.default_rng(0)
+        x = rng.integers(0, 20, 200).astype(float)
+        sl = IndexableSkiplist(50)
+        for x_ in x:
+            sl.insert(x_)
+        for x_ in x[:150]:
+            sl.remove(x_)
+
+        self.assertEqual([sl[i_] for i_ in range(len(sl))],
+                         sorted(x[150:]))
+        with self.assertRaises(KeyError):
+            sl.remove(100.0)
+
+
+class TestRollingQuantile(TestCase):
+    def test_same_as_pandas(self):
+        """Same as pandas, for medians and quantiles, with nans."""
+        data = _data()
+        for window, min_periods, quantile in [(10, 5, None), (7, 1, None),
+                                              (4, None, None),
+                                              (10, 3, 0.25), (9, 9, 0.9)]:
+            rolling = data.rolling(window, min_periods=min_periods)
+            expected = rolling.median() if quantile is None \
+                else rolling.quantile(quantile)
+
+            res = RollingQuantile(window, min_periods, quantile)\
+                .extend(data)
+            assert_frame_equal(res, expected, check_freq=False)
+
+    def test_new_columns(self):
+        """Columns showing up later are as nan before."""
+        data = _data()
+        data.iloc[:150, 2:] = np.nan
+        rq = RollingQuantile(12, 6)
+        head = rq.extend(data.iloc[:150, :2])
+        tail = rq.extend(data.iloc[150:])
+
+        expected = data.rolling(12, min_periods=6).median()
+        assert_frame_equal(pd.concat([head, tail]), expected,
+                           check_freq=False)
+
+    def test_state(self):
+        """Pickled or saved midway, it goes on as if it had not been."""
+        data = _data()
+        expected = data.rolling(42, min_periods=21).median()
+
+        rq = RollingQuantile(42, 21)
+        # the last `window` rows are all that is needed
+        rq.extend(data.iloc[100:200])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "state.npz")
+            rq.save(path)
+            for rq_ in [pickle.loads(pickle.dumps(rq)),
+                        RollingQuantile.load(path)]:
+                self.assertEqual(rq_.last, data.index[199])
+                res = rq_.extend(data.iloc[200:])
+                assert_frame_equal(res, expected.iloc[200:],
+                                   check_freq=False)
+
+        with self.assertRaises(ValueError):
+            rq.update(data.iloc[150])
+
+    def test_numpy_labels(self):
+        """States with numpy labels of rows and columns can be saved."""
+        data = _data().reset_index(drop=True)
+        data.index = data.index.astype("int64")
+        data.columns = np.array([1.0, 2.0, 3.0, 4.0])
+
+        rq = RollingQuantile(10, 5)
+        rq.update(data.iloc[0].rename(np.float64(0.5)))
+        rq.update(data.iloc[1].rename(np.int64(1)))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "state.npz")
+            rq.save(path)
+            rq_ = RollingQuantile.load(path)
+
+        self.assertEqual(rq_.last, 1)
+        self.assertListEqual(rq_.columns, [1.0, 2.0, 3.0, 4.0])
+        with self.assertRaises(ValueError):
+            rq_.update(data.iloc[1].rename(1))
+
+
+class TestRollingMedian(TestCase):
+    def test_same_as_pandas(self):
+        """Rolling median skips nans like pandas does, and gives the same
+        as `RollingQuantile`."""
+        x = np.random.default_rng(1).normal(size=(200, 3))
+        x[np.random.default_rng(2).random(x.shape) < 0.3] = np.nan
+        for window, min_periods in [(10, 5), (7, 1), (4, 4)]:
+            expected = pd.DataFrame(x)\
+                .rolling(window, min_periods=min_periods).median().values
+            res = rolling_median(x, window, min_periods)
+            np.testing.assert_array_equal(res, expected)
+            np.testing.assert_array_equal(
+                res,
+                RollingQuantile(window, min_periods)
+                .extend(pd.DataFrame(x)).values
+            )
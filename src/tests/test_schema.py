@@ -0,0 +1,62 @@
+import json
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pandas.testing import assert_frame_equal
+
+from src.datafeed_.schema import encode, decode, SCHEMA_VERSION
+
+
+def _prices() -> pd.DataFrame:
+    return pd.DataFrame({
+        "asset": ["xbt", "eth", "xbt"],
+        "side": ["bid", "ask", "ask"],
+        "timestamp": pd.date_range("2021-01-01", periods=3, freq="10T",
+                                   tz="UTC"),
+        "price": [1.5, 2.0, np.nan]
+    })
+
+
+class TestSchema(TestCase):
+    def test_roundtrip(self):
+        """Encoded data decodes to the same values, keys as categoricals."""
+        data = _prices()
+        table = encode(data)
+        self.assertTrue(pa.types.is_dictionary(table.schema.field("asset")
+                                               .type))
+        self.assertEqual(table.schema.field("timestamp").type, pa.int64())
+
+        res = decode(table)
+        self.assertListEqual(list(res["asset"].cat.categories),
+                             ["eth", "xbt"])
+        assert_frame_equal(res.astype({"asset": str, "side": str}), data)
+
+        res = decode(encode(data, float32=True))
+        self.assertEqual(res["price"].dtype, np.float32)
+
+    def test_growing_categories(self):
+        """Batches share one growing dictionary; decoded ones are sorted."""
+        categories = dict()
+        encode(_prices().iloc[:1], categories=categories)
+        table = encode(_prices(), categories=categories)
+        self.assertListEqual(categories["asset"], ["xbt", "eth"])
+
+        res = decode(table)
+        self.assertListEqual(list(res["asset"].cat.categories),
+                             ["eth", "xbt"])
+        self.assertListEqual(list(res["asset"]), ["xbt", "eth", "xbt"])
+
+    def test_versions(self):
+        """Tables without the schema are read as is, newer ones refused."""
+        data = _prices()
+        res = decode(pa.Table.from_pandas(data))
+        assert_frame_equal(res.astype({"asset": str, "side": str}), data)
+
+        table = encode(data)
+        table = table.replace_schema_metadata({
+            b"datafeed_schema": json.dumps({"version": SCHEMA_VERSION + 1})
+        })
+        with self.assertRaises(ValueError):
+            decode(table)
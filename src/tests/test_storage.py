@@ -0,0 +1,113 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from src.datafeed_.storage import (write_partitions, read_partitions,
+                                   read_last_partitions, read_dataset,
+                                   make_filter, write_feather,
+                                   first_timestamp, month_of)
+
+
+def _prices(start, periods, price=1.0) -> pd.DataFrame:
+    timestamp = pd.date_range(start, periods=periods, freq="10D", tz="UTC")
+    res = pd.concat([
+        pd.DataFrame({"asset": a_, "side": "bid", "timestamp": timestamp,
+                      "price": price})
+        for a_ in ["eth", "xbt"]
+    ], axis=0, ignore_index=True)
+
+    return res
+
+
+class TestPartitions(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "prices")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_roundtrip(self):
+        """Partitioned data reads back as written."""
+        data = _prices("2021-01-01", 9)
+        write_partitions(data, self.path)
+
+        res = read_partitions(self.path)\
+            .sort_values(["asset", "timestamp"]).reset_index(drop=True)
+        assert_frame_equal(res, data)
+
+    def test_update(self):
+        """Updates touch only their partitions; stored rows win."""
+        write_partitions(_prices("2021-01-01", 9), self.path)
+
+        new = _prices("2021-03-22", 3, price=2.0)
+        written = write_partitions(new, self.path,
+                                   subset=["asset", "side", "timestamp"])
+        self.assertListEqual(written, [("eth", "2021-03"), ("eth", "2021-04"),
+                                       ("xbt", "2021-03"), ("xbt", "2021-04")])
+
+        res = read_partitions(self.path)
+        self.assertEqual(len(res), 2 * 11)
+        self.assertEqual(
+            res.loc[res["timestamp"] == "2021-03-22", "price"].max(), 1.0
+        )
+
+        # the latest month of each asset
+        last = read_last_partitions(self.path)
+        self.assertEqual(len(last), 2 * 2)
+        self.assertEqual(last["timestamp"].min(),
+                         pd.Timestamp("2021-04-01", tz="UTC"))
+
+    def test_filtered_read(self):
+        """Filters give the same rows from a dataset and from a .ftr file."""
+        data = _prices("2021-01-01", 9)
+        write_partitions(data, self.path)
+        write_feather(data, f"{self.path}.ftr")
+
+        filter_ = make_filter(start="2021-02-01", end="2021-02", asset="xbt")
+        expected = data.loc[(data["asset"] == "xbt") &
+                            (data["timestamp"] >= "2021-02-01") &
+                            (data["timestamp"] < "2021-03-01")]\
+            .reset_index(drop=True)
+        self.assertEqual(len(expected), 2)
+
+        for path_ in [self.path, f"{self.path}.ftr"]:
+            res = read_dataset(path_, filter=filter_)\
+                .sort_values("timestamp").reset_index(drop=True)
+            self.assertIsInstance(res["side"].dtype, pd.CategoricalDtype)
+            res = res.astype({"asset": str, "side": str})
+            assert_frame_equal(res, expected)
+
+        self.assertIsNone(make_filter(asset=None))
+
+    def test_first_timestamp(self):
+        """The earliest timestamp, from a dataset and from a .ftr file."""
+        data = pd.concat((_prices("2021-02-01", 3),
+                          _prices("2021-01-05", 3).query("asset == 'xbt'")))
+        write_partitions(data, self.path)
+        write_feather(data, f"{self.path}.ftr")
+
+        for path_ in [self.path, f"{self.path}.ftr"]:
+            self.assertEqual(first_timestamp(path_),
+                             pd.Timestamp("2021-01-05", tz="UTC"))
+        self.assertIsNone(first_timestamp(f"{self.path}-missing"))
+
+
+class TestMonthOf(TestCase):
+    def test_month_of(self):
+        """Months in UTC, as strftime would give them."""
+        t = pd.Series(pd.to_datetime(
+            ["2021-03-31 23:30", None, "2021-04-01 00:30", "2020-12-01"]
+        )).dt.tz_localize("UTC")
+
+        for t_ in [t, t.dt.tz_convert("Europe/Zurich"),
+                   t.dt.tz_localize(None)]:
+            res = month_of(t_)
+            self.assertListEqual(res.tolist(),
+                                 ["2021-03", None, "2021-04", "2020-12"])
+            self.assertTrue(res.equals(
+                t.dt.strftime("%Y-%m").where(t.notna(), None)
+            ))
@@ -0,0 +1,56 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from src.backtest.carry import CarryBacktest
+from src.backtest.data import CarryData
+from src.backtest.sweep import describe, expand_grid, sweep
+from src.tests.test_backtest import _data
+
+
+class TestSweep(TestCase):
+    grid = {"t_hold": [1, 3], "legsize": [1, 2],
+            "signal_lookback": [13, 42], "leverage": [(1, 3), (2, 2)]}
+
+    def test_expand_grid(self):
+        configs = expand_grid(self.grid)
+        self.assertEqual(len(configs), 16)
+        self.assertEqual(configs[0]["signal_lookback"], 13)
+        self.assertEqual(configs[-1]["signal_lookback"], 42)
+        self.assertIn({"t_hold": 3, "legsize": 1, "signal_lookback": 42,
+                       "n_long": 2, "n_short": 2}, configs)
+
+    def test_parallel_same_as_serial(self):
+        """Workers on shared memory give what runs in this process give."""
+        data = CarryData(*_data())
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "sweep.csv")
+            res = sweep(data, self.grid, n_jobs=2, path=path, chunksize=3)
+            streamed = pd.read_csv(path)
+
+        self.assertEqual(len(res), 16 * 3)
+        assert_frame_equal(streamed, res, check_dtype=False)
+
+        serial = sweep(data, self.grid, n_jobs=1)
+        assert_frame_equal(res, serial)
+
+        bt = CarryBacktest(data)
+        row = res.query("t_hold == 3 & legsize == 1 & signal_lookback == 13"
+                        " & n_long == 2 & portfolio == 'p_hml'")
+        r = bt.run_frame(t_hold=3, legsize=1, signal_lookback=13, n_long=2,
+                         n_short=2)["p_hml"]
+        self.assertAlmostEqual(row["mean"].item(), r.mean() * 365 * 2 * 100)
+        self.assertAlmostEqual(row["sharpe"].item(),
+                               r.mean() / r.std() * np.sqrt(365 * 2))
+
+    def test_describe(self):
+        """Without lags, the t-statistic is the usual one."""
+        r = np.random.default_rng(0).normal(0.01, 0.1, (500, 2))
+        res = describe(r, ann=12, cov_lags=0)
+        expected = r.mean(axis=0) / np.sqrt(r.var(axis=0) / len(r))
+        np.testing.assert_allclose(res[:, 1], expected)
+        np.testing.assert_allclose(res[:, 3], 500)
@@ -0,0 +1,196 @@
+import multiprocessing
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from src.benchmarks import synthetic
+from src.datafeed_.instrument import Recorder
+from src.datafeed_.kraken import upstream, downstream
+from src.datafeed_.utilities import aggregate_data
+
+_MONTHS = ["2020-09", "2020-10", "2020-11"]
+
+
+class TestPerpetualFromCsv(TestCase):
+    """Monthly archives around the October 2020 one, in its own layout."""
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.environ = mock.patch.dict(os.environ,
+                                       {"PROJECT_ROOT": self.tmp.name})
+        self.environ.start()
+
+        self.raw = os.path.join(self.tmp.name, "data/raw/perpetual/kraken")
+        os.makedirs(self.raw)
+        os.makedirs(os.path.join(self.tmp.name,
+                                 "data/prepared/perpetual/kraken"))
+
+        self.trades = [synthetic.make_matches_history(m_, 3000,
+                                                      ["xbt", "eth"])
+                       for m_ in _MONTHS]
+
+        # and trades on both sides of each month end
+        for n_, m_ in enumerate(_MONTHS):
+            t = pd.Timestamp(m_)
+            extra = pd.DataFrame({
+                "uid": -1, "tradeable": "PI_XBTUSD", "size": 10,
+                "aggressor": "buyer", "price": [50.0, 150.0],
+                "timestamp": [t + pd.Timedelta("1T"),
+                              t + pd.offsets.MonthBegin() -
+                              pd.Timedelta("2T")],
+            })
+            extra["timestamp"] = extra["timestamp"]\
+                .dt.strftime("%Y-%m-%d %H:%M:%S.%f").str[:-3]
+            self.trades[n_] = pd.concat((self.trades[n_], extra))\
+                .sort_values("timestamp", kind="stable")\
+                .reset_index(drop=True)
+
+    def tearDown(self):
+        upstream.memory.clear(warn=False)
+        self.environ.stop()
+        self.tmp.cleanup()
+
+    def write(self, overlap: str = None) -> None:
+        """Write the archives, each repeating the first `overlap` of the
+        next month, if given."""
+        for n_, m_ in enumerate(_MONTHS):
+            data = self.trades[n_]
+            if (overlap is not None) and (n_ + 1 < len(_MONTHS)):
+                data = pd.concat((data, self._head(n_ + 1, overlap)))
+            synthetic.write_matches_history(self.raw, data,
+                                            rti=m_ == "2020-10")
+
+    def _head(self, n, overlap) -> pd.DataFrame:
+        """Trades of the first `overlap` of month `n`."""
+        t = pd.to_datetime(self.trades[n]["timestamp"])
+        end = pd.Timestamp(_MONTHS[n]) + pd.Timedelta(overlap)
+
+        return self.trades[n].loc[t < end]
+
+    def save(self, **kwargs) -> pd.DataFrame:
+        """Prepare the archives anew and read the result."""
+        upstream.memory.clear(warn=False)
+        upstream.save_perpetual_from_csv(**kwargs)
+
+        return downstream._read_prepared("perpetual", "perp-bidask-kraken")\
+            .sort_values(["asset", "side", "timestamp"])\
+            .reset_index(drop=True)
+
+    def test_parallel(self):
+        """Files parsed in a pool give the same bars as parsed in turn."""
+        self.write()
+        res = self.save(n_jobs=1)
+        self.assertTrue(set(_MONTHS) <=
+                        set(res["timestamp"].dt.strftime("%Y-%m")))
+        self.assertSetEqual(set(res["asset"]), {"xbt", "eth"})
+
+        assert_frame_equal(self.save(n_jobs=2), res)
+        # the pool is shut down with the last pair
+        self.assertListEqual(multiprocessing.active_children(), [])
+
+    def test_streaming_overlap(self):
+        """With files repeating the start of the next month, streaming and
+        pairwise bars are the same, those at month ends included; the
+        repeated trades the streaming mode sees late are counted."""
+        self.write(overlap="1H")
+        res = self.save()
+
+        with Recorder() as rec:
+            res_streaming = self.save(streaming=True, chunksize=1000)
+        assert_frame_equal(res_streaming, res)
+
+        boundaries = pd.to_datetime(_MONTHS[1:], utc=True)
+        self.assertTrue(res["timestamp"].isin(boundaries).any())
+
+        # trades of a file older than the window held back at the end of
+        # the previous one
+        n_late = 0
+        for n_ in range(1, len(_MONTHS)):
+            head = self._head(n_, "1H")
+            watermark = pd.to_datetime(head.loc[
+                head["tradeable"].str.startswith("PI_"), "timestamp"
+            ]).max() - pd.Timedelta("10T")
+
+            t = pd.to_datetime(self.trades[n_]["timestamp"])
+            perpetual = self.trades[n_]["tradeable"].str.startswith("PI_")
+            n_late += (perpetual & (t < watermark)).sum()
+
+        counters = [r_["counters"] for r_ in rec.records
+                    if r_["stage"].endswith("save_perpetual_from_csv")][0]
+        self.assertGreater(n_late, 0)
+        self.assertEqual(counters["rows_late"], n_late)
+
+    def test_streaming_boundaries(self):
+        """Without overlap, the bars of the pairwise mode at the end of the
+        second month lack the trades of the third; streaming ones do not."""
+        self.write()
+        res = self.save()
+        res_streaming = self.save(streaming=True, chunksize=1000)
+
+        key = ["asset", "side", "timestamp"]
+        merged = res.merge(res_streaming, on=key, how="outer",
+                           suffixes=("", "_streaming"))
+        differ = merged.loc[merged["price"] != merged["price_streaming"]]
+
+        self.assertGreater(len(differ), 0)
+        self.assertSetEqual(set(differ["timestamp"]),
+                            {pd.Timestamp(_MONTHS[2], tz="UTC")})
+
+        # bars with trades on both sides of the end of the month
+        t = pd.Timestamp(_MONTHS[2])
+        five = pd.Timedelta("5T")
+        sides = list()
+        for data_, start_, end_ in [(self.trades[1], t - five, t),
+                                    (self.trades[2], t, t + five)]:
+            t_ = pd.to_datetime(data_["timestamp"])
+            data_ = data_.loc[data_["tradeable"].str.startswith("PI_") &
+                              (t_ >= start_) & (t_ < end_)]
+            sides.append(set(zip(data_["tradeable"], data_["aggressor"])))
+        self.assertEqual(len(differ), len(sides[0] & sides[1]))
+
+
+class TestSpotFromOhlcv(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.environ = mock.patch.dict(os.environ,
+                                       {"PROJECT_ROOT": self.tmp.name})
+        self.environ.start()
+
+        raw = os.path.join(self.tmp.name, "data/raw/spot/kraken")
+        os.makedirs(raw)
+        os.makedirs(os.path.join(self.tmp.name, "data/prepared/spot/kraken"))
+
+        self.bars = dict()
+        for a_ in synthetic.ASSETS:
+            self.bars[a_] = synthetic.make_ohlcvt(a_, "2021-01", 2000)
+            synthetic.write_ohlcvt(raw, a_, self.bars[a_])
+
+    def tearDown(self):
+        self.environ.stop()
+        self.tmp.cleanup()
+
+    def save(self, **kwargs) -> pd.DataFrame:
+        upstream.save_spot_from_ohlcv(**kwargs)
+
+        return downstream._read_prepared("spot", "spot-close-kraken")
+
+    def test_concurrent(self):
+        """Currencies read from the archives in a pool give the bars of
+        the 1-minute closes, the same as read in turn."""
+        res = self.save(n_jobs=1)
+        assert_frame_equal(self.save(n_jobs=2), res)
+
+        for a_, bars_ in self.bars.items():
+            bars_ = bars_.assign(timestamp=pd.to_datetime(
+                bars_["timestamp"], unit="s", utc=True
+            ))
+            expected = aggregate_data(bars_, agg_freq="10T",
+                                      offset_freq="5T",
+                                      datetime_col="timestamp",
+                                      objective_col="close",
+                                      weight_col="volume")
+            res_ = res.loc[res["asset"] == a_].reset_index(drop=True)
+            assert_frame_equal(res_[["timestamp", "close"]], expected,
+                               check_dtype=False)
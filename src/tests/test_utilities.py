@@ -0,0 +1,246 @@
+import os
+import pickle
+import tempfile
+import threading
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from src.datafeed_.utilities import (aggregate_data, _aggregate_data_groupby,
+                                     aggregate_chunks, pivot, pack_keys,
+                                     drop_duplicates_max,
+                                     StreamingDeduplicator, LazyMemory,
+                                     imap_ordered)
+
+
+def _random_trades(n, tz="UTC", seed=0) -> pd.DataFrame:
+    """Trades at random times over 3 days, with some NaNs sprinkled in."""
+    rng = np.random.default_rng(seed)
+
+    timestamp = pd.Timestamp("2021-01-01 13:17") + \
+        pd.to_timedelta(rng.integers(0, 3 * 86400 * 10**9, n), unit="ns")
+    timestamp = pd.Series(timestamp)
+    if tz is not None:
+        timestamp = timestamp.dt.tz_localize(tz)
+
+    res = pd.DataFrame({
+        "timestamp": timestamp,
+        "price": rng.normal(100, 1, n),
+        "size": rng.exponential(1, n),
+        "tradeable": rng.choice(["PI_XBTUSD", "PI_ETHUSD", None], n),
+        "aggressor": rng.choice(["buyer", "seller"], n)
+    })
+    res.loc[rng.random(n) < 0.01, "price"] = np.nan
+    res.loc[rng.random(n) < 0.01, "size"] = np.nan
+    res.loc[rng.random(n) < 0.01, "timestamp"] = pd.NaT
+
+    return res
+
+
+class TestAggregateData(TestCase):
+    def test_same_as_groupby(self):
+        """Bar kernel reproduces the groupby-based aggregation."""
+        kwargs = dict(datetime_col="timestamp", objective_col="price",
+                      weight_col="size", return_stats=True)
+
+        for tz in ["UTC", None]:
+            data = _random_trades(10000, tz=tz)
+            data_cat = data.assign(
+                aggressor=data["aggressor"].astype("category")
+            )
+            for other_cols in [None, ["aggressor"],
+                               ["tradeable", "aggressor"]]:
+                for freq in ["10T", "7T", "1H"]:
+                    for d_ in [data, data_cat]:
+                        res = aggregate_data(d_, freq, "5T",
+                                             other_cols=other_cols, **kwargs)
+                        expected = _aggregate_data_groupby(
+                            d_, freq, "5T", other_cols=other_cols, **kwargs
+                        )
+                        assert_frame_equal(res, expected)
+
+    def test_labels(self):
+        """Bars are labeled right, with timestamps shifted by the offset."""
+        data = pd.DataFrame({
+            "timestamp": pd.to_datetime(["2021-01-01 00:04:59",
+                                         "2021-01-01 00:05:00"], utc=True),
+            "price": [1.0, 3.0],
+            "size": [1.0, 1.0]
+        })
+        res = aggregate_data(data, "10T", "5T", "timestamp", "price", "size")
+
+        self.assertListEqual(
+            res["timestamp"].tolist(),
+            list(pd.to_datetime(["2021-01-01 00:00", "2021-01-01 00:10"],
+                                utc=True))
+        )
+        self.assertListEqual(res["price"].tolist(), [1.0, 3.0])
+
+
+class TestAggregateChunks(TestCase):
+    def test_same_as_in_full(self):
+        """Chunked aggregation returns the bars of the whole data, gaps
+        between chunks included."""
+        kwargs = dict(agg_freq="10T", offset_freq="5T",
+                      datetime_col="timestamp", objective_col="price",
+                      weight_col="size")
+
+        # sparse enough for bars without trades
+        data = _random_trades(300).sort_values("timestamp", kind="stable")\
+            .reset_index(drop=True)
+        data_cat = data.assign(
+            aggressor=data["aggressor"].astype("category")
+        )
+        bounds = [0, 1, 2, 50, 51, 170, 299, 300]
+
+        for other_cols in [None, ["aggressor"], ["tradeable", "aggressor"]]:
+            for d_ in [data, data_cat]:
+                chunks = (d_.iloc[a_:b_] for a_, b_ in
+                          zip(bounds[:-1], bounds[1:]))
+                res = aggregate_chunks(chunks, other_cols=other_cols,
+                                       **kwargs)
+                expected = aggregate_data(d_, other_cols=other_cols,
+                                          **kwargs)
+                assert_frame_equal(res, expected)
+
+
+class TestPivot(TestCase):
+    def test_same_as_pandas(self):
+        """Pivot on codes equals `DataFrame.pivot`, categoricals or not."""
+        data = _random_trades(1000).dropna(subset=["timestamp", "tradeable"])\
+            .drop_duplicates(subset=["timestamp", "tradeable", "aggressor"])
+        cols = ["tradeable", "aggressor"]
+
+        # pandas does not always sort several levels of columns
+        expected = data.pivot(index="timestamp", columns=cols,
+                              values="price").sort_index(axis=1)
+        assert_frame_equal(pivot(data, "timestamp", cols, "price"), expected)
+
+        # categories in no particular order, some unobserved
+        data_cat = data.astype({
+            "tradeable": pd.CategoricalDtype(["PI_XBTUSD", "PI_LTCUSD",
+                                              "PI_ETHUSD"]),
+            "aggressor": "category"
+        })
+        assert_frame_equal(pivot(data_cat, "timestamp", cols, "price"),
+                           expected)
+
+        with self.assertRaises(ValueError):
+            pivot(pd.concat((data, data)), "timestamp", cols, "price")
+
+
+def _duplicated_trades(n, seed=0) -> pd.DataFrame:
+    """Trades in time order, many of them sharing a millisecond."""
+    rng = np.random.default_rng(seed)
+
+    return pd.DataFrame({
+        "timestamp": pd.to_datetime(
+            np.sort(rng.integers(0, n // 3, n)) * 10 ** 6, utc=True
+        ),
+        "tradeable": rng.choice(["PI_XBTUSD", "PI_ETHUSD"], n),
+        "aggressor": rng.choice(["buyer", "seller"], n),
+        "size": rng.integers(1, 4, n),
+        "price": rng.normal(100, 1, n),
+    })
+
+
+class TestDropDuplicates(TestCase):
+    subset = ["timestamp", "tradeable", "aggressor"]
+
+    def test_same_as_sort(self):
+        """The largest of duplicates is kept, the last of equally large."""
+        data = _duplicated_trades(5000)
+        expected = data\
+            .sort_values(self.subset + ["size"], kind="mergesort")\
+            .drop_duplicates(self.subset, keep="last").sort_index()
+
+        res = drop_duplicates_max(data, self.subset, "size")
+        self.assertLess(len(res), 0.8 * len(data))
+        assert_frame_equal(res, expected)
+
+        # missing values count as the largest
+        data = pd.DataFrame({"k": [1, 1, 1, 2], "v": [3.0, np.nan, 1.0, 2.0]})
+        res = drop_duplicates_max(data, ["k"], "v")
+        self.assertListEqual(res.index.tolist(), [1, 3])
+
+    def test_pack_keys(self):
+        """Keys do not overflow for columns of wide ranges."""
+        data = pd.DataFrame({
+            "a": [np.iinfo(np.int64).min, 0, np.iinfo(np.int64).max, 0],
+            "b": pd.to_datetime([0, 10 ** 18, 0, 10 ** 18], utc=True),
+            "c": ["x", None, "x", None],
+        })
+        key = pack_keys(data, ["a", "b", "c"])
+        self.assertEqual(len(set(key)), 3)
+        self.assertEqual(key[1], key[3])
+
+    def test_streaming(self):
+        """Chunks give the result of the whole, duplicates straddling them
+        included."""
+        data = _duplicated_trades(5000)
+        expected = drop_duplicates_max(data, self.subset, "size")
+
+        dedup = StreamingDeduplicator(self.subset, "size", window="1s")
+        res = [dedup.push(c_) for c_ in np.array_split(data, 7)]
+        assert_frame_equal(pd.concat(res + [dedup.flush()]), expected)
+        self.assertEqual(dedup.n_late, 0)
+
+        # rows older than the window come too late
+        dedup = StreamingDeduplicator(self.subset, "size", window="1ms")
+        dedup.push(data.iloc[1000:2000])
+        dedup.push(data.iloc[:10])
+        self.assertEqual(dedup.n_late, 10)
+
+
+def _square(x):
+    return x ** 2
+
+
+class TestLazyMemory(TestCase):
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            memory = LazyMemory(tmp, verbose=0)
+            square = memory.cache(_square)
+            self.assertEqual(square.__name__, "_square")
+            self.assertListEqual(os.listdir(tmp), [])
+
+            self.assertEqual(square(3), 9)
+            self.assertTrue(square.check_call_in_cache(3))
+
+            # as sent to a process pool
+            square = pickle.loads(pickle.dumps(square))
+            self.assertTrue(square.check_call_in_cache(3))
+
+            memory.clear(warn=False)
+            self.assertFalse(square.check_call_in_cache(3))
+
+    def test_location(self):
+        """A cache located by a function follows it."""
+        with tempfile.TemporaryDirectory() as tmp:
+            location = [os.path.join(tmp, "a")]
+            memory = LazyMemory(lambda: location[0], verbose=0)
+            square = memory.cache(_square)
+
+            square(3)
+            self.assertListEqual(os.listdir(tmp), ["a"])
+
+            location[0] = os.path.join(tmp, "b")
+            self.assertFalse(square.check_call_in_cache(3))
+            square(3)
+            self.assertListEqual(sorted(os.listdir(tmp)), ["a", "b"])
+
+
+class TestImapOrdered(TestCase):
+    def test_processes_from_thread(self):
+        """A process pool started off the main thread, as in a pipeline
+        stage, is not forked."""
+        res = list()
+        thread = threading.Thread(target=lambda: res.extend(
+            imap_ordered(_square, range(6), n_jobs=2)
+        ))
+        thread.start()
+        thread.join()
+
+        self.assertListEqual(res, [x_ ** 2 for x_ in range(6)])
@@ -0,0 +1,80 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import numpy as np
+import pandas as pd
+
+from src.datafeed_ import venues
+from src.datafeed_.binance import upstream as binance
+from src.datafeed_.okex import upstream as okex
+from src.datafeed_.storage import write_partitions
+
+
+class TestVenues(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.environ = mock.patch.dict(os.environ,
+                                       {"PROJECT_ROOT": self.tmp.name})
+        self.environ.start()
+
+        # binance 1-min spot klines, the close being the minutes since
+        # 2021-01-01 at the end of the bar
+        t = pd.date_range("2021-01-01", "2021-01-02", freq="T",
+                          inclusive="left")
+        close = np.arange(1, len(t) + 1, dtype=np.float32)
+        klines = pd.DataFrame({"close": close,
+                               "timestamp_close": t + pd.Timedelta("59999ms")},
+                              index=pd.Index(t, name="timestamp_open"))
+        binance._write_klines(klines, "BTCUSDT", "1m")
+
+        # okex hourly perpetual klines, with 6 hours missing
+        t = pd.date_range("2021-01-01", "2021-01-02", freq="H", tz="UTC",
+                          inclusive="left")
+        t = t[(t.hour < 10) | (t.hour >= 16)]
+        write_partitions(pd.DataFrame({
+            "asset": "btc", "timestamp": t,
+            "close": (t - t[0]) / pd.Timedelta("1T") + 60,
+        }), okex.perpetual_path())
+
+    def tearDown(self):
+        self.environ.stop()
+        self.tmp.cleanup()
+
+    def test_build_panel(self):
+        """Bars are aligned by their close, stale ones dropped."""
+        res = venues.build_panel(
+            [("binance", "xbt", "spot", "close"),
+             ("okex", "xbt", "perpetual", "close")],
+            freq="1H", start="2021-01-01 01:00", end="2021-01-01 23:00",
+            max_staleness={("okex", "xbt", "perpetual", "close"): "2H"}
+        )
+        self.assertListEqual(list(res.columns.names), venues.LEVELS)
+        self.assertEqual(res.shape, (23, 2))
+
+        res = res.to_frame()
+        minutes = (res.index - res.index[0]) / pd.Timedelta("1T") + 60
+        np.testing.assert_array_equal(res.iloc[:, 0].values, minutes)
+
+        okx = res[("okex", "xbt", "perpetual", "close")]
+        np.testing.assert_array_equal(okx.loc[:"2021-01-01 10:00"].values,
+                                      minutes[:10])
+        self.assertEqual(okx.loc["2021-01-01 11:00"], minutes[9])
+        self.assertTrue(okx.loc["2021-01-01 12:00":"2021-01-01 16:00"]
+                        .isnull().all())
+        self.assertTrue(okx.loc["2021-01-01 17:00":].notnull().all())
+
+    def test_partial_dates(self):
+        """A month for `end` is the grid through the end of that month."""
+        res = venues.build_panel([("binance", "xbt", "spot", "close")],
+                                 freq="1H", start="2021-01", end="2021-01")
+        self.assertEqual(res.shape, (24 * 31, 1))
+        self.assertEqual(res.index[-1],
+                         pd.Timestamp("2021-01-31 23:00", tz="UTC"))
+        self.assertEqual(res.to_frame().iloc[23, 0], 23 * 60)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            venues.load("okex", "xbt", "spot", "close")
+        with self.assertRaises(ValueError):
+            venues.load("bitmex", "xbt", "perpetual", "close")